@@ -0,0 +1,34 @@
+# gunicorn.conf.py
+"""
+Configuration gunicorn livrée avec l'application (Procfile: gunicorn -c gunicorn.conf.py).
+- SERVER_MODE=wsgi (défaut): workers gthread, WEB_CONCURRENCY x GUNICORN_THREADS requêtes
+  simultanées; l'API DRF, GraphQL et l'admin sont sync, c'est le mode qui leur convient
+- SERVER_MODE=asgi (optionnel): workers uvicorn; seules les vues async (/api/async/...) en
+  profitent, les vues sync passent par un seul thread par requête (sync_to_async) et les
+  connexions DB ne sont pas persistantes (voir settings.py)
+Réglé pour les petites instances Render (0.5 CPU / 512 Mo): 2 workers par défaut.
+"""
+import os
+
+mode = os.getenv("SERVER_MODE", "wsgi").lower()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+if mode == "asgi":
+    wsgi_app = "inf37407.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "inf37407.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# recyclage des workers (fuites mémoire), décalé pour ne pas tous redémarrer ensemble
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = 100
+# Django est chargé une fois dans le maître puis partagé (copy-on-write) par les workers;
+# aucune connexion DB n'est ouverte au chargement
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
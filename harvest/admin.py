@@ -3,12 +3,26 @@ from django.contrib import admin
 # Register your models here.
 from django.contrib import admin
 from .models import Source, Dataset, Resource, Tag, HarvestJob
+from .services.jobs import enqueue
 
 @admin.register(Source)
 class SourceAdmin(admin.ModelAdmin):
     list_display = ("name", "base_url", "active")
     search_fields = ("name",)
     list_filter = ("active",)
+    actions = ["enqueue_harvest", "enqueue_incremental_harvest"]
+
+    @admin.action(description="Mettre en file un moissonnage (harvest_worker)")
+    def enqueue_harvest(self, request, queryset):
+        for src in queryset:
+            enqueue(src)
+        self.message_user(request, f"{queryset.count()} moissonnage(s) mis en file.")
+
+    @admin.action(description="Mettre en file un moissonnage incrémental")
+    def enqueue_incremental_harvest(self, request, queryset):
+        for src in queryset:
+            enqueue(src, incremental=True)
+        self.message_user(request, f"{queryset.count()} moissonnage(s) incrémental(aux) mis en file.")
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -18,6 +32,7 @@ class TagAdmin(admin.ModelAdmin):
 class ResourceInline(admin.TabularInline):
     model = Resource
     extra = 0
+    readonly_fields = ("link_status", "link_size", "link_type", "link_error", "link_checked_at")
 
 @admin.register(Dataset)
 class DatasetAdmin(admin.ModelAdmin):
@@ -29,6 +44,7 @@ class DatasetAdmin(admin.ModelAdmin):
 
 @admin.register(HarvestJob)
 class HarvestJobAdmin(admin.ModelAdmin):
-    list_display = ("source", "status", "started_at", "ended_at", "found", "imported")
+    list_display = ("source", "status", "started_at", "ended_at", "found", "imported", "created", "updated", "skipped",
+                    "deleted", "worker", "heartbeat_at")
     list_filter = ("source", "status")
     search_fields = ("query",)
@@ -0,0 +1,148 @@
+# harvest/analytics.py
+"""
+Instantané analytique du catalogue, hors de la base transactionnelle.
+- build_snapshot(): matérialise des cubes pré-agrégés dans un fichier SQLite local
+  (HARVEST_ANALYTICS_PATH), écrit à côté puis remplacé atomiquement
+    dataset_cube (source, org, license, month)          -> datasets
+    resource_cube (source, org, format, month)          -> resources, datasets, bytes, sized
+    tag_cube (tag)                                      -> datasets
+  month = mois de Dataset.last_modified ("YYYY-MM", "" si inconnu)
+  resource_cube.datasets = datasets ayant au moins une ressource du format: un dataset compte
+  dans chacun de ses formats, la somme n'a donc de sens qu'à format fixé (groupé ou filtré);
+  sinon, lire dataset_cube.datasets
+- aggregate(): SUM des mesures d'un cube, groupées par dimensions, avec filtres d'égalité.
+  Les cubes comptent quelques milliers de lignes même pour 1M de ressources:
+  les agrégats se lisent en millisecondes sans toucher Dataset/Resource.
+"""
+import os
+import sqlite3
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Dataset, Resource
+
+CUBES = {
+    "dataset_cube": {"dimensions": ("source", "org", "license", "month"), "measures": ("datasets",)},
+    "resource_cube": {"dimensions": ("source", "org", "format", "month"),
+                      "measures": ("resources", "datasets", "bytes", "sized"),
+                      # mesure -> dimension à fixer pour que SUM soit juste (compte distinct)
+                      "distinct": {"datasets": "format"}},
+    "tag_cube": {"dimensions": ("tag",), "measures": ("datasets",)},
+}
+
+
+def snapshot_path():
+    return str(getattr(settings, "HARVEST_ANALYTICS_PATH", settings.BASE_DIR / "analytics.sqlite3"))
+
+
+def _month(value):
+    return value.strftime("%Y-%m") if value else ""
+
+
+def _cube_rows():
+    """Les trois cubes, agrégés par la base source en une requête GROUP BY chacun."""
+    month = TruncMonth("last_modified")
+    yield "dataset_cube", (
+        (row["source__name"], row["org"], row["license"], _month(row["month"]), row["n"])
+        for row in Dataset.objects.annotate(month=month).values("source__name", "org", "license", "month")
+        .annotate(n=Count("id")).order_by().iterator()
+    )
+    yield "resource_cube", (
+        (row["dataset__source__name"], row["dataset__org"], row["format"], _month(row["month"]),
+         row["n"], row["datasets"], row["bytes"] or 0, row["sized"])
+        for row in Resource.objects.annotate(month=TruncMonth("dataset__last_modified"))
+        .values("dataset__source__name", "dataset__org", "format", "month")
+        .annotate(n=Count("id"), datasets=Count("dataset_id", distinct=True), bytes=Sum("size"), sized=Count("size"))
+        .order_by().iterator()
+    )
+    yield "tag_cube", (
+        (row["tag__name"], row["n"])
+        for row in Dataset.tags.through.objects.values("tag__name").annotate(n=Count("dataset_id")).order_by().iterator()
+    )
+
+
+def build_snapshot(path=None):
+    """(Re)construit l'instantané; rend {cube: nb de lignes}."""
+    path = path or snapshot_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    counts = {}
+    conn = sqlite3.connect(tmp)
+    try:
+        for name, spec in CUBES.items():
+            cols = spec["dimensions"] + spec["measures"]
+            conn.execute(f"CREATE TABLE {name} ({', '.join(cols)})")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        for name, rows in _cube_rows():
+            width = len(CUBES[name]["dimensions"]) + len(CUBES[name]["measures"])
+            cur = conn.executemany(f"INSERT INTO {name} VALUES ({', '.join('?' * width)})", rows)
+            counts[name] = cur.rowcount
+        conn.execute("INSERT INTO meta VALUES ('built_at', ?)", (timezone.now().isoformat(),))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)  # les lecteurs voient l'ancien ou le nouveau fichier, jamais un fichier partiel
+    return counts
+
+
+def _connect(path=None):
+    path = path or snapshot_path()
+    if not os.path.exists(path):
+        return None
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def built_at(path=None):
+    """Date de construction de l'instantané (chaîne ISO), None s'il n'existe pas."""
+    conn = _connect(path)
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def aggregate(cube, measures, by=(), where=None, order_by=None, limit=None, path=None):
+    """
+    SUM(`measures`) du `cube` groupé par les dimensions `by`, filtré par `where` ({dimension: valeur}).
+    Tri par défaut: première mesure décroissante. Rend une liste de dicts ([] si pas d'instantané).
+    ex: aggregate("resource_cube", ["bytes"], by=["source"])
+        aggregate("resource_cube", ["resources"], by=["org", "format"], where={"source": "CanWin"})
+    """
+    spec = CUBES[cube]
+    measures = [measures] if isinstance(measures, str) else list(measures)
+    by, where = list(by), where or {}
+    unknown = (set(by) | set(where)) - set(spec["dimensions"]) | set(measures) - set(spec["measures"])
+    if unknown:
+        raise ValueError(f"{cube}: colonnes inconnues {sorted(unknown)}")
+    for measure, dim in spec.get("distinct", {}).items():
+        if measure in measures and dim not in by and dim not in where:
+            raise ValueError(f"{cube}: {measure} ne s'additionne pas entre valeurs de {dim} "
+                             f"(grouper ou filtrer par {dim}, ou lire dataset_cube)")
+    conn = _connect(path)
+    if conn is None:
+        return []
+    select = by + [f"SUM({m}) AS {m}" for m in measures]
+    sql = f"SELECT {', '.join(select)} FROM {cube}"
+    if where:
+        sql += " WHERE " + " AND ".join(f"{dim} = ?" for dim in where)
+    if by:
+        sql += f" GROUP BY {', '.join(by)}"
+    order = order_by or f"-{measures[0]}"
+    column = order.lstrip("-")
+    if column not in by + measures:
+        raise ValueError(f"{cube}: tri inconnu {order!r}")
+    sql += f" ORDER BY {column} {'DESC' if order.startswith('-') else 'ASC'}"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    try:
+        rows = conn.execute(sql, list(where.values())).fetchall()
+    finally:
+        conn.close()
+    names = by + measures
+    return [dict(zip(names, row)) for row in rows]
@@ -0,0 +1,154 @@
+# harvest/cache.py
+"""
+Cache des API de lecture (REST datasets + GraphQL), invalidé par les moissonnages.
+- Les clés incluent une "version des données" = dernière écriture locale: fin du dernier
+  job terminé (réussi ou non: ses pages sont validées) ou dernière vérification de liens.
+  Chaque écriture la change (bump_data_version), ce qui invalide tout d'un coup.
+- La version est relue en base au plus toutes les VERSION_TTL secondes, pour que les
+  autres processus (worker de moissonnage, autres workers gunicorn) la voient
+  même avec le cache local-mémoire.
+- ETag / Last-Modified (= version des données) permettent des 304; la date de modification
+  annoncée par le portail (Dataset.last_modified) n'est pas celle de notre copie.
+"""
+import datetime
+import hashlib
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from graphene_django.views import GraphQLView
+from rest_framework import status
+from rest_framework.response import Response
+from .models import HarvestJob, Resource
+
+VERSION_KEY = "harvest:data_version"
+VERSION_TTL = 5  # secondes
+
+
+def timeout():
+    return getattr(settings, "HARVEST_CACHE_TIMEOUT", 600)
+
+
+def _db_version():
+    writes = [
+        HarvestJob.objects.filter(ended_at__isnull=False).aggregate(Max("ended_at"))["ended_at__max"],
+        Resource.objects.aggregate(Max("link_checked_at"))["link_checked_at__max"],
+    ]
+    last = max(filter(None, writes), default=None)
+    return str(int(last.timestamp() * 1000)) if last else "0"
+
+
+def data_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = _db_version()
+        cache.set(VERSION_KEY, version, VERSION_TTL)
+    return version
+
+
+async def adata_version():
+    """data_version() pour les vues async (la lecture en base passe par un thread)."""
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        version = await sync_to_async(_db_version)()
+        await cache.aset(VERSION_KEY, version, VERSION_TTL)
+    return version
+
+
+def bump_data_version():
+    """À appeler après une écriture (fin de moissonnage, lot de liens): invalide toutes les réponses en cache."""
+    cache.set(VERSION_KEY, _db_version(), VERSION_TTL)
+
+
+def _key(prefix, version, parts):
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return f"harvest:{prefix}:{version}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def make_key(prefix, *parts):
+    return _key(prefix, data_version(), parts)
+
+
+async def amake_key(prefix, *parts):
+    return _key(prefix, await adata_version(), parts)
+
+
+def last_modified():
+    """Date de la dernière écriture locale (la version des données), None si aucune."""
+    version = int(data_version())
+    return datetime.datetime.fromtimestamp(version / 1000, datetime.timezone.utc) if version else None
+
+
+class CachedReadMixin:
+    """
+    Pour un ReadOnlyModelViewSet: les actions de lecture passent leur handler à
+    self._cached(handler, request, ...), qui met en cache response.data
+    (clé = chemin + paramètres normalisés + version), avec ETag/Last-Modified.
+    Seul le rendu JSON est mis en cache (l'API navigable affiche l'utilisateur).
+    """
+    def _cache_parts(self, request):
+        params = sorted((k, sorted(request.query_params.getlist(k))) for k in request.query_params)
+        return (request.path, params, self.get_format_suffix(**self.kwargs) or "")
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(request, "_harvest_etag", None)
+        if etag and response.status_code in (200, 304):
+            response["ETag"] = etag
+            modified = last_modified()
+            if modified:
+                response["Last-Modified"] = http_date(modified.timestamp())
+            response["Cache-Control"] = "private, no-cache"  # toujours revalider (304 si inchangé)
+        return response
+
+    def _not_modified(self, request, etag):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            return etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+        since = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+        modified = last_modified()
+        return bool(since and modified and int(modified.timestamp()) <= since)
+
+    def _cached(self, handler, request, *args, **kwargs):
+        renderer = getattr(request, "accepted_renderer", None)
+        if request.method != "GET" or renderer is None or renderer.format != "json":
+            return handler(request, *args, **kwargs)
+        key = make_key("api", *self._cache_parts(request))
+        etag = quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+        request._harvest_etag = etag
+        if self._not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, timeout())
+            return response
+        return Response(data)
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQLView dont les réponses 200 sont mises en cache (clé = requête + variables + version).
+    Une réponse 200 avec "errors" (erreur de résolution partielle) n'est pas mise en cache.
+    """
+    def execute_graphql_request(self, request, *args, **kwargs):
+        result = super().execute_graphql_request(request, *args, **kwargs)
+        request._harvest_graphql_errors = bool(result is None or result.errors)
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        if show_graphiql:
+            return super().get_response(request, data, show_graphiql)
+        query, variables, operation_name, _id = self.get_graphql_params(request, data)
+        key = make_key("graphql", query, variables, operation_name)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+        result, status_code = super().get_response(request, data, show_graphiql)
+        if status_code == 200 and not getattr(request, "_harvest_graphql_errors", True):
+            cache.set(key, (result, status_code), timeout())
+        return result, status_code
@@ -0,0 +1,140 @@
+# harvest/export.py
+"""
+Export en flux du catalogue (endpoint /api/datasets/export/ + commande export_catalogue).
+- Dataset parcouru avec .iterator(chunk_size): prefetch tags/ressources par lot,
+  mémoire constante quelle que soit la taille de l'export
+- NDJSON (un dataset par ligne) ou CSV (une ligne par dataset, tags/formats joints par "|")
+- Parquet en sortie fichier seulement, si pyarrow est installé (écrit par lots)
+- astream(): même flux pour un serveur ASGI (itérateur async, lignes lues par blocs)
+"""
+import csv
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from rest_framework import renderers
+from .models import Resource
+
+CHUNK_SIZE = 500
+FORMATS = ("ndjson", "csv", "parquet")
+DATASET_FIELDS = ["id", "source", "ckan_id", "name", "title", "notes", "org", "license",
+                  "spatial", "temporal_start", "temporal_end", "last_modified", "url"]
+RESOURCE_FIELDS = ["id", "name", "format", "url", "last_modified", "size"]
+CSV_COLUMNS = DATASET_FIELDS + ["tags", "formats", "resource_count"]
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # dépendance optionnelle (sortie Parquet)
+    pyarrow = None
+
+
+def iter_records(qs, chunk_size=CHUNK_SIZE):
+    """Datasets de `qs` -> dicts (source = nom, tags = noms, ressources imbriquées), lot par lot."""
+    qs = (qs.select_related("source")
+          .prefetch_related("tags", Prefetch("resources", queryset=Resource.objects.order_by("id"))))
+    for ds in qs.iterator(chunk_size=chunk_size):
+        record = {name: ds.source.name if name == "source" else getattr(ds, name) for name in DATASET_FIELDS}
+        record["tags"] = sorted(t.name for t in ds.tags.all())
+        record["resources"] = [{name: getattr(r, name) for name in RESOURCE_FIELDS}
+                               for r in ds.resources.all()]
+        yield record
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer: write() rend la ligne au lieu de la stocker."""
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def csv_lines(records):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in records:
+        resources = record["resources"]
+        row = [_csv_value(record[name]) for name in DATASET_FIELDS]
+        row += ["|".join(record["tags"]),
+                "|".join(sorted({r["format"] for r in resources if r["format"]})),
+                len(resources)]
+        yield writer.writerow(row)
+
+
+def stream(qs, fmt="ndjson", chunk_size=CHUNK_SIZE):
+    """Générateur de lignes texte (NDJSON ou CSV) pour `qs`."""
+    records = iter_records(qs, chunk_size)
+    return csv_lines(records) if fmt == "csv" else ndjson_lines(records)
+
+
+async def astream(qs, fmt="ndjson", chunk_size=CHUNK_SIZE):
+    """
+    Variante async de stream() pour ASGI: Django lirait un itérateur sync en entier
+    (sync_to_async(list)) avant d'envoyer le premier octet. Les lignes sont produites par
+    blocs de `chunk_size` dans le thread de la requête (curseur DB compris).
+    """
+    lines = stream(qs, fmt, chunk_size)
+    read = sync_to_async(lambda: "".join(islice(lines, chunk_size)), thread_sensitive=True)
+    try:
+        while block := await read():
+            yield block
+    finally:
+        await sync_to_async(lines.close, thread_sensitive=True)()
+
+
+def _parquet_schema():
+    pa = pyarrow
+    resource = pa.struct([("id", pa.int64()), ("name", pa.string()), ("format", pa.string()),
+                          ("url", pa.string()), ("last_modified", pa.timestamp("us", tz="UTC")),
+                          ("size", pa.int64())])
+    return pa.schema([
+        ("id", pa.int64()), ("source", pa.string()), ("ckan_id", pa.string()), ("name", pa.string()),
+        ("title", pa.string()), ("notes", pa.string()), ("org", pa.string()), ("license", pa.string()),
+        ("spatial", pa.string()), ("temporal_start", pa.date32()), ("temporal_end", pa.date32()),
+        ("last_modified", pa.timestamp("us", tz="UTC")), ("url", pa.string()),
+        ("tags", pa.list_(pa.string())), ("resources", pa.list_(resource)),
+    ])
+
+
+def write_parquet(qs, path, chunk_size=CHUNK_SIZE):
+    """Écrit `qs` dans le fichier Parquet `path` par lots de `chunk_size` (row groups). Rend le nb de datasets."""
+    if pyarrow is None:
+        raise RuntimeError("Export Parquet indisponible: installer pyarrow (pip install pyarrow).")
+    schema = _parquet_schema()
+    count = 0
+    batch = []
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for record in iter_records(qs, chunk_size):
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """Négociation ?format=ndjson / Accept; ne rend que les réponses d'erreur (l'export est en flux)."""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = "text/csv"
+    format = "csv"
@@ -0,0 +1,94 @@
+import datetime
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from .models import Dataset, Resource
+from .search import search_datasets
+
+FILTER_PARAMS = ("source", "org", "license", "res_format", "tag", "modified_after", "modified_before")
+FACET_LIMIT = 10
+
+def parse_when(value):
+    """
+    'YYYY-MM-DD' ou datetime ISO -> datetime avec fuseau (ValueError si illisible).
+    Une date seule vaut minuit; sans fuseau explicite, c'est celui du site (TIME_ZONE).
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"date invalide: {value!r}")
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def filter_params(params):
+    """QueryDict (?source=&org=…) -> kwargs de filter_datasets, dates analysées (ValueError si illisible)."""
+    values = {name: params.get(name) or None for name in FILTER_PARAMS}
+    for name in ("modified_after", "modified_before"):
+        if values[name]:
+            values[name] = parse_when(values[name])
+    return values
+
+def filter_datasets(qs, source=None, org=None, license=None, res_format=None, tag=None,
+                    modified_after=None, modified_before=None):
+    """
+    Filtres à facettes partagés par REST et GraphQL. Les filtres sur ressources/tags
+    passent par des sous-requêtes (id__in) pour ne pas dupliquer les datasets.
+    (res_format et non format: ?format= est réservé par DRF au choix du rendu)
+    """
+    if source:
+        qs = qs.filter(source_id=source) if str(source).isdigit() else qs.filter(source__name=source)
+    if org:
+        qs = qs.filter(org=org)
+    if license:
+        qs = qs.filter(license=license)
+    if res_format:
+        qs = qs.filter(id__in=Resource.objects.filter(format=res_format.upper()).values("dataset_id"))
+    if tag:
+        qs = qs.filter(id__in=Dataset.tags.through.objects.filter(tag__name=tag).values("dataset_id"))
+    if modified_after:
+        qs = qs.filter(last_modified__gte=modified_after)
+    if modified_before:
+        qs = qs.filter(last_modified__lt=modified_before)
+    return qs
+
+def facet_counts(qs, limit=FACET_LIMIT):
+    """Top-`limit` valeurs (avec nb de datasets) par facette, pour les datasets de `qs`."""
+    ids = qs.order_by().values("id")
+    base = Dataset.objects.filter(id__in=ids)
+    facets = {
+        "source": (base, "source__name", Count("id")),
+        "org": (base.exclude(org=""), "org", Count("id")),
+        "license": (base.exclude(license=""), "license", Count("id")),
+        "format": (Resource.objects.filter(dataset_id__in=ids).exclude(format=""), "format",
+                   Count("dataset_id", distinct=True)),
+        "tag": (Dataset.tags.through.objects.filter(dataset_id__in=ids), "tag__name", Count("dataset_id")),
+    }
+    return {
+        name: [
+            {"value": row[field], "count": row["count"]}
+            for row in q.values(field).annotate(count=count).order_by("-count", field)[:limit]
+        ]
+        for name, (q, field, count) in facets.items()
+    }
+
+class DatasetSearchFilter(filters.SearchFilter):
+    """?search= sur l'index plein texte (harvest/search.py), résultats classés par pertinence."""
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "").strip()
+        if not text:
+            return queryset
+        return search_datasets(queryset, text)
+
+class DatasetFacetFilter(filters.BaseFilterBackend):
+    """?source=&org=&license=&res_format=&tag=&modified_after=&modified_before= (voir filter_datasets)."""
+    def filter_queryset(self, request, queryset, view):
+        try:
+            params = filter_params(request.query_params)
+        except ValueError as e:
+            raise ValidationError({"detail": str(e)})
+        return filter_datasets(queryset, **params)
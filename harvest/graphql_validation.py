@@ -0,0 +1,62 @@
+# harvest/graphql_validation.py
+"""
+Limites appliquées aux requêtes GraphQL avant exécution:
+- profondeur maximale (graphene depth_limit_validator)
+- coût estimé: chaque champ coûte 1 x le nombre d'éléments des listes qui l'englobent
+  (first pour les connexions, LIST_SIZE pour tags/resources)
+"""
+from graphql import GraphQLError, ValidationRule
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode, IntValueNode
+from graphene.validation import depth_limit_validator
+
+MAX_DEPTH = 8
+MAX_COST = 20_000
+DEFAULT_FIRST = 20
+MAX_FIRST = 100
+LIST_SIZE = {"tags": 20, "resources": 20}   # taille supposée des listes imbriquées
+CONNECTIONS = {"datasets"}                  # champs paginés par first/last
+
+
+def _page_size(field):
+    for arg in field.arguments:
+        if arg.name.value in ("first", "last"):
+            if isinstance(arg.value, IntValueNode):
+                return min(int(arg.value.value), MAX_FIRST)
+            return MAX_FIRST  # variable: on suppose le pire
+    return DEFAULT_FIRST
+
+
+class QueryCostRule(ValidationRule):
+    def enter_operation_definition(self, node, *_args):
+        fragments = {f.name.value: f for f in self.context.document.definitions
+                     if f.kind == "fragment_definition"}
+        cost = self._cost(node.selection_set, 1, fragments, set())
+        if cost > MAX_COST:
+            self.report_error(GraphQLError(
+                f"Requête trop coûteuse: coût estimé {cost} > {MAX_COST} (réduire first ou les listes imbriquées).",
+                node,
+            ))
+
+    def _cost(self, selection_set, multiplier, fragments, seen):
+        total = 0
+        for sel in selection_set.selections if selection_set else []:
+            if isinstance(sel, FieldNode):
+                total += multiplier
+                name = sel.name.value
+                if name in CONNECTIONS:
+                    inner = multiplier * _page_size(sel)
+                elif name in LIST_SIZE:
+                    inner = multiplier * LIST_SIZE[name]
+                else:
+                    inner = multiplier
+                total += self._cost(sel.selection_set, inner, fragments, seen)
+            elif isinstance(sel, InlineFragmentNode):
+                total += self._cost(sel.selection_set, multiplier, fragments, seen)
+            elif isinstance(sel, FragmentSpreadNode) and sel.name.value not in seen:
+                frag = fragments.get(sel.name.value)
+                if frag is not None:
+                    total += self._cost(frag.selection_set, multiplier, fragments, seen | {sel.name.value})
+        return total
+
+
+VALIDATION_RULES = [depth_limit_validator(max_depth=MAX_DEPTH), QueryCostRule]
@@ -0,0 +1,71 @@
+# harvest/loaders.py
+"""
+Chargement groupé pour GraphQL (équivalent synchrone d'un DataLoader):
+les clés d'une page de datasets sont enregistrées d'avance (prime), puis
+chargées en UNE requête au premier accès; le résultat est mis en cache
+pour la durée de la requête HTTP.
+"""
+from collections import defaultdict
+from .models import Dataset, Resource, Source
+
+
+class BatchLoader:
+    def __init__(self, batch_fn):
+        self.batch_fn = batch_fn  # keys -> {key: value} (toutes les clés présentes)
+        self.pending = set()
+        self.cache = {}
+
+    def prime(self, keys):
+        self.pending.update(k for k in keys if k not in self.cache)
+
+    def load(self, key):
+        if key not in self.cache:
+            self.pending.add(key)
+            keys, self.pending = list(self.pending), set()
+            self.cache.update(self.batch_fn(keys))
+        return self.cache[key]
+
+
+def _load_sources(ids):
+    found = Source.objects.in_bulk(ids)
+    return {i: found.get(i) for i in ids}
+
+
+def _load_tags(dataset_ids):
+    grouped = defaultdict(list)
+    links = (Dataset.tags.through.objects.filter(dataset_id__in=dataset_ids)
+             .select_related("tag").order_by("tag__name"))
+    for link in links:
+        grouped[link.dataset_id].append(link.tag)
+    return {i: grouped[i] for i in dataset_ids}
+
+
+def _load_resources(dataset_ids):
+    grouped = defaultdict(list)
+    for res in Resource.objects.filter(dataset_id__in=dataset_ids).order_by("id"):
+        grouped[res.dataset_id].append(res)
+    return {i: grouped[i] for i in dataset_ids}
+
+
+def get_loaders(context):
+    """Loaders de la requête en cours (attachés à l'objet request, créés au besoin)."""
+    loaders = getattr(context, "_harvest_loaders", None)
+    if loaders is None:
+        loaders = {
+            "source": BatchLoader(_load_sources),
+            "tags": BatchLoader(_load_tags),
+            "resources": BatchLoader(_load_resources),
+        }
+        try:
+            context._harvest_loaders = loaders
+        except AttributeError:  # contexte sans attributs (ex: dict de tests): pas de cache partagé
+            pass
+    return loaders
+
+
+def prime_datasets(context, datasets):
+    """Enregistre une page de datasets pour que source/tags/resources soient chargés en lot."""
+    loaders = get_loaders(context)
+    loaders["source"].prime(ds.source_id for ds in datasets)
+    loaders["tags"].prime(ds.pk for ds in datasets)
+    loaders["resources"].prime(ds.pk for ds in datasets)
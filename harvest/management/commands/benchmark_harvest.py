@@ -0,0 +1,188 @@
+import gc
+import json
+import math
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from harvest.models import Source
+from harvest.services import http
+from harvest.services.ckan_harvester import harvest_ckan, CKAN_PAGE_ROWS_MAX
+from harvest.services.dataverse_harvester import harvest_dataverse, FILES_CONCURRENCY
+from harvest.services.oai_harvester import harvest_oai, METADATA_PREFIXES
+from harvest.services.pipeline import PREFETCH_DEPTH
+from harvest.services.replay import Replayer, SyntheticPortal, FixtureMissing, use_transport
+
+SYNTHETIC_CKAN = "http://ckan.synthetic/api/3/action"
+SYNTHETIC_DATAVERSE = "http://dataverse.synthetic/api"
+# mesures comparées à --baseline: (clé, sens) -1 = plus bas est une régression, +1 = plus haut
+REGRESSION_KEYS = (("packages_per_sec", -1), ("queries_per_package", +1))
+
+
+class _QueryTimer:
+    """execute_wrapper: nb de requêtes SQL et durée cumulée (connexion du thread principal)."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.count += 1
+
+
+class Command(BaseCommand):
+    help = ("Mesure le débit des moissonneurs CKAN/Dataverse/OAI-PMH sans réseau (portail synthétique ou fixtures "
+            "--replay), dans une base de test jetable du SGBD configuré (SQLite, ou Postgres via DATABASE_URL).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--harvester", choices=["ckan", "dataverse", "oai", "all"], default="all")
+        parser.add_argument("--packages", type=int, default=2000, help="Taille du catalogue synthétique")
+        parser.add_argument("--resources", type=int, default=5, help="Ressources par jeu de données")
+        parser.add_argument("--latency", type=float, default=0.0, help="Latence simulée par requête (ms)")
+        parser.add_argument("--rows", type=int, default=500, help=f"CKAN: packages par page (<= {CKAN_PAGE_ROWS_MAX})")
+        parser.add_argument("--per_page", type=int, default=50, help="Dataverse: résultats par page")
+        parser.add_argument("--concurrency", type=int, default=FILES_CONCURRENCY, help="Dataverse: appels 'files' simultanés")
+        parser.add_argument("--prefetch", type=int, default=PREFETCH_DEPTH, help="CKAN/OAI-PMH: pages d'avance")
+        parser.add_argument("--stream", type=int, default=0, metavar="N", help="CKAN: lecture en flux par lots de N")
+        parser.add_argument("--oai-prefix", default="oai_dc", choices=METADATA_PREFIXES, help="OAI-PMH: format")
+        parser.add_argument("--oai-page", type=int, default=100, help="OAI-PMH: enregistrements par réponse (synthétique)")
+        parser.add_argument("--replay", metavar="DIR", help="Rejoue des fixtures (--record) au lieu du portail synthétique")
+        parser.add_argument("--ckan-url", default=SYNTHETIC_CKAN, help="base_url de la source CKAN (doit correspondre aux fixtures)")
+        parser.add_argument("--dataverse-url", default=SYNTHETIC_DATAVERSE, help="base_url de la source Dataverse")
+        parser.add_argument("--max_pages", type=int, default=None, help="Pages par moissonnage (défaut: tout le catalogue)")
+        parser.add_argument("--trace-memory", action="store_true",
+                            help="Pic mémoire Python via tracemalloc (plus précis, mais ralentit la mesure)")
+        parser.add_argument("--json", dest="json_path", metavar="FILE", help="Écrit les résultats en JSON")
+        parser.add_argument("--baseline", metavar="FILE", help="Compare à un JSON précédent; échec si régression")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Écart toléré avec --baseline (0.2 = 20%%)")
+
+    def handle(self, *args, **opts):
+        if opts["replay"]:
+            try:
+                transport = Replayer(opts["replay"])
+            except FixtureMissing as e:
+                raise CommandError(str(e))
+        else:
+            transport = SyntheticPortal(packages=opts["packages"], resources=opts["resources"],
+                                        latency=opts["latency"] / 1000, oai_page=opts["oai_page"])
+        harvesters = ["ckan", "dataverse", "oai"] if opts["harvester"] == "all" else [opts["harvester"]]
+
+        results = []
+        old_name = connection.settings_dict["NAME"]
+        tmpdir = tempfile.mkdtemp(prefix="harvest-bench-")
+        if connection.vendor == "sqlite":
+            # base fichier (et non :memory:) pour des temps d'écriture réalistes
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(self.style.HTTP_INFO(
+                f"Base de test {connection.vendor} ({connection.settings_dict['NAME']}), transport "
+                f"{type(transport).__name__}"))
+            with use_transport(transport):
+                for name in harvesters:
+                    source = self._source(name, opts)
+                    # 1er passage: tout est créé; 2e: catalogue inchangé (chemin 'skipped'/mise à jour)
+                    for run in ("cold", "warm"):
+                        result = self._measure(f"{name}/{run}", lambda: self._harvest(name, source, opts),
+                                               opts["trace_memory"])
+                        results.append(result)
+                        self._report(result)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.isdir(tmpdir) and not os.listdir(tmpdir):
+                os.rmdir(tmpdir)
+
+        if opts["json_path"]:
+            with open(opts["json_path"], "w", encoding="utf-8") as f:
+                json.dump({"vendor": connection.vendor, "results": results}, f, indent=2)
+            self.stdout.write(f"Résultats -> {opts['json_path']}")
+        if opts["baseline"]:
+            self._compare(results, opts["baseline"], opts["tolerance"])
+
+    def _source(self, name, opts):
+        if name == "ckan":
+            return Source.objects.create(name="bench-ckan", base_url=opts["ckan_url"], api_path="/package_search")
+        # OAI: même serveur Dataverse, point d'accès /oai (voir oai_endpoint)
+        return Source.objects.create(name=f"bench-{name}", base_url=opts["dataverse_url"], api_path="/search")
+
+    def _harvest(self, name, source, opts):
+        if name == "ckan":
+            rows = min(max(opts["rows"], 1), CKAN_PAGE_ROWS_MAX)
+            if opts["max_pages"]:
+                return harvest_ckan(source, rows=min(rows, 100), max_pages=opts["max_pages"],
+                                    prefetch_depth=opts["prefetch"], stream_batch=opts["stream"])
+            return harvest_ckan(source, rows=rows, full_sync=True, prefetch_depth=opts["prefetch"],
+                                stream_batch=opts["stream"])
+        if name == "oai":
+            return harvest_oai(source, metadata_prefix=opts["oai_prefix"], max_pages=opts["max_pages"],
+                               prefetch_depth=opts["prefetch"])
+        per_page = max(opts["per_page"], 1)
+        max_pages = opts["max_pages"] or math.ceil(opts["packages"] / per_page)
+        return harvest_dataverse(source, per_page=per_page, max_pages=max_pages, concurrency=opts["concurrency"])
+
+    def _measure(self, label, fn, trace_memory):
+        timer = _QueryTimer()
+        http.metrics.reset()
+        gc.collect()
+        if trace_memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                job = fn()
+        finally:
+            seconds = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+        if job.status != job.S:
+            raise CommandError(f"{label}: job {job.pk} en échec: {job.error[:500]}")
+        hosts = http.metrics.snapshot().values()
+        packages = job.imported or 0
+        return {
+            "run": label,
+            "packages": packages,
+            "seconds": round(seconds, 3),
+            "packages_per_sec": round(packages / seconds, 1) if seconds else 0.0,
+            "queries": timer.count,
+            "queries_per_package": round(timer.count / packages, 2) if packages else 0.0,
+            "db_seconds": round(timer.seconds, 3),
+            "http_requests": sum(m["requests"] for m in hosts),
+            "http_seconds": round(sum(m["seconds"] for m in hosts), 3),
+            "peak_mb": round(peak / 1e6, 1) if peak is not None else None,
+            # ru_maxrss: Ko sous Linux; pic du processus depuis son démarrage
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+
+    def _report(self, r):
+        memory = f"pic {r['peak_mb']} Mo" if r["peak_mb"] is not None else f"maxrss {r['max_rss_mb']} Mo"
+        self.stdout.write(self.style.SUCCESS(
+            f"{r['run']:16} {r['packages']:>7} pkgs  {r['seconds']:>7.2f}s  {r['packages_per_sec']:>8.1f} pkg/s  "
+            f"{r['queries']:>6} req SQL ({r['queries_per_package']}/pkg, {r['db_seconds']:.2f}s DB)  "
+            f"{r['http_requests']} req HTTP ({r['http_seconds']:.2f}s)  {memory}"))
+
+    def _compare(self, results, path, tolerance):
+        with open(path, encoding="utf-8") as f:
+            baseline = {r["run"]: r for r in json.load(f).get("results", [])}
+        regressions = []
+        for r in results:
+            base = baseline.get(r["run"])
+            if not base:
+                continue
+            for key, direction in REGRESSION_KEYS:
+                old, new = base.get(key) or 0, r.get(key) or 0
+                if not old:
+                    continue
+                change = (new - old) / old
+                if change * direction > tolerance:
+                    regressions.append(f"{r['run']} {key}: {old} -> {new} ({change:+.0%})")
+        if regressions:
+            raise CommandError("Régressions de performance:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Aucune régression au-delà de {tolerance:.0%} par rapport à {path}"))
@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from harvest.analytics import build_snapshot, snapshot_path
+
+class Command(BaseCommand):
+    help = "Construit l'instantané analytique du catalogue (cubes pré-agrégés dans un fichier SQLite local)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Fichier de sortie (défaut: settings.HARVEST_ANALYTICS_PATH)")
+
+    def handle(self, *args, **opts):
+        path = opts["path"] or snapshot_path()
+        t0 = time.monotonic()
+        counts = build_snapshot(path)
+        detail = ", ".join(f"{name}={n}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Instantané analytique -> {path} ({detail}) en {time.monotonic() - t0:.2f}s"))
@@ -0,0 +1,64 @@
+import asyncio
+import datetime
+import time
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from harvest.models import Source
+from harvest.services import http
+from harvest.services.linkcheck import check_resources, stale_resources, CONCURRENCY, PER_HOST, TIMEOUT
+from harvest.services.replay import SyntheticLinks
+
+
+class Command(BaseCommand):
+    help = ("Vérifie les liens des ressources (HEAD / GET partiel, asynchrone) et enregistre statut, taille "
+            "et type; seules les ressources jamais vérifiées ou périmées sont relues.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", action="append", default=[],
+                            help="Limiter à cette Source (répétable; défaut: toutes)")
+        parser.add_argument("--max-age", type=float, default=7, help="Âge (jours) au-delà duquel on revérifie")
+        parser.add_argument("--all", action="store_true", help="Revérifie tout, même les liens récents")
+        parser.add_argument("--limit", type=int, default=None, help="Nombre max de ressources vérifiées")
+        parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requêtes simultanées au total")
+        parser.add_argument("--per-host", type=int, default=PER_HOST, help="Requêtes simultanées par hôte")
+        parser.add_argument("--cap", action="append", default=[], metavar="HÔTE=N",
+                            help='Plafond propre à un hôte (ex: "open.canada.ca=8")')
+        parser.add_argument("--timeout", type=float, default=TIMEOUT, help="Délai par requête (s)")
+        parser.add_argument("--synthetic", action="store_true",
+                            help="Répond avec un serveur de fichiers factice au lieu du réseau (essais, mesures)")
+
+    def handle(self, *args, **opts):
+        caps = {}
+        for item in opts["cap"]:
+            host, sep, value = item.rpartition("=")
+            if not sep or not value.isdigit():
+                raise CommandError(f"--cap attend HÔTE=N, reçu: {item!r}")
+            caps[host] = int(value)
+
+        max_age = datetime.timedelta(days=0 if opts["all"] else opts["max_age"])
+        qs = stale_resources(max_age)
+        if opts["source"]:
+            missing = set(opts["source"]) - set(Source.objects.filter(name__in=opts["source"])
+                                                .values_list("name", flat=True))
+            if missing:
+                raise CommandError(f"Sources introuvables: {', '.join(sorted(missing))}")
+            qs = qs.filter(dataset__source__name__in=opts["source"])
+        transport = httpx.MockTransport(SyntheticLinks()) if opts["synthetic"] else None
+
+        t0 = time.perf_counter()
+
+        def progress(stats):
+            if opts["verbosity"] >= 2:
+                self.stdout.write(f"  {stats['checked']} vérifiées ({time.perf_counter() - t0:.1f}s)")
+
+        stats = asyncio.run(check_resources(
+            limit=opts["limit"], concurrency=max(opts["concurrency"], 1), per_host=max(opts["per_host"], 1),
+            caps=caps, timeout=opts["timeout"], transport=transport, queryset=qs, on_batch=progress,
+        ))
+        seconds = time.perf_counter() - t0
+        rate = stats["checked"] / seconds if seconds else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['checked']} ressources vérifiées en {seconds:.1f}s ({rate:.0f}/s): ok={stats['ok']} "
+            f"cassées={stats['broken']} erreurs={stats['errors']} complétées={stats['enriched']}"))
+        for line in http.metrics.summary():
+            self.stdout.write(f"http {line}")
@@ -0,0 +1,51 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from harvest.export import CHUNK_SIZE, FORMATS, stream, write_parquet
+from harvest.filters import filter_datasets, parse_when
+from harvest.models import Dataset
+
+class Command(BaseCommand):
+    help = "Exporte le catalogue en flux (NDJSON, CSV, ou Parquet si pyarrow est installé)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="ndjson", help="Format de sortie")
+        parser.add_argument("--output", "-o", default="-", help='Fichier de sortie ("-" = stdout; requis pour parquet)')
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Datasets lus par lot")
+        parser.add_argument("--source", help="Nom ou id de Source")
+        parser.add_argument("--org", help="Organisation exacte")
+        parser.add_argument("--license", help="Licence exacte")
+        parser.add_argument("--res-format", help="Datasets ayant une ressource de ce format (CSV, JSON…)")
+        parser.add_argument("--tag", help="Nom de tag exact")
+        parser.add_argument("--modified-after", help="YYYY-MM-DD ou datetime ISO")
+
+    def handle(self, *args, **opts):
+        try:
+            after = parse_when(opts["modified_after"]) if opts["modified_after"] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        qs = filter_datasets(Dataset.objects.order_by("id"), source=opts["source"], org=opts["org"],
+                             license=opts["license"], res_format=opts["res_format"], tag=opts["tag"],
+                             modified_after=after)
+        fmt, output, chunk_size = opts["format"], opts["output"], max(opts["chunk_size"], 1)
+
+        if fmt == "parquet":
+            if output == "-":
+                raise CommandError("--output est requis pour le format parquet.")
+            try:
+                count = write_parquet(qs, output, chunk_size)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+        else:
+            count = 0
+            out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8", newline="")
+            try:
+                for line in stream(qs, fmt, chunk_size):
+                    out.write(line)
+                    count += 1
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            if fmt == "csv":
+                count -= 1  # en-tête
+        if output != "-":
+            self.stdout.write(self.style.SUCCESS(f"{count} datasets exportés ({fmt}) -> {output}"))
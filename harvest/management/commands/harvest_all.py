@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from harvest.models import Source
+from harvest.services import http
+from harvest.services.replay import FixtureMissing, transport_from_options, use_transport
+from harvest.services.ckan_harvester import STREAM_BATCH
+from harvest.services.orchestrator import harvest_sources, summarize, is_ckan, is_oai, MAX_WORKERS
+
+class Command(BaseCommand):
+    help = "Moissonne toutes les sources actives (CKAN, Dataverse, OAI-PMH) en parallèle, une source par worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", action="append", default=[],
+                            help='Nom EXACT d\'une Source (répétable). Omettre pour toutes les sources actives.')
+        parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Sources moissonnées simultanément")
+        parser.add_argument("--cap", action="append", default=[], metavar="SOURCE=N",
+                            help='Plafond de requêtes simultanées pour une source Dataverse (ex: "Borealis=4")')
+        parser.add_argument("--rows", type=int, default=50, help="CKAN: résultats par page (<=100)")
+        parser.add_argument("--per_page", type=int, default=20, help="Dataverse: résultats par page")
+        parser.add_argument("--max_pages", type=int, default=2, help="Nombre de pages par source")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Ne moissonne que ce qui a changé depuis le dernier job réussi de chaque source")
+        parser.add_argument("--reconcile", action="store_true",
+                            help="Dataverse: supprime ensuite les datasets qui ne sont plus publiés")
+        parser.add_argument("--stream", type=int, nargs="?", const=STREAM_BATCH, default=0, metavar="N",
+                            help=f"CKAN: lit les réponses en flux et écrit par lots de N packages (défaut {STREAM_BATCH})")
+        parser.add_argument("--record", metavar="DIR", help="Enregistre les réponses HTTP dans DIR (fixtures)")
+        parser.add_argument("--replay", metavar="DIR", help="Rejoue les fixtures de DIR au lieu d'appeler le réseau")
+
+    def handle(self, *args, **opts):
+        try:
+            transport = transport_from_options(opts["record"], opts["replay"])
+        except (ValueError, FixtureMissing) as e:
+            raise CommandError(str(e))
+        with use_transport(transport):
+            self._harvest(*args, **opts)
+
+    def _harvest(self, *args, **opts):
+        qs = Source.objects.filter(active=True)
+        if opts["source"]:
+            qs = qs.filter(name__in=opts["source"])
+            missing = set(opts["source"]) - set(qs.values_list("name", flat=True))
+            if missing:
+                raise CommandError(f"Sources actives introuvables: {', '.join(sorted(missing))}")
+        if not qs.exists():
+            raise CommandError("Aucune source active à moissonner.")
+
+        caps = {}
+        for item in opts["cap"]:
+            name, sep, value = item.rpartition("=")
+            if not sep or not value.isdigit():
+                raise CommandError(f"--cap attend SOURCE=N, reçu: {item!r}")
+            caps[name] = int(value)
+
+        ckan_opts = {"rows": opts["rows"], "max_pages": opts["max_pages"], "incremental": opts["incremental"],
+                     "stream_batch": opts["stream"]}
+        dataverse_opts = {"per_page": opts["per_page"], "max_pages": opts["max_pages"],
+                          "incremental": opts["incremental"], "reconcile": opts["reconcile"]}
+        oai_opts = {"max_pages": opts["max_pages"], "incremental": opts["incremental"]}
+
+        def report(src, job):
+            kind = "CKAN" if is_ckan(src) else "OAI-PMH" if is_oai(src) else "Dataverse"
+            msg = (f"{src.name} ({kind}) -> Job {job.id} status={job.get_status_display()} "
+                   f"found={job.found} imported={job.imported}")
+            if job.status == job.F:
+                self.stdout.write(self.style.WARNING(msg + f" | error={job.error[:140]}..."))
+            else:
+                self.stdout.write(self.style.SUCCESS(msg))
+
+        jobs = harvest_sources(qs, workers=opts["workers"], ckan_opts=ckan_opts,
+                               dataverse_opts=dataverse_opts, oai_opts=oai_opts, caps=caps, on_done=report)
+
+        t = summarize(jobs)
+        self.stdout.write(self.style.HTTP_INFO(
+            f"Total: {t['jobs']} jobs ({t['failed']} échecs) found={t['found']} imported={t['imported']} "
+            f"created={t['created']} updated={t['updated']} skipped={t['skipped']} deleted={t['deleted']} | "
+            f"durée {t['slowest_seconds']:.1f}s (séquentiel: {t['sum_seconds']:.1f}s)"
+        ))
+        for line in http.metrics.summary():
+            self.stdout.write(f"http {line}")
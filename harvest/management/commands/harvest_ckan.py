@@ -1,9 +1,17 @@
+import signal
 from django.core.management.base import BaseCommand, CommandError
 from harvest.models import Source
-from harvest.services.ckan_harvester import harvest_ckan
+from harvest.services.ckan_harvester import harvest_ckan, CKAN_PAGE_ROWS_MAX, STREAM_BATCH
+from harvest.services.pipeline import PREFETCH_DEPTH
+from harvest.services import http
+from harvest.services.replay import FixtureMissing, transport_from_options, use_transport
 
 CKAN_PATH = "/package_search"  # signature d'une source CKAN
 
+
+def _terminate(signum, frame):
+    raise SystemExit(128 + signum)
+
 class Command(BaseCommand):
     help = "Moissonne une ou plusieurs sources CKAN via /package_search (ignore les sources non-CKAN)."
 
@@ -14,11 +22,37 @@ class Command(BaseCommand):
         parser.add_argument("--res_format", default=None, help="Filtrer par format de ressource (ex: CSV)")
         parser.add_argument("--license_id", default=None, help="Filtrer par license_id")
         parser.add_argument("--since", dest="since_iso", default=None, help="YYYY-MM-DD (metadata_modified >= date)")
-        parser.add_argument("--rows", type=int, default=50, help="Résultats par page (<=100)")
+        parser.add_argument("--rows", type=int, default=None,
+                            help=f"Résultats par page (défaut 50, <=100; avec --all défaut et max {CKAN_PAGE_ROWS_MAX})")
         parser.add_argument("--max_pages", type=int, default=2, help="Nombre de pages à récupérer")
+        parser.add_argument("--all", dest="full_sync", action="store_true",
+                            help="Synchro complète du catalogue (ignore --max_pages, reprend un --all interrompu)")
+        parser.add_argument("--prefetch", type=int, default=PREFETCH_DEPTH,
+                            help="Pages récupérées d'avance pendant l'écriture en base (0 = séquentiel)")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Reprend après le dernier metadata_modified vu (high-water mark par source)")
+        parser.add_argument("--stream", type=int, nargs="?", const=STREAM_BATCH, default=0, metavar="N",
+                            help=f"CKAN: lit les réponses en flux et écrit par lots de N packages (défaut {STREAM_BATCH})")
+        parser.add_argument("--record", metavar="DIR", help="Enregistre les réponses HTTP dans DIR (fixtures)")
+        parser.add_argument("--replay", metavar="DIR", help="Rejoue les fixtures de DIR au lieu d'appeler le réseau")
 
     def handle(self, *args, **opts):
+        try:
+            transport = transport_from_options(opts["record"], opts["replay"])
+        except (ValueError, FixtureMissing) as e:
+            raise CommandError(str(e))
+        # SIGTERM -> SystemExit: le job en cours est enregistré en échec et le prochain --all le reprend
+        previous = signal.signal(signal.SIGTERM, _terminate)
+        try:
+            with use_transport(transport):
+                self._harvest(*args, **opts)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+    def _harvest(self, *args, **opts):
         src_name = opts.get("source")
+        if opts["incremental"] and (opts["q"] or opts["organization"] or opts["res_format"] or opts["license_id"]):
+            raise CommandError("--incremental moissonne toute la source: incompatible avec --q/--organization/--res_format/--license_id.")
 
         # Base: sources actives
         qs = Source.objects.filter(active=True)
@@ -49,13 +83,21 @@ class Command(BaseCommand):
                 res_format=opts["res_format"],
                 license_id=opts["license_id"],
                 since_iso=opts["since_iso"],
-                rows=opts["rows"],
+                rows=opts["rows"] or (CKAN_PAGE_ROWS_MAX if opts["full_sync"] else 50),
                 max_pages=opts["max_pages"],
+                incremental=opts["incremental"],
+                full_sync=opts["full_sync"],
+                prefetch_depth=opts["prefetch"],
+                stream_batch=opts["stream"],
             )
 
             status = job.get_status_display()
-            msg = f"{src.name} -> Job {job.id} status={status} found={job.found} imported={job.imported}"
+            msg = (f"{src.name} -> Job {job.id} status={status} found={job.found} imported={job.imported} "
+                   f"created={job.created} updated={job.updated} skipped={job.skipped} deleted={job.deleted}")
             if job.error:
                 self.stdout.write(self.style.WARNING(msg + f" | error={job.error[:140]}..."))
             else:
                 self.stdout.write(self.style.SUCCESS(msg))
+
+        for line in http.metrics.summary():
+            self.stdout.write(f"http {line}")
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from harvest.models import Source
-from harvest.services.dataverse_harvester import harvest_dataverse
+from harvest.services.dataverse_harvester import harvest_dataverse, FILES_CONCURRENCY
+from harvest.services import http
+from harvest.services.replay import FixtureMissing, transport_from_options, use_transport
 
 class Command(BaseCommand):
     help = "Moissonne Borealis (Dataverse) via /api/search"
@@ -11,8 +13,24 @@ class Command(BaseCommand):
         parser.add_argument("--per_page", type=int, default=20)
         parser.add_argument("--max_pages", type=int, default=2)
         parser.add_argument("--subtree", default=None, help="Alias du dataverse (ex: daviddeslauriers)")
+        parser.add_argument("--concurrency", type=int, default=FILES_CONCURRENCY,
+                            help="Appels 'files' simultanés par page (1 = séquentiel)")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Ne moissonne que les datasets publiés/modifiés depuis le dernier job réussi (dateSort, rendu published_at)")
+        parser.add_argument("--reconcile", action="store_true",
+                            help="Supprime ensuite les datasets qui ne sont plus publiés (q='*' sans --subtree)")
+        parser.add_argument("--record", metavar="DIR", help="Enregistre les réponses HTTP dans DIR (fixtures)")
+        parser.add_argument("--replay", metavar="DIR", help="Rejoue les fixtures de DIR au lieu d'appeler le réseau")
 
     def handle(self, *args, **opts):
+        try:
+            transport = transport_from_options(opts["record"], opts["replay"])
+        except (ValueError, FixtureMissing) as e:
+            raise CommandError(str(e))
+        with use_transport(transport):
+            self._harvest(*args, **opts)
+
+    def _harvest(self, *args, **opts):
         name = opts["source"]
         try:
             src = Source.objects.get(name=name, active=True)
@@ -25,9 +43,14 @@ class Command(BaseCommand):
             per_page=opts["per_page"],
             max_pages=opts["max_pages"],
             subtree=opts["subtree"],
+            concurrency=opts["concurrency"],
+            incremental=opts["incremental"],
+            reconcile=opts["reconcile"],
         )
         status = job.get_status_display()
-        msg = f"{src.name} -> Job {job.id} status={status} found={job.found} imported={job.imported}"
+        msg = f"{src.name} -> Job {job.id} status={status} found={job.found} imported={job.imported} deleted={job.deleted}"
         if job.error:
             msg += f"\n{job.error}"
         self.stdout.write(msg)
+        for line in http.metrics.summary():
+            self.stdout.write(f"http {line}")
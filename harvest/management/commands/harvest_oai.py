@@ -0,0 +1,77 @@
+import signal
+from django.core.management.base import BaseCommand, CommandError
+from harvest.models import Source
+from harvest.services import http
+from harvest.services.oai_harvester import harvest_oai, oai_endpoint, METADATA_PREFIXES
+from harvest.services.pipeline import PREFETCH_DEPTH
+from harvest.services.replay import FixtureMissing, transport_from_options, use_transport
+
+
+def _terminate(signum, frame):
+    raise SystemExit(128 + signum)
+
+class Command(BaseCommand):
+    help = ("Moissonne une source via OAI-PMH (ListRecords + resumptionToken): Dataverse (/oai) "
+            "ou CKAN avec ckanext-oaipmh. Un moissonnage interrompu reprend au dernier jeton.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", required=True, help='Nom de la Source (ex: "Borealis")')
+        parser.add_argument("--endpoint", default=None,
+                            help="URL OAI-PMH (défaut: base_url de la source, /api remplacé par /oai)")
+        parser.add_argument("--prefix", default="oai_dc", choices=METADATA_PREFIXES, help="Format des métadonnées")
+        parser.add_argument("--set", dest="set_spec", default=None, help="Set OAI (ex: alias d'un dataverse)")
+        parser.add_argument("--from", dest="from_date", default=None, help="YYYY-MM-DD (datestamp >= date)")
+        parser.add_argument("--until", dest="until_date", default=None, help="YYYY-MM-DD (datestamp <= date)")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Reprend au début du dernier moissonnage complet réussi (high-water mark)")
+        parser.add_argument("--max_pages", type=int, default=None, help="Nombre max de réponses (défaut: toutes)")
+        parser.add_argument("--prefetch", type=int, default=PREFETCH_DEPTH,
+                            help="Réponses récupérées d'avance pendant l'écriture en base (0 = séquentiel)")
+        parser.add_argument("--record", metavar="DIR", help="Enregistre les réponses HTTP dans DIR (fixtures)")
+        parser.add_argument("--replay", metavar="DIR", help="Rejoue les fixtures de DIR au lieu d'appeler le réseau")
+
+    def handle(self, *args, **opts):
+        try:
+            transport = transport_from_options(opts["record"], opts["replay"])
+        except (ValueError, FixtureMissing) as e:
+            raise CommandError(str(e))
+        # SIGTERM -> SystemExit: le job en cours est enregistré en échec et le prochain run le reprend
+        previous = signal.signal(signal.SIGTERM, _terminate)
+        try:
+            with use_transport(transport):
+                self._harvest(*args, **opts)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+    def _harvest(self, *args, **opts):
+        name = opts["source"]
+        try:
+            src = Source.objects.get(name=name, active=True)
+        except Source.DoesNotExist:
+            raise CommandError(f"Source active introuvable: {name}")
+        if opts["incremental"] and (opts["set_spec"] or opts["until_date"]):
+            raise CommandError("--incremental moissonne toute la source: incompatible avec --set/--until.")
+
+        job = harvest_oai(
+            source=src,
+            metadata_prefix=opts["prefix"],
+            set_spec=opts["set_spec"],
+            from_date=opts["from_date"],
+            until_date=opts["until_date"],
+            incremental=opts["incremental"],
+            max_pages=opts["max_pages"],
+            prefetch_depth=opts["prefetch"],
+            endpoint=opts["endpoint"],
+        )
+        status = job.get_status_display()
+        msg = (f"{src.name} ({opts['endpoint'] or oai_endpoint(src)}) -> Job {job.id} status={status} "
+               f"found={job.found} imported={job.imported} created={job.created} updated={job.updated} "
+               f"skipped={job.skipped} deleted={job.deleted}")
+        if job.checkpoint.get("resumed_from"):
+            msg += f" (reprise du job {job.checkpoint['resumed_from']})"
+        if job.error:
+            self.stdout.write(self.style.WARNING(msg + f" | error={job.error[:300]}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(msg))
+        for line in http.metrics.summary():
+            self.stdout.write(f"http {line}")
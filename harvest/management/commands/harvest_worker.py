@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from harvest.services.jobs import claim_next, recover_stale, run_job, worker_name, STALE_AFTER
+
+class Command(BaseCommand):
+    help = "Worker de la file de moissonnage: réclame les HarvestJob 'Pending' et les exécute."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Vide la file puis s'arrête (sinon boucle)")
+        parser.add_argument("--poll", type=float, default=10.0, help="Secondes d'attente quand la file est vide")
+        parser.add_argument("--stale_after", type=int, default=STALE_AFTER,
+                            help="Secondes sans heartbeat avant de récupérer un job 'Running'")
+        parser.add_argument("--name", default=None, help="Nom du worker (défaut: hôte:pid)")
+
+    def handle(self, *args, **opts):
+        name = opts["name"] or worker_name()
+        self.stdout.write(self.style.HTTP_INFO(f"Worker {name} démarré"))
+        while True:
+            close_old_connections()
+            requeued, failed = recover_stale(opts["stale_after"])
+            if requeued or failed:
+                self.stdout.write(self.style.WARNING(f"Jobs perdus: {requeued} remis en file, {failed} en échec"))
+
+            job = claim_next(name)
+            if job is None:
+                if opts["once"]:
+                    break
+                time.sleep(opts["poll"])
+                continue
+
+            self.stdout.write(self.style.HTTP_INFO(f"--> Job {job.id} ({job.source.name})"))
+            job = run_job(job)
+            msg = f"{job.source.name} -> Job {job.id} status={job.get_status_display()} found={job.found} imported={job.imported}"
+            if job.status == job.F:
+                self.stdout.write(self.style.WARNING(msg + f" | error={job.error[:140]}..."))
+            else:
+                self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from harvest.models import Dataset
+from harvest.search import setup_search_index
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des datasets (GIN Postgres / FTS5 SQLite)."
+
+    def handle(self, *args, **opts):
+        setup_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Index de recherche reconstruit ({Dataset.objects.count()} datasets)."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from harvest.stats import refresh_stats
+
+class Command(BaseCommand):
+    help = "Recalcule l'instantané des statistiques de la page /stats/."
+
+    def handle(self, *args, **opts):
+        snap = refresh_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stats recalculées: {snap.data['total_datasets']} datasets, {snap.data['total_resources']} ressources."))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harvest', '0002_alter_dataset_url_alter_resource_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='harvestjob',
+            name='created',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='harvestjob',
+            name='updated',
+            field=models.IntegerField(default=0),
+        ),
+    ]
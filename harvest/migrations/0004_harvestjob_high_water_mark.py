@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harvest', '0003_harvestjob_created_harvestjob_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='harvestjob',
+            name='high_water_mark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harvest', '0004_harvestjob_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='harvestjob',
+            name='skipped',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:16
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# DDL figé ici (et non importé de harvest/search.py): la migration doit rester rejouable
+# telle quelle même si le module évolue.
+TAGS_SQL = (
+    "SELECT {agg} FROM harvest_dataset_tags dt "
+    "JOIN harvest_tag t ON t.id = dt.tag_id WHERE dt.dataset_id = d.id"
+)
+
+FORWARD = {
+    # index GIN sur search_vector, config 'fr_unaccent' (french + unaccent), remplissage initial
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        """DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'fr_unaccent') THEN
+                CREATE TEXT SEARCH CONFIGURATION fr_unaccent (COPY = french);
+                ALTER TEXT SEARCH CONFIGURATION fr_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+            END IF;
+        END $$""",
+        "CREATE INDEX IF NOT EXISTS harvest_dataset_search_gin ON harvest_dataset USING gin (search_vector)",
+        f"""UPDATE harvest_dataset d SET search_vector =
+            setweight(to_tsvector('fr_unaccent', coalesce(d.title, '')), 'A') ||
+            setweight(to_tsvector('fr_unaccent', coalesce(({TAGS_SQL.format(agg="string_agg(t.name, ' ')")}), '')), 'B') ||
+            setweight(to_tsvector('fr_unaccent', coalesce(d.org, '')), 'C') ||
+            setweight(to_tsvector('fr_unaccent', coalesce(d.notes, '')), 'D')""",
+    ],
+    # table virtuelle FTS5 (accents ignorés), remplissage initial
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS harvest_dataset_fts USING fts5("
+        "title, tags, org, notes, tokenize = 'unicode61 remove_diacritics 2')",
+        f"""INSERT INTO harvest_dataset_fts (rowid, title, tags, org, notes)
+            SELECT d.id, d.title, coalesce(({TAGS_SQL.format(agg="group_concat(t.name, ' ')")}), ''), d.org, d.notes
+            FROM harvest_dataset d""",
+    ],
+}
+
+REVERSE = {
+    # l'extension unaccent reste: elle a pu exister avant cette migration
+    "postgresql": [
+        "DROP INDEX IF EXISTS harvest_dataset_search_gin",
+        "DROP TEXT SEARCH CONFIGURATION IF EXISTS fr_unaccent",
+    ],
+    "sqlite": [
+        "DROP TABLE IF EXISTS harvest_dataset_fts",
+    ],
+}
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harvest', '0007_harvestjob_attempts_harvestjob_heartbeat_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run(FORWARD), run(REVERSE)),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harvest', '0008_dataset_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataset',
+            name='last_modified',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dataset',
+            name='license',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='dataset',
+            name='org',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='resource',
+            name='format',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+    ]
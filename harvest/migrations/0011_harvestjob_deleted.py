@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('harvest', '0010_statssnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='harvestjob',
+            name='deleted',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 
 # Create your models here.
+import datetime
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 
 class Source(models.Model):
     name = models.CharField(max_length=100, unique=True)  # OpenGouv, CanWin, Données Québec, Boréalis
@@ -10,6 +13,14 @@ class Source(models.Model):
     active = models.BooleanField(default=True)
     def __str__(self): return self.name
 
+    def last_high_water_mark(self, *modes):
+        """
+        Plus grande date de modification vue par le dernier job réussi qui en a enregistré une,
+        parmi les jobs des modes donnés (checkpoint["mode"]): chaque moissonneur a son propre mark.
+        """
+        return (self.jobs.filter(status=HarvestJob.S, high_water_mark__isnull=False, checkpoint__mode__in=modes)
+                .order_by("-ended_at").values_list("high_water_mark", flat=True).first())
+
 class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
     def __str__(self): return self.name
@@ -20,14 +31,16 @@ class Dataset(models.Model):
     name = models.CharField(max_length=255)              # slug / name CKAN
     title = models.CharField(max_length=500, blank=True)
     notes = models.TextField(blank=True)                 # description
-    org = models.CharField(max_length=255, blank=True)   # producteur/org
-    license = models.CharField(max_length=200, blank=True)
+    org = models.CharField(max_length=255, blank=True, db_index=True)   # producteur/org
+    license = models.CharField(max_length=200, blank=True, db_index=True)
     spatial = models.CharField(max_length=500, blank=True)
     temporal_start = models.DateField(null=True, blank=True)
     temporal_end = models.DateField(null=True, blank=True)
-    last_modified = models.DateTimeField(null=True, blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True, db_index=True)
     tags = models.ManyToManyField(Tag, blank=True)
     url = models.URLField(max_length=1000, blank=True, default="")   # 
+    fingerprint = models.CharField(max_length=64, blank=True, default="")  # sha256 du contenu moissonné
+    search_vector = SearchVectorField(null=True, editable=False)  # Postgres seulement (voir harvest/search.py)
     created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         unique_together = ("source", "ckan_id")
@@ -37,10 +50,16 @@ class Resource(models.Model):
     dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name="resources")
     ckan_id = models.CharField(max_length=200, db_index=True)
     name = models.CharField(max_length=500, blank=True)
-    format = models.CharField(max_length=50, blank=True) # CSV, JSON, SHP…
+    format = models.CharField(max_length=50, blank=True, db_index=True) # CSV, JSON, SHP…
     url = models.URLField(max_length=1000, blank=True, default="")   # ↑
     last_modified = models.DateTimeField(null=True, blank=True)
     size = models.BigIntegerField(null=True, blank=True)
+    # vérification du lien (commande check_resources)
+    link_status = models.PositiveSmallIntegerField(null=True, blank=True)   # code HTTP final
+    link_size = models.BigIntegerField(null=True, blank=True)               # Content-Length / Content-Range
+    link_type = models.CharField(max_length=200, blank=True)                # Content-Type
+    link_error = models.CharField(max_length=200, blank=True)               # erreur réseau/URL
+    link_checked_at = models.DateTimeField(null=True, blank=True, db_index=True)
     class Meta:
         unique_together = ("dataset", "ckan_id")
 
@@ -54,5 +73,81 @@ class HarvestJob(models.Model):
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=P)
     found = models.IntegerField(default=0)
     imported = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)             # datasets créés
+    updated = models.IntegerField(default=0)             # datasets mis à jour
+    skipped = models.IntegerField(default=0)             # datasets inchangés (même empreinte)
+    deleted = models.IntegerField(default=0)             # datasets disparus du portail (réconciliation)
+    high_water_mark = models.DateTimeField(null=True, blank=True)  # max metadata_modified/updatedAt vu (mode incrémental)
+    checkpoint = models.JSONField(default=dict, blank=True)        # progression d'une synchro complète (reprise)
+    # file d'attente (harvest_worker)
+    params = models.JSONField(default=dict, blank=True)  # kwargs du moissonneur pour un job en file
+    worker = models.CharField(max_length=200, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
     error = models.TextField(blank=True)
     def __str__(self): return f"{self.source.name} [{self.get_status_display()}] {self.started_at:%Y-%m-%d %H:%M}"
+
+    RESUME_MAX_AGE = datetime.timedelta(hours=24)  # au-delà, un checkpoint est trop vieux pour être repris
+    STALE_AFTER = datetime.timedelta(minutes=5)    # job 'Running' sans heartbeat depuis ce délai: considéré perdu
+
+    def is_stale(self, now=None):
+        """Job 'Running' dont le processus ne donne plus signe de vie (heartbeat absent ou trop vieux)."""
+        limit = (now or timezone.now()) - self.STALE_AFTER
+        return self.status == self.R and (self.heartbeat_at or self.started_at) < limit
+
+    def beat(self):
+        """Heartbeat: le job est toujours en cours (rien n'est écrit s'il n'est plus 'Running')."""
+        self.heartbeat_at = timezone.now()
+        HarvestJob.objects.filter(pk=self.pk, status=self.R).update(heartbeat_at=self.heartbeat_at)
+
+    @classmethod
+    def resumable(cls, source, mode, job=None, max_age=RESUME_MAX_AGE):
+        """
+        Job dont le checkpoint `mode` peut être repris: `job` lui-même s'il en a un (job de la
+        file remis en attente par recover_stale), sinon le dernier job `mode` de la source s'il
+        a échoué depuis moins de `max_age`, ou s'il est resté 'Running' sans heartbeat récent
+        (processus tué: OOM, SIGKILL); ce dernier est alors marqué en échec. Un job en cours
+        (heartbeat récent, peut-être sur un autre worker) ou réussi n'est jamais repris.
+        """
+        if job is not None and job.checkpoint.get("mode") == mode:
+            return job
+        now = timezone.now()
+        last = source.jobs.filter(checkpoint__mode=mode).order_by("-started_at").first()
+        if last is None:
+            return None
+        if last.status == cls.R and last.is_stale(now) and last.started_at >= now - max_age:
+            last.status, last.ended_at = cls.F, now
+            last.error = last.error or "Interrompu: plus de heartbeat"
+            cls.objects.filter(pk=last.pk, status=cls.R).update(
+                status=last.status, ended_at=last.ended_at, error=last.error)
+            return last
+        if last.status == cls.F and last.ended_at and last.ended_at >= now - max_age:
+            return last
+        return None
+
+    COUNTERS = ("found", "imported", "created", "updated", "skipped", "deleted")
+
+    @classmethod
+    def begin(cls, source, job=None, resume=False, **fields):
+        """
+        Crée un job 'Running', ou passe en 'Running' un job déjà réclamé dans la file.
+        Un job de la file relancé repart de zéro (compteurs, erreur), sauf s'il reprend son
+        propre checkpoint (resume=True): ses compteurs continuent alors là où ils étaient.
+        """
+        fields["status"] = cls.R
+        fields["heartbeat_at"] = timezone.now()  # aussi hors file: un processus tué se voit (recover_stale)
+        if job is None:
+            return cls.objects.create(source=source, **fields)
+        if not resume:
+            fields = {**dict.fromkeys(cls.COUNTERS, 0), "error": "", **fields}
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.save()
+        return job
+
+class StatsSnapshot(models.Model):
+    """Statistiques pré-calculées de la page /stats/ (une seule ligne, voir harvest/stats.py)."""
+    data = models.JSONField(default=dict)
+    computed_at = models.DateTimeField()   # dernier recalcul complet
+    updated_at = models.DateTimeField()    # dernier ajustement (fin de job inclus)
+    def __str__(self): return f"Stats {self.updated_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+class DatasetCursorPagination(CursorPagination):
+    """Pagination par curseur (keyset sur l'id): coût constant quelle que soit la page."""
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = "id"
+
+class DatasetSearchPagination(PageNumberPagination):
+    """Pour ?search=: pages numérotées, l'ordre de pertinence (rank) est conservé."""
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
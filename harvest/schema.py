@@ -1,6 +1,17 @@
+import base64
 import graphene
 from graphene_django import DjangoObjectType
-from .models import Dataset, Resource, Tag
+from graphql import GraphQLError
+from .models import Dataset, Resource, Source, Tag
+from .filters import filter_datasets, facet_counts, FACET_LIMIT
+from .graphql_validation import DEFAULT_FIRST, MAX_FIRST
+from .loaders import get_loaders, prime_datasets
+from .search import search_datasets
+
+class SourceType(DjangoObjectType):
+    class Meta:
+        model = Source
+        fields = ("id", "name", "base_url")
 
 class TagType(DjangoObjectType):
     class Meta:
@@ -10,7 +21,7 @@ class TagType(DjangoObjectType):
 class ResourceType(DjangoObjectType):
     class Meta:
         model = Resource
-        fields = ("id", "name", "format", "url", "last_modified", "size")
+        fields = ("id", "name", "format", "url", "last_modified", "size", "link_status", "link_checked_at")
 
 class DatasetType(DjangoObjectType):
     class Meta:
@@ -19,20 +30,128 @@ class DatasetType(DjangoObjectType):
                   "spatial","temporal_start","temporal_end","last_modified","url",
                   "tags","resources","source")
 
-class Query(graphene.ObjectType):
-    datasets = graphene.List(
-        DatasetType,
-        search=graphene.String(required=False)
+    # source/tags/resources: chargés en lot pour toute la page (harvest/loaders.py)
+    def resolve_source(self, info):
+        return get_loaders(info.context)["source"].load(self.source_id)
+
+    def resolve_tags(self, info):
+        return get_loaders(info.context)["tags"].load(self.pk)
+
+    def resolve_resources(self, info):
+        return get_loaders(info.context)["resources"].load(self.pk)
+
+class DatasetConnection(graphene.relay.Connection):
+    class Meta:
+        node = DatasetType
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        return self.queryset.count()  # uniquement si demandé
+
+def _encode_cursor(kind, value):
+    return base64.b64encode(f"{kind}:{value}".encode()).decode()
+
+def _decode_cursor(cursor, kind):
+    """Curseur `kind` ('id' ou 'offset') -> entier; un curseur d'une autre sorte de liste est refusé."""
+    try:
+        found, value = base64.b64decode(cursor).decode().split(":", 1)
+        value = int(value)
+    except Exception:
+        found = None
+    if found != kind:
+        raise GraphQLError(f"Curseur invalide: {cursor!r}")
+    return value
+
+def _paginate(qs, info, first=None, after=None, searching=False):
+    """
+    Page de connexion Relay (first/after). Sans recherche: keyset sur l'id
+    (curseur 'id:<pk>'); avec recherche: ordre de pertinence, curseur 'offset:<n>'.
+    """
+    first = DEFAULT_FIRST if first is None else first
+    if not 0 <= first <= MAX_FIRST:
+        raise GraphQLError(f"first doit être entre 0 et {MAX_FIRST}.")
+    full_qs = qs
+    offset = 0
+    if searching:
+        if after:
+            offset = _decode_cursor(after, "offset") + 1
+        rows = list(qs[offset:offset + first + 1])
+    else:
+        qs = qs.order_by("id")
+        if after:
+            qs = qs.filter(id__gt=_decode_cursor(after, "id"))
+        rows = list(qs[:first + 1])
+    has_next = len(rows) > first
+    rows = rows[:first]
+    prime_datasets(info.context, rows)
+
+    edges = [
+        DatasetConnection.Edge(
+            node=ds,
+            cursor=_encode_cursor("offset", offset + i) if searching else _encode_cursor("id", ds.pk),
+        )
+        for i, ds in enumerate(rows)
+    ]
+    conn = DatasetConnection(
+        edges=edges,
+        page_info=graphene.relay.PageInfo(
+            has_next_page=has_next,
+            has_previous_page=bool(after),
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+        ),
     )
+    conn.queryset = full_qs
+    return conn
+
+class FacetCountType(graphene.ObjectType):
+    value = graphene.String()
+    count = graphene.Int()
+
+class FacetsType(graphene.ObjectType):
+    source = graphene.List(FacetCountType)
+    org = graphene.List(FacetCountType)
+    license = graphene.List(FacetCountType)
+    format = graphene.List(FacetCountType)
+    tag = graphene.List(FacetCountType)
+
+# filtres à facettes communs à datasets et facets (voir harvest/filters.py)
+FILTER_ARGS = dict(
+    search=graphene.String(required=False),
+    source=graphene.String(required=False),
+    org=graphene.String(required=False),
+    license=graphene.String(required=False),
+    res_format=graphene.String(required=False),
+    tag=graphene.String(required=False),
+    modified_after=graphene.DateTime(required=False),
+    modified_before=graphene.DateTime(required=False),
+)
+
+def _filtered(qs, search=None, **filters):
+    qs = filter_datasets(qs, **filters)
+    if search:
+        qs = search_datasets(qs, search)  # classé par pertinence
+    return qs
+
+class Query(graphene.ObjectType):
+    datasets = graphene.relay.ConnectionField(DatasetConnection, **FILTER_ARGS)
     dataset = graphene.Field(DatasetType, id=graphene.Int(required=True))
+    facets = graphene.Field(FacetsType, limit=graphene.Int(default_value=FACET_LIMIT), **FILTER_ARGS)
+
+    def resolve_datasets(root, info, first=None, after=None, last=None, before=None, **filters):
+        if last is not None or before is not None:
+            raise GraphQLError("Pagination arrière non supportée: utiliser first/after.")
+        return _paginate(_filtered(Dataset.objects.all(), **filters), info, first, after,
+                         searching=bool(filters.get("search")))
 
-    def resolve_datasets(root, info, search=None):
-        qs = Dataset.objects.select_related("source").prefetch_related("tags","resources").all()
-        if search:
-            qs = qs.filter(title__icontains=search) | qs.filter(org__icontains=search) | qs.filter(tags__name__icontains=search)
-        return qs.distinct()
+    def resolve_facets(root, info, limit=FACET_LIMIT, **filters):
+        counts = facet_counts(_filtered(Dataset.objects.all(), **filters), min(max(limit, 1), 100))
+        return FacetsType(**{name: [FacetCountType(**row) for row in rows] for name, rows in counts.items()})
 
     def resolve_dataset(root, info, id):
-        return Dataset.objects.select_related("source").prefetch_related("tags","resources").get(id=id)
+        ds = Dataset.objects.get(id=id)
+        prime_datasets(info.context, [ds])
+        return ds
 
 schema = graphene.Schema(query=Query)
@@ -0,0 +1,120 @@
+# harvest/search.py
+"""
+Recherche plein texte sur les datasets.
+- Postgres: colonne Dataset.search_vector (tsvector pondéré titre > tags > org > notes,
+  config 'fr_unaccent' = french + unaccent) avec index GIN
+- SQLite: table virtuelle FTS5 harvest_dataset_fts (unicode61, accents ignorés)
+L'index est maintenu par les moissonneurs (update_search_index après chaque page).
+"""
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+PG_CONFIG = "fr_unaccent"
+FTS_TABLE = "harvest_dataset_fts"
+# poids bm25 par colonne FTS5: title, tags, org, notes
+FTS_WEIGHTS = "10.0, 5.0, 2.0, 1.0"
+
+_TAGS_SQL = (
+    "SELECT {agg} FROM harvest_dataset_tags dt "
+    "JOIN harvest_tag t ON t.id = dt.tag_id WHERE dt.dataset_id = d.id"
+)
+
+_PG_UPDATE = f"""
+UPDATE harvest_dataset d SET search_vector =
+    setweight(to_tsvector('{PG_CONFIG}', coalesce(d.title, '')), 'A') ||
+    setweight(to_tsvector('{PG_CONFIG}', coalesce(({_TAGS_SQL.format(agg="string_agg(t.name, ' ')")}), '')), 'B') ||
+    setweight(to_tsvector('{PG_CONFIG}', coalesce(d.org, '')), 'C') ||
+    setweight(to_tsvector('{PG_CONFIG}', coalesce(d.notes, '')), 'D')
+"""
+
+_FTS_INSERT = f"""
+INSERT INTO {FTS_TABLE} (rowid, title, tags, org, notes)
+SELECT d.id, d.title, coalesce(({_TAGS_SQL.format(agg="group_concat(t.name, ' ')")}), ''), d.org, d.notes
+FROM harvest_dataset d
+"""
+
+PG_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{PG_CONFIG}') THEN
+            CREATE TEXT SEARCH CONFIGURATION {PG_CONFIG} (COPY = french);
+            ALTER TEXT SEARCH CONFIGURATION {PG_CONFIG}
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+        END IF;
+    END $$""",
+    "CREATE INDEX IF NOT EXISTS harvest_dataset_search_gin ON harvest_dataset USING gin (search_vector)",
+]
+SQLITE_SETUP = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, tags, org, notes, tokenize = 'unicode61 remove_diacritics 2')",
+]
+
+
+def _chunks(ids, size=500):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def update_search_index(dataset_ids=None, conn=None):
+    """Recalcule le document de recherche des datasets `dataset_ids` (tous si None)."""
+    conn = conn or connection
+    with conn.cursor() as cur:
+        if conn.vendor == "postgresql":
+            if dataset_ids is None:
+                cur.execute(_PG_UPDATE)
+            for chunk in _chunks(dataset_ids or []):
+                cur.execute(_PG_UPDATE + " WHERE d.id = ANY(%s)", [chunk])
+        elif conn.vendor == "sqlite":
+            if dataset_ids is None:
+                cur.execute(f"DELETE FROM {FTS_TABLE}")
+                cur.execute(_FTS_INSERT)
+            for chunk in _chunks(dataset_ids or []):
+                marks = ",".join(["%s"] * len(chunk))
+                cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", chunk)
+                cur.execute(_FTS_INSERT + f" WHERE d.id IN ({marks})", chunk)
+
+
+def setup_search_index(conn=None):
+    """Crée les objets propres au SGBD (config/index Postgres, table FTS5 SQLite) et remplit l'index."""
+    conn = conn or connection
+    statements = {"postgresql": PG_SETUP, "sqlite": SQLITE_SETUP}.get(conn.vendor, [])
+    with conn.cursor() as cur:
+        for sql in statements:
+            cur.execute(sql)
+    update_search_index(conn=conn)
+
+
+def _fts_match(text):
+    """Texte libre -> requête FTS5 sûre: chaque mot entre guillemets, en préfixe, tous requis."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def search_datasets(qs, text):
+    """
+    Filtre `qs` sur `text` et l'annote avec `rank` (plus grand = plus pertinent),
+    trié par pertinence. Autres SGBD: repli sur icontains (titre/org/tags).
+    """
+    if connection.vendor == "postgresql":
+        query = SearchQuery(text, config=PG_CONFIG, search_type="websearch")
+        return (qs.filter(search_vector=query)
+                .annotate(rank=SearchRank(F("search_vector"), query))
+                .order_by("-rank", "id"))
+    if connection.vendor == "sqlite":
+        match = _fts_match(text)
+        if not match:
+            return qs.none()
+        ids = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        # bm25() est négatif (plus petit = meilleur): on l'inverse pour un rank croissant
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = harvest_dataset.id",
+            (match,),
+        )
+        return qs.filter(id__in=ids).annotate(rank=rank).order_by("-rank", "id")
+    matches = qs.filter(title__icontains=text) | qs.filter(org__icontains=text) | qs.filter(tags__name__icontains=text)
+    return matches.distinct()
@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Dataset, Resource, Tag
 
@@ -9,13 +10,85 @@ class TagSerializer(serializers.ModelSerializer):
 class ResourceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Resource
-        fields = ["id", "name", "format", "url", "last_modified", "size"]
+        fields = ["id", "name", "format", "url", "last_modified", "size", "link_status", "link_checked_at"]
+
+def requested_fields(request):
+    """?fields=id,title,org -> {"id","title","org"} (None si absent: tous les champs)."""
+    # request DRF (query_params) ou HttpRequest Django (GET, vues async)
+    raw = getattr(request, "query_params", request.GET).get("fields") if request is not None else None
+    if not raw:
+        return None
+    return {f.strip() for f in raw.split(",") if f.strip()}
 
 class DatasetSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     resources = ResourceSerializer(many=True, read_only=True)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # sparse fieldset: ne garder que les champs demandés par ?fields=
+        wanted = requested_fields(self.context.get("request"))
+        if wanted is not None:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
     class Meta:
         model = Dataset
         fields = ["id","source","ckan_id","name","title","notes","org","license",
                   "spatial","temporal_start","temporal_end","last_modified","url",
                   "tags","resources"]
+
+# --- lecture rapide: même JSON que DatasetSerializer, sans instances ni champs DRF ---
+
+def _datetime(value, tz):
+    # DateTimeField DRF: fuseau courant, ISO 8601, '+00:00' -> 'Z'
+    if value is None:
+        return None
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+def _date(value):
+    return value.isoformat() if value is not None else None
+
+def dataset_values(qs, wanted=None):
+    """`qs` -> .values() des seules colonnes nécessaires aux champs `wanted` (None = tous)."""
+    columns = [f for f in DatasetSerializer.Meta.fields
+               if f not in ("tags", "resources") and (wanted is None or f in wanted)]
+    return qs.values("id", *[c for c in columns if c != "id"])
+
+def serialize_dataset_rows(rows, wanted=None):
+    """
+    Lignes de dataset_values() -> dicts au format de DatasetSerializer (mêmes clés, même ordre).
+    Tags et ressources: une requête .values() chacun pour toute la page, groupés par dataset_id
+    (même forme de requête que prefetch_related, donc même ordre).
+    """
+    tz = timezone.get_current_timezone()
+    fields = [f for f in DatasetSerializer.Meta.fields if wanted is None or f in wanted]
+    ids = [row["id"] for row in rows]
+    tags, resources = {}, {}
+    if "tags" in fields and ids:
+        for t in Tag.objects.filter(dataset__in=ids).values("dataset", "id", "name"):
+            tags.setdefault(t["dataset"], []).append({"id": t["id"], "name": t["name"]})
+    if "resources" in fields and ids:
+        for r in Resource.objects.filter(dataset__in=ids).values("dataset_id", *ResourceSerializer.Meta.fields):
+            resources.setdefault(r["dataset_id"], []).append({
+                "id": r["id"], "name": r["name"], "format": r["format"], "url": r["url"],
+                "last_modified": _datetime(r["last_modified"], tz), "size": r["size"],
+                "link_status": r["link_status"], "link_checked_at": _datetime(r["link_checked_at"], tz),
+            })
+    out = []
+    for row in rows:
+        item = {}
+        for f in fields:
+            if f == "tags":
+                item[f] = tags.get(row["id"], [])
+            elif f == "resources":
+                item[f] = resources.get(row["id"], [])
+            elif f == "last_modified":
+                item[f] = _datetime(row[f], tz)
+            elif f in ("temporal_start", "temporal_end"):
+                item[f] = _date(row[f])
+            else:
+                item[f] = row[f]
+        out.append(item)
+    return out
@@ -1,51 +1,235 @@
 # harvest/services/ckan_harvester.py
 import datetime
-import requests
+import hashlib
+import json
+from collections import OrderedDict
+from contextlib import closing
 from urllib.parse import urlencode
 from django.db import transaction
 from django.utils import timezone
 from ..models import Source, Dataset, Resource, Tag, HarvestJob
+from ..search import update_search_index
+from ..stats import apply_job
+from ..cache import bump_data_version
+from . import http
+from .jsonstream import StreamingArray
+from .pipeline import prefetch, PREFETCH_DEPTH
+from .reconcile import ReconcileAborted, delete_orphan_datasets, delete_stale_resources
 
 CKAN_PAGE_ROWS_MAX = 1000  # CKAN tolère de grands rows; on restera raisonnable (ex: 100)
+TAG_CACHE_SIZE = 50_000    # noms de tags gardés en mémoire pendant un job
+TAG_NAME_MAX = Tag._meta.get_field("name").max_length
+STREAM_BATCH = 100         # packages par lot d'upsert en mode flux (stream_batch)
+STREAM_CHUNK = 64 * 1024   # octets lus à la fois sur la réponse en mode flux
 
 def _parse_dt(val):
     if not val:
         return None
     try:
-        return datetime.datetime.fromisoformat(val.replace("Z","+00:00"))
+        dt = datetime.datetime.fromisoformat(val.replace("Z","+00:00"))
     except Exception:
         return None
+    # CKAN renvoie des dates UTC sans fuseau
+    return timezone.make_aware(dt, datetime.timezone.utc) if timezone.is_naive(dt) else dt
 
-def _ensure_tags(dataset_obj, tag_list):
-    names = [t.get("name") for t in (tag_list or []) if t.get("name")]
-    if not names:
-        return
-    existing = {t.name: t for t in Tag.objects.filter(name__in=names)}
-    to_add = []
-    for name in names:
-        obj = existing.get(name) or Tag.objects.create(name=name)
-        to_add.append(obj)
-    dataset_obj.tags.add(*to_add)
+def _solr_dt(val):
+    """'YYYY-MM-DD' ou datetime -> date Solr (UTC, à la seconde)."""
+    if isinstance(val, datetime.datetime):
+        return val.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return f"{val}T00:00:00Z"
+
+class TagCache:
+    """
+    Cache LRU nom -> id des tags, conservé pour toute la durée d'un job.
+    Les noms absents sont créés en un seul bulk_create(ignore_conflicts=True)
+    puis relus en une requête.
+    """
+    def __init__(self, maxsize=TAG_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def resolve(self, names):
+        names = {n[:TAG_NAME_MAX] for n in names if n}
+        missing = [n for n in names if n not in self._ids]
+        if missing:
+            Tag.objects.bulk_create([Tag(name=n) for n in missing], ignore_conflicts=True)
+            for name, tag_id in Tag.objects.filter(name__in=missing).values_list("name", "id"):
+                self._ids[name] = tag_id
+        ids = {}
+        for name in names:
+            if name in self._ids:
+                self._ids.move_to_end(name)
+                ids[name] = self._ids[name]
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+        return ids
+
+def _tag_names(tag_list):
+    return [t.get("name")[:TAG_NAME_MAX] for t in (tag_list or []) if t.get("name")]
+
+def _link_tags(datasets, pkgs, tag_cache):
+    """Lie les tags de toute une page: 1 résolution de noms + 1 bulk_create sur la table M2M."""
+    wanted = {ds.pk: _tag_names(pkgs[ds.ckan_id].get("tags")) for ds in datasets}
+    ids = tag_cache.resolve(name for names in wanted.values() for name in names)
+    Through = Dataset.tags.through
+    links = {
+        (ds_id, ids[name])
+        for ds_id, names in wanted.items()
+        for name in names if name in ids
+    }
+    if links:
+        Through.objects.bulk_create(
+            [Through(dataset_id=ds_id, tag_id=tag_id) for ds_id, tag_id in links],
+            ignore_conflicts=True,
+        )
+
+DATASET_UPDATE_FIELDS = ["name", "title", "notes", "org", "license", "spatial",
+                         "temporal_start", "temporal_end", "last_modified", "url", "fingerprint"]
+RESOURCE_UPDATE_FIELDS = ["name", "format", "url", "last_modified", "size"]
+
+def _dataset_defaults(pkg):
+    return {
+        "name": pkg.get("name",""),
+        "title": pkg.get("title",""),
+        "notes": pkg.get("notes") or "",
+        "org": ((pkg.get("organization") or {}).get("title")) or "",
+        "license": pkg.get("license_title") or pkg.get("license_id") or "",
+        "spatial": (pkg.get("spatial") or pkg.get("geographies") or "")[:500],
+        "temporal_start": None,
+        "temporal_end": None,
+        "last_modified": _parse_dt(pkg.get("metadata_modified")),
+        "url": pkg.get("url") or "",
+    }
+
+def _resource_defaults(res):
+    return {
+        "name": res.get("name") or "",
+        "format": (res.get("format") or "").upper()[:50],
+        "url": res.get("url") or "",
+        "last_modified": _parse_dt(res.get("last_modified")),
+        "size": res.get("size") if isinstance(res.get("size"), int) else None,
+    }
+
+def _fingerprint(pkg):
+    """
+    Empreinte sha256 de ce qu'on stocke pour un package (champs, tags, ressources),
+    normalisée (clés triées, tags/ressources ordonnés). Les champs volatils de CKAN
+    (tracking_summary, ...) n'y entrent pas.
+    """
+    doc = {
+        "dataset": _dataset_defaults(pkg),
+        "tags": sorted(_tag_names(pkg.get("tags"))),
+        "resources": sorted(
+            ([res.get("id",""), _resource_defaults(res)] for res in pkg.get("resources") or []),
+            key=lambda item: item[0],
+        ),
+    }
+    raw = json.dumps(doc, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _bulk_upsert_page(source, results, tag_cache, prune_resources=True):
+    """
+    Upsert d'une page CKAN en quelques requêtes (au lieu d'un update_or_create par ligne):
+    - 1 SELECT pour les clés (source, ckan_id) déjà connues et leur empreinte
+    - 1 INSERT ... ON CONFLICT DO UPDATE pour les datasets nouveaux ou modifiés
+    - tags: voir _link_tags (souvent 1 seule requête grâce au cache)
+    - 1 INSERT ... ON CONFLICT DO UPDATE pour les ressources
+    - 1 SELECT (+ DELETE) des ressources disparues des datasets mis à jour (prune_resources)
+    - 1 UPDATE de l'index plein texte (harvest/search.py)
+    Les packages dont l'empreinte n'a pas changé ne sont pas réécrits.
+    Retourne (créés, mis_à_jour, inchangés) pour les datasets.
+    """
+    # dédoublonnage: un même id deux fois dans un INSERT ... ON CONFLICT est refusé par Postgres
+    pkgs = {}
+    for pkg in results:
+        pkgs[pkg.get("id","")] = pkg
+    if not pkgs:
+        return 0, 0, 0
+
+    existing = dict(
+        Dataset.objects.filter(source=source, ckan_id__in=list(pkgs))
+        .values_list("ckan_id", "fingerprint")
+    )
+    fingerprints = {ckan_id: _fingerprint(pkg) for ckan_id, pkg in pkgs.items()}
+    changed = {ckan_id: pkg for ckan_id, pkg in pkgs.items() if existing.get(ckan_id) != fingerprints[ckan_id]}
+    created = sum(1 for ckan_id in changed if ckan_id not in existing)
+    updated = len(changed) - created
+    skipped = len(pkgs) - len(changed)
+    if not changed:
+        return created, updated, skipped
+    pkgs = changed
+
+    datasets = Dataset.objects.bulk_create(
+        [Dataset(source=source, ckan_id=ckan_id, fingerprint=fingerprints[ckan_id], **_dataset_defaults(pkg))
+         for ckan_id, pkg in pkgs.items()],
+        update_conflicts=True,
+        unique_fields=["source", "ckan_id"],
+        update_fields=DATASET_UPDATE_FIELDS,
+    )
+
+    _link_tags(datasets, pkgs, tag_cache)
+
+    resources = {}
+    for ds in datasets:
+        for res in pkgs[ds.ckan_id].get("resources") or []:
+            resources[(ds.pk, res.get("id",""))] = res
+    if resources:
+        Resource.objects.bulk_create(
+            [Resource(dataset_id=ds_id, ckan_id=ckan_id, **_resource_defaults(res))
+             for (ds_id, ckan_id), res in resources.items()],
+            update_conflicts=True,
+            unique_fields=["dataset", "ckan_id"],
+            update_fields=RESOURCE_UPDATE_FIELDS,
+        )
+    if prune_resources:
+        delete_stale_resources({
+            ds.pk: {res.get("id","") for res in pkgs[ds.ckan_id].get("resources") or []}
+            for ds in datasets if ds.ckan_id in existing
+        })
+    update_search_index([ds.pk for ds in datasets])
+    return created, updated, skipped
 
 def _ckan_api_url(source):
     return source.base_url.rstrip("/") + source.api_path  # ex: .../api/3/action + /package_search
 
 def _ckan_request(url, params, timeout=30):
-    # simple GET avec gestion d’erreurs réseau
-    resp = requests.get(url, params=params, timeout=timeout)
+    # GET via le client partagé (keep-alive, retries 429/5xx)
+    resp = http.get(url, params=params, timeout=timeout)
     resp.raise_for_status()
     data = resp.json()
     if not data.get("success", False):
         raise RuntimeError(f"CKAN returned success=false: {data}")
     return data.get("result") or {}
 
+def _ckan_stream(url, params, batch_size, timeout=30):
+    """
+    Variante en flux de _ckan_request: lit result.results[] au fil de la réponse et rend
+    des (lot d'au plus `batch_size` packages, count). Au moins un lot est rendu (vide si
+    la page l'est). CKAN place count avant results: sinon les packages s'accumulent
+    jusqu'à le connaître.
+    """
+    with http.get(url, params=params, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        parser = StreamingArray(resp.iter_content(STREAM_CHUNK), ("result", "results"))
+        batch, sent = [], False
+        for pkg in parser:
+            batch.append(pkg)
+            result = parser.doc.get("result") or {}
+            if len(batch) >= batch_size and "count" in result and parser.doc.get("success") is not False:
+                yield batch, result["count"] or 0
+                batch, sent = [], True
+        if not parser.doc.get("success", False):
+            raise RuntimeError(f"CKAN returned success=false: {parser.doc}")
+        if batch or not sent:
+            yield batch, (parser.doc.get("result") or {}).get("count") or 0
+
 def _build_fq(organization=None, res_format=None, license_id=None, since_iso=None):
     """
     Construit un fq (filter query) CKAN, ex:
     - organization: "min-environnement"
     - res_format: "CSV"
     - license_id: "open-government-licence-canada"
-    - since_iso (YYYY-MM-DD): metadata_modified:[2024-01-01T00:00:00Z TO *]
+    - since_iso (YYYY-MM-DD ou datetime): metadata_modified:[2024-01-01T00:00:00Z TO *]
     """
     parts = []
     if organization:
@@ -55,11 +239,100 @@ def _build_fq(organization=None, res_format=None, license_id=None, since_iso=Non
     if license_id:
         parts.append(f'license_id:"{license_id}"')
     if since_iso:
-        parts.append(f'metadata_modified:[{since_iso}T00:00:00Z TO *]')
+        parts.append(f'metadata_modified:[{_solr_dt(since_iso)} TO *]')
     return " ".join(parts) if parts else None
 
+def _resumable_sync(source, base_fq, job=None):
+    """Job --all à reprendre (voir HarvestJob.resumable) s'il visait les mêmes filtres (sinon None)."""
+    last = HarvestJob.resumable(source, "all", job)
+    if last and last.checkpoint.get("fq") == base_fq:
+        return last
+    return None
+
+def _keyset_fq(base_fq, after_id):
+    """Ajoute au fq la borne 'id > after_id' (pagination par clé, insensible aux décalages d'offset)."""
+    if not after_id:
+        return base_fq
+    cursor = f'id:{{"{after_id}" TO *]'
+    return f"{base_fq} {cursor}" if base_fq else cursor
+
+def _iter_remote_ids(url, rows=CKAN_PAGE_ROWS_MAX):
+    """
+    Tous les ids de packages du portail, pour la réconciliation: package_search réduit
+    à fl=id, parcouru par curseur sur l'id. Lève RuntimeError si la liste est incomplète
+    (moins d'ids que le count initial), pour ne jamais supprimer sur une liste tronquée.
+    """
+    after_id, seen, total = None, 0, None
+    while True:
+        params = {"q": "", "rows": rows, "start": 0, "sort": "id asc", "fl": "id"}
+        fq = _keyset_fq(None, after_id)
+        if fq:
+            params["fq"] = fq
+        result = _ckan_request(url, params)
+        results = result.get("results") or []
+        count = result.get("count") or 0
+        total = count if total is None else total
+        for pkg in results:
+            yield pkg.get("id","")
+        seen += len(results)
+        if not results or len(results) >= count:
+            break
+        after_id = max(pkg.get("id","") for pkg in results)
+    if seen < total:
+        raise RuntimeError(f"Réconciliation: {seen} ids reçus sur {total} annoncés")
+
+def _iter_pages(url, q, base_fq, rows, max_pages, incremental=False, full_sync=False, after_id=None,
+                stream_batch=0):
+    """
+    Produit les 'result' CKAN page par page (réseau seulement, aucun accès DB:
+    peut tourner dans le thread de prefetch). S'arrête sur une page vide ou
+    quand le total est atteint.
+    stream_batch > 0: chaque page est lue en flux et rendue en lots de `stream_batch`
+    packages ({"count", "results"} comme une page; --all: count = reste au début du lot).
+    """
+    page = 0
+    while full_sync or page < max_pages:
+        if full_sync:
+            start = 0
+            fq = _keyset_fq(base_fq, after_id)
+            params = {"q": q, "rows": rows, "start": 0, "sort": "id asc"}
+        else:
+            start = page * rows
+            fq = base_fq
+            params = {"q": q, "rows": rows, "start": start}
+            if incremental:
+                params["sort"] = "metadata_modified asc"  # reprise stable
+        if fq:
+            params["fq"] = fq
+        page += 1
+
+        seen, last_id = 0, None
+        if stream_batch:
+            for results, count in _ckan_stream(url, params, stream_batch):
+                yield {"count": count - seen if full_sync else count, "results": results}
+                seen += len(results)
+                last_id = max([last_id or ""] + [p.get("id","") for p in results])
+        else:
+            result = _ckan_request(url, params)
+            yield result
+            results = result.get("results") or []
+            count = result.get("count") or 0
+            seen = len(results)
+            last_id = max((p.get("id","") for p in results), default=None)
+
+        if not seen:
+            return
+        # Arrêt si on a dépassé le total
+        if full_sync:
+            if seen >= count:
+                return
+            after_id = last_id
+        elif start + rows >= count:
+            return
+
 def harvest_ckan(source: Source, q="", organization=None, res_format=None, license_id=None,
-                 since_iso=None, rows=100, max_pages=5):
+                 since_iso=None, rows=100, max_pages=5, incremental=False, full_sync=False,
+                 prefetch_depth=PREFETCH_DEPTH, stream_batch=0, job=None):
     """
     Moissonne 'max_pages' de résultats (lecture seule).
     - q: requête plein texte
@@ -68,71 +341,93 @@ def harvest_ckan(source: Source, q="", organization=None, res_format=None, licen
     - license_id: ex: 'open-government-licence-canada'
     - since_iso: 'YYYY-MM-DD' pour filtrer par metadata_modified
     - rows: éléments par page
+    - incremental: reprend après le high-water mark du dernier job réussi de la source
+      (tri metadata_modified asc, le nouveau mark est enregistré page par page)
+    - full_sync: parcourt tout le catalogue (ignore max_pages, rows <= CKAN_PAGE_ROWS_MAX),
+      tri 'id asc' + curseur sur l'id; le dernier id traité est enregistré dans job.checkpoint
+      et un job --all interrompu (échec ou Ctrl-C de moins de 24 h, processus tué sans heartbeat
+      récent, ou ce job de la file relancé) est repris là où il s'est arrêté
+    - prefetch_depth: pages récupérées d'avance par un thread de fond pendant l'écriture
+      de la page courante (0 = séquentiel)
+    - stream_batch: > 0 = réponses lues en flux et écrites par lots de `stream_batch` packages
+      (mémoire bornée par le lot et non par la taille de la page)
+    Une synchro complète non filtrée se termine par la réconciliation des suppressions
+    (datasets disparus du portail supprimés, voir services/reconcile.py).
+    - job: HarvestJob en file (harvest_worker) à exécuter au lieu d'en créer un
     """
-    rows = min(max(rows, 1), 100)  # reste pragmatique
+    rows = min(max(rows, 1), CKAN_PAGE_ROWS_MAX if full_sync else 100)  # reste pragmatique hors --all
     url = _ckan_api_url(source)
 
-    job = HarvestJob.objects.create(source=source, query=str({
+    # le mark n'a de sens que pour un moissonnage non filtré de la source
+    track_mark = incremental and not (q or organization or res_format or license_id)
+    mark = source.last_high_water_mark("ckan", "all") if incremental else None
+    since_iso = mark or since_iso
+    base_fq = _build_fq(organization, res_format, license_id, since_iso)
+
+    checkpoint = {"mode": "ckan"}
+    previous = None
+    if full_sync:
+        checkpoint = {"mode": "all", "fq": base_fq, "after_id": None, "done": 0}
+        previous = _resumable_sync(source, base_fq, job)
+        if previous:
+            checkpoint.update(after_id=previous.checkpoint.get("after_id"),
+                              done=previous.checkpoint.get("done", 0), resumed_from=previous.pk)
+            if track_mark and previous.high_water_mark:
+                mark = max(filter(None, [mark, previous.high_water_mark]))
+
+    resume = previous is not None and previous == job
+    job = HarvestJob.begin(source, job, resume, query=str({
         "q": q, "organization": organization, "res_format": res_format,
-        "license_id": license_id, "since": since_iso, "rows": rows, "max_pages": max_pages
-    }), status=HarvestJob.R)
+        "license_id": license_id, "since": str(since_iso) if since_iso else None, "rows": rows,
+        "max_pages": None if full_sync else max_pages, "incremental": incremental, "all": full_sync,
+    }), status=HarvestJob.R, high_water_mark=mark if track_mark else None, checkpoint=checkpoint)
 
+    tag_cache = TagCache()
     try:
-        imported_total = 0
+        imported_total = checkpoint.get("done", 0)
         found_total = 0
+        pages = _iter_pages(url, q, base_fq, rows, max_pages, incremental, full_sync,
+                            after_id=checkpoint.get("after_id"), stream_batch=stream_batch)
 
-        for page in range(max_pages):
-            start = page * rows
-            fq = _build_fq(organization, res_format, license_id, since_iso)
-            params = {"q": q, "rows": rows, "start": start}
-            if fq:
-                params["fq"] = fq
+        with closing(prefetch(pages, prefetch_depth)) as pages:
+            for result in pages:
+                results = result.get("results") or []
+                count = result.get("count") or 0
+                if full_sync:
+                    # avec le curseur, count = ce qui reste après after_id
+                    found_total = max(found_total, imported_total + count)
+                else:
+                    found_total = count  # total global renvoyé par CKAN
 
-            result = _ckan_request(url, params)
-            results = result.get("results") or []
-            count = result.get("count") or 0
-            found_total = count  # total global renvoyé par CKAN
-
-            if not results:
-                break
-
-            with transaction.atomic():
-                for pkg in results:
-                    ds, _created = Dataset.objects.update_or_create(
-                        source=source,
-                        ckan_id=pkg.get("id",""),
-                        defaults={
-                            "name": pkg.get("name",""),
-                            "title": pkg.get("title",""),
-                            "notes": pkg.get("notes") or "",
-                            "org": ((pkg.get("organization") or {}).get("title")) or "",
-                            "license": pkg.get("license_title") or pkg.get("license_id") or "",
-                            "spatial": (pkg.get("spatial") or pkg.get("geographies") or "")[:500],
-                            "temporal_start": None,
-                            "temporal_end": None,
-                            "last_modified": _parse_dt(pkg.get("metadata_modified")),
-                            "url": pkg.get("url") or "",
-                        }
+                if not results:
+                    break
+
+                with transaction.atomic():
+                    created, updated, skipped = _bulk_upsert_page(source, results, tag_cache)
+                imported_total += created + updated + skipped
+                job.created += created
+                job.updated += updated
+                job.skipped += skipped
+                job.imported = imported_total
+                job.found = found_total
+                job.heartbeat_at = timezone.now()
+                if track_mark:
+                    job.high_water_mark = max(
+                        filter(None, [job.high_water_mark] + [_parse_dt(p.get("metadata_modified")) for p in results]),
+                        default=None,
                     )
-                    _ensure_tags(ds, pkg.get("tags"))
-
-                    for res in pkg.get("resources") or []:
-                        Resource.objects.update_or_create(
-                            dataset=ds,
-                            ckan_id=res.get("id",""),
-                            defaults={
-                                "name": res.get("name") or "",
-                                "format": (res.get("format") or "").upper()[:50],
-                                "url": res.get("url") or "",
-                                "last_modified": _parse_dt(res.get("last_modified")),
-                                "size": res.get("size") if isinstance(res.get("size"), int) else None,
-                            }
-                        )
-                    imported_total += 1
-
-            # Arrêt si on a dépassé le total
-            if start + rows >= found_total:
-                break
+                if full_sync:
+                    checkpoint.update(after_id=max(p.get("id","") for p in results), done=imported_total)
+                    job.checkpoint = checkpoint
+                job.save(update_fields=["created", "updated", "skipped", "imported", "found",
+                                        "heartbeat_at", "high_water_mark", "checkpoint"])
+
+        if full_sync and not q and base_fq is None:
+            # tout le catalogue a été vu: ce qui n'est plus sur le portail est supprimé
+            try:
+                job.deleted = delete_orphan_datasets(source, _iter_remote_ids(url))
+            except ReconcileAborted as e:
+                job.error = str(e)  # moisson valide, suppressions non appliquées
 
         job.found = found_total
         job.imported = imported_total
@@ -140,8 +435,15 @@ def harvest_ckan(source: Source, q="", organization=None, res_format=None, licen
     except Exception as e:
         job.status = HarvestJob.F
         job.error = str(e)[:2000]
+    except BaseException as e:
+        # Ctrl-C, SystemExit (SIGTERM): échec enregistré, le prochain --all reprend le checkpoint
+        job.status = HarvestJob.F
+        job.error = f"Interrompu ({type(e).__name__})"
+        raise
     finally:
         job.ended_at = timezone.now()
         job.save()
 
+    apply_job(job)  # instantané /stats/
+    bump_data_version()  # invalide les réponses API en cache (pages déjà écrites même si échec)
     return job
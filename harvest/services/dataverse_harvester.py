@@ -1,34 +1,66 @@
 # harvest/services/dataverse_harvester.py
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from requests import HTTPError
 from urllib.parse import urljoin
 from django.db import transaction
 from django.utils import timezone
 from ..models import Source, Dataset, Resource, HarvestJob
+from ..search import update_search_index
+from ..stats import apply_job
+from ..cache import bump_data_version
+from . import http
+from .ckan_harvester import _parse_dt, _solr_dt
+from .reconcile import ReconcileAborted, delete_orphan_datasets, delete_stale_resources
 
 HEADERS = {
-    "User-Agent": "INF37407-harvest/1.0 (+https://example.com)",
+    "User-Agent": http.USER_AGENT,
     "Accept": "application/json",
 }
+FILES_CONCURRENCY = 8  # listes de fichiers récupérées en parallèle (par page de recherche)
 
 def _get_json(url, params=None, timeout=30):
-    r = requests.get(url, params=params, headers=HEADERS, timeout=timeout)
-    r.raise_for_status()
-    return r.json()
+    return http.get_json(url, params=params, headers=HEADERS, timeout=timeout)
 
 def _search_dataverse(search_url, params):
-    r = requests.get(search_url, params=params, headers=HEADERS, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return http.get_json(search_url, params=params, headers=HEADERS, timeout=30)
 
-def _upsert_items_and_files(source, items):
-    """Crée/MAJ Datasets + Resources pour une liste d'items Dataverse."""
+def _files_url(source):
+    return urljoin(source.base_url.rstrip("/") + "/", "datasets/:persistentId/versions/:latest-published/files")
+
+def _fetch_files(files_url, pid):
+    """Fichiers publiés d'un dataset (liste brute Dataverse)."""
+    fdata = _get_json(files_url, params={"persistentId": pid})
+    raw = fdata.get("data", [])
+    return raw if isinstance(raw, list) else (raw.get("files") or [])
+
+def _fetch_all_files(files_url, pids, concurrency=FILES_CONCURRENCY):
+    """
+    Récupère les listes de fichiers de plusieurs datasets en parallèle (threads, I/O réseau).
+    L'ordre de `pids` est conservé; la première erreur HTTP est relancée.
+    """
+    if concurrency <= 1 or len(pids) <= 1:
+        return [_fetch_files(files_url, pid) for pid in pids]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(pids))) as pool:
+        return list(pool.map(lambda pid: _fetch_files(files_url, pid), pids))
+
+def _upsert_items_and_files(source, items, concurrency=FILES_CONCURRENCY, job=None):
+    """
+    Crée/MAJ Datasets + Resources pour une liste d'items Dataverse.
+    Les appels réseau (fichiers) sont faits en parallèle; les écritures DB restent sur le thread appelant.
+    Si `job` est fourni, ses compteurs created/updated sont incrémentés.
+    Les fichiers qui ne sont plus publiés sont retirés des datasets mis à jour; les autres
+    ressources (liens OAI, ckan_id = URL) sont laissées à harvest_oai. L'empreinte est effacée:
+    le prochain passage OAI réécrit le dataset au lieu de le croire inchangé.
+    """
+    pids = [it.get("global_id") or it.get("identifier") or "" for it in items]   # doi:... ou handle
+    listings = _fetch_all_files(_files_url(source), pids, concurrency)
     count_imported = 0
-    for it in items:
+    dataset_ids = []
+    keep = {}
+    for it, pid, files in zip(items, pids, listings):
         title = it.get("name") or ""
-        pid = it.get("global_id") or it.get("identifier") or ""   # doi:... ou handle
         url = it.get("url") or ""
-        ds, _ = Dataset.objects.update_or_create(
+        ds, created = Dataset.objects.update_or_create(
             source=source,
             ckan_id=pid,
             defaults={
@@ -40,15 +72,19 @@ def _upsert_items_and_files(source, items):
                 "spatial": "",
                 "temporal_start": None,
                 "temporal_end": None,
-                "last_modified": None,
+                "last_modified": _parse_dt(it.get("updatedAt")),
                 "url": url,
+                "fingerprint": "",
             }
         )
-        # fichiers publiés uniquement
-        files_url = urljoin(source.base_url.rstrip("/") + "/", "datasets/:persistentId/versions/:latest-published/files")
-        fdata = _get_json(files_url, params={"persistentId": pid})
-        raw = fdata.get("data", [])
-        files = raw if isinstance(raw, list) else (raw.get("files") or [])
+        dataset_ids.append(ds.pk)
+        if job is not None:
+            if created:
+                job.created += 1
+            else:
+                job.updated += 1
+        if not created:
+            keep[ds.pk] = {str((f.get("dataFile") or {}).get("id")) for f in files}
         for f in files:
             df = f.get("dataFile") or {}
             fid = df.get("id")
@@ -67,20 +103,57 @@ def _upsert_items_and_files(source, items):
                 }
             )
         count_imported += 1
+    delete_stale_resources(keep, managed=str.isdigit)  # fichiers Dataverse: id numérique
+    update_search_index(dataset_ids)
     return count_imported
 
-def harvest_dataverse(source: Source, q: str | None = None, per_page: int = 20, max_pages: int = 2, subtree: str | None = None):
+def _iter_remote_ids(search_url, per_page=1000):
+    """
+    Identifiants (global_id) de tous les datasets publiés, pour la réconciliation.
+    Lève RuntimeError si moins d'ids que le total annoncé (liste tronquée).
+    """
+    start, total = 0, None
+    while True:
+        data = _search_dataverse(search_url, {"q": "*", "type": "dataset", "per_page": per_page,
+                                              "start": start, "sort": "date", "order": "asc"})
+        block = data.get("data") or {}
+        items = block.get("items") or []
+        if total is None:
+            total = int(block.get("total_count") or 0)
+        for it in items:
+            yield it.get("global_id") or it.get("identifier") or ""
+        start += len(items)
+        if not items or start >= total:
+            break
+    if start < total:
+        raise RuntimeError(f"Réconciliation: {start} ids reçus sur {total} annoncés")
+
+def harvest_dataverse(source: Source, q: str | None = None, per_page: int = 20, max_pages: int = 2, subtree: str | None = None,
+                      concurrency: int = FILES_CONCURRENCY, incremental: bool = False, reconcile: bool = False,
+                      job: HarvestJob | None = None):
     """
     Moissonne Borealis (Dataverse) en lecture seule.
     - source.base_url attendu: https://borealisdata.ca/api
     - q: mot-clé; si vide -> "*" (tout)
     - subtree: alias d’un dataverse (ex: "daviddeslauriers")
+    - concurrency: nb max d'appels "files" simultanés par page
+    - incremental: ne demande que les datasets dont la date de tri Solr (dateSort, rendue comme
+      published_at) dépasse le high-water mark du dernier job réussi, triés par cette date
+      croissante; le nouveau mark (max published_at) n'est enregistré qu'en fin de run.
+      Avec q ou subtree, aucun mark n'est ni lu ni enregistré (moisson partielle de la source)
+    - reconcile: (q="*" sans subtree) supprime ensuite les datasets de la source qui ne sont
+      plus publiés sur le portail (voir services/reconcile.py)
+    - job: HarvestJob en file (harvest_worker) à exécuter au lieu d'en créer un
     """
     q = q or "*"
-    job = HarvestJob.objects.create(
-        source=source,
-        query=str({"q": q, "per_page": per_page, "max_pages": max_pages, "subtree": subtree}),
-        status=HarvestJob.R
+    track_mark = incremental and q == "*" and not subtree
+    mark = source.last_high_water_mark("dataverse") if track_mark else None
+    new_mark = mark
+    job = HarvestJob.begin(
+        source, job,
+        query=str({"q": q, "per_page": per_page, "max_pages": max_pages, "subtree": subtree,
+                   "concurrency": concurrency, "incremental": incremental, "reconcile": reconcile}),
+        high_water_mark=None, checkpoint={"mode": "dataverse"},
     )
     debug = []
     try:
@@ -93,6 +166,10 @@ def harvest_dataverse(source: Source, q: str | None = None, per_page: int = 20,
         params_base = {"q": q, "type": "dataset", "per_page": per_page}
         if subtree:
             params_base["subtree"] = subtree
+        if incremental:
+            params_base.update(sort="date", order="asc")  # reprise stable
+            if mark:
+                params_base["fq"] = f"dateSort:[{_solr_dt(mark)} TO *]"
 
         try:
             for i in range(max_pages):
@@ -106,7 +183,12 @@ def harvest_dataverse(source: Source, q: str | None = None, per_page: int = 20,
                     debug.append(f"total_found={total_found}")
                 if not items:
                     break
-                imported += _upsert_items_and_files(source, items)
+                imported += _upsert_items_and_files(source, items, concurrency, job)
+                job.beat()
+                if track_mark:
+                    # même champ que le filtre/tri (dateSort), pas updatedAt
+                    new_mark = max(filter(None, [new_mark] + [_parse_dt(it.get("published_at")) for it in items]),
+                                   default=None)
                 if (i + 1) * per_page >= total_found:
                     break
 
@@ -131,12 +213,22 @@ def harvest_dataverse(source: Source, q: str | None = None, per_page: int = 20,
                     items = [it for it in items if subfrag in (it.get("url") or "")]
                     if not items:
                         continue
-                    imported += _upsert_items_and_files(source, items)
+                    imported += _upsert_items_and_files(source, items, concurrency, job)
+                    job.beat()
             else:
                 raise
 
+        if reconcile and q == "*" and not subtree:
+            try:
+                job.deleted = delete_orphan_datasets(source, _iter_remote_ids(search_url))
+                debug.append(f"deleted={job.deleted}")
+            except ReconcileAborted as e:
+                debug.append(f"WARN: {e}")  # moisson valide, suppressions non appliquées
+
         job.found = total_found
         job.imported = imported
+        if track_mark:
+            job.high_water_mark = new_mark
         job.status = HarvestJob.S
 
     except Exception as e:
@@ -148,4 +240,6 @@ def harvest_dataverse(source: Source, q: str | None = None, per_page: int = 20,
         if not job.error:
             job.error = "\n".join(debug)[:2000]
         job.save()
+    apply_job(job)  # instantané /stats/
+    bump_data_version()  # invalide les réponses API en cache (pages déjà écrites même si échec)
     return job
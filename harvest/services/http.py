@@ -0,0 +1,137 @@
+# harvest/services/http.py
+"""
+Client HTTP partagé par les moissonneurs (CKAN, Dataverse).
+- une requests.Session par hôte (keep-alive, pool de connexions)
+- Accept-Encoding gzip/deflate (+ br si brotli est installé)
+- retries avec backoff exponentiel + jitter sur 429/5xx, en respectant Retry-After
+- métriques de temps par hôte (nb de requêtes, durée cumulée/max, erreurs)
+- transport remplaçable (enregistrement / rejeu / portail synthétique, voir replay.py)
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+DEFAULT_TIMEOUT = 30
+POOL_CONNECTIONS = 4      # hôtes distincts gardés par adaptateur
+POOL_MAXSIZE = 16         # connexions simultanées par hôte (>= concurrence des threads Dataverse)
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.5       # 0.5s, 1s, 2s, 4s... (plafonné par RETRY_BACKOFF_MAX)
+RETRY_BACKOFF_MAX = 60
+RETRY_JITTER = 0.5        # secondes aléatoires ajoutées à chaque attente
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+USER_AGENT = "INF37407-harvest/1.0 (+https://example.com)"
+
+try:  # urllib3 ne décode "br" que si un module brotli est présent
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+class HttpMetrics:
+    """Compteurs de temps par hôte, partagés entre threads."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def record(self, host, seconds, ok=True):
+        with self._lock:
+            m = self._hosts.setdefault(host, {"requests": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0})
+            m["requests"] += 1
+            m["seconds"] += seconds
+            m["max_seconds"] = max(m["max_seconds"], seconds)
+            if not ok:
+                m["errors"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {host: dict(m) for host, m in self._hosts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._hosts.clear()
+
+    def summary(self):
+        """Une ligne lisible par hôte, ex: 'open.canada.ca: 12 req, 3.41s (max 0.52s), 0 err'."""
+        return [
+            f"{host}: {m['requests']} req, {m['seconds']:.2f}s (max {m['max_seconds']:.2f}s), {m['errors']} err"
+            for host, m in sorted(self.snapshot().items())
+        ]
+
+
+metrics = HttpMetrics()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_transport = None  # objet .get(url, params=, headers=, timeout=, **kwargs) utilisé à la place du réseau
+
+
+def set_transport(transport):
+    """Installe `transport` pour tous les threads (None = réseau); rend le précédent."""
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
+
+
+def _build_session():
+    retry = Retry(
+        total=RETRY_TOTAL,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        backoff_factor=RETRY_BACKOFF,
+        backoff_max=RETRY_BACKOFF_MAX,
+        backoff_jitter=RETRY_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,  # la dernière réponse est rendue; raise_for_status() lève HTTPError
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING})
+    return session
+
+
+def get_session(url):
+    """Session réutilisable pour l'hôte de `url` (créée au premier appel)."""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _build_session()
+        return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """GET via la session de l'hôte; mesure la durée (retries compris) dans `metrics`."""
+    host = urlsplit(url).netloc
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        if _transport is not None:
+            resp = _transport.get(url, params=params, headers=headers, timeout=timeout, **kwargs)
+        else:
+            resp = get_session(url).get(url, params=params, headers=headers, timeout=timeout, **kwargs)
+        ok = resp.ok
+        return resp
+    finally:
+        metrics.record(host, time.perf_counter() - t0, ok)
+
+
+def get_json(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT):
+    resp = get(url, params=params, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
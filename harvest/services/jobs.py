@@ -0,0 +1,100 @@
+# harvest/services/jobs.py
+"""
+File d'attente de moissonnage adossée à HarvestJob:
+- enqueue(): crée un job 'Pending' avec les kwargs du moissonneur (job.params)
+- claim_next(): réclame le plus ancien job en attente (SELECT ... FOR UPDATE SKIP LOCKED)
+- run_job(): l'exécute en envoyant un heartbeat périodique
+- recover_stale(): remet en file (ou marque en échec) les jobs 'Running' sans heartbeat récent
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import HarvestJob
+from .orchestrator import harvest_source
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 30   # secondes entre deux heartbeats
+STALE_AFTER = int(HarvestJob.STALE_AFTER.total_seconds())  # sans heartbeat depuis ce délai: job perdu
+MAX_ATTEMPTS = 3          # au-delà, un job perdu passe en échec au lieu d'être relancé
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(source, **params):
+    """Met en file un moissonnage de `source`; `params` = kwargs de harvest_ckan/harvest_dataverse/harvest_oai."""
+    return HarvestJob.objects.create(source=source, status=HarvestJob.P, query=str(params), params=params)
+
+
+def claim_next(worker=None):
+    """Réclame atomiquement le prochain job en attente (None si la file est vide)."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (HarvestJob.objects.select_for_update(skip_locked=True)
+               .filter(status=HarvestJob.P).order_by("id").first())
+        if job is None:
+            return None
+        job.status = HarvestJob.R
+        job.worker = worker or worker_name()
+        job.heartbeat_at = now
+        job.started_at = now
+        job.attempts += 1
+        job.save(update_fields=["status", "worker", "heartbeat_at", "started_at", "attempts"])
+    return job
+
+
+def recover_stale(stale_after=STALE_AFTER, max_attempts=MAX_ATTEMPTS):
+    """
+    Jobs bloqués en 'Running' (processus mort): ceux de la file sont remis en 'Pending' ou, après
+    `max_attempts`, passés en 'Failed'; ceux lancés hors file (manage.py harvest_*, sans worker) sont
+    passés en 'Failed' (un --all / OAI interrompu est repris par la commande suivante).
+    Un job sans heartbeat du tout (antérieur au heartbeat de HarvestJob.begin) compte depuis started_at.
+    """
+    limit = timezone.now() - datetime.timedelta(seconds=stale_after)
+    stale = HarvestJob.objects.filter(
+        Q(heartbeat_at__lt=limit) | Q(heartbeat_at__isnull=True, started_at__lt=limit), status=HarvestJob.R)
+    failed = stale.filter(Q(attempts__gte=max_attempts) | Q(worker="")).update(
+        status=HarvestJob.F, ended_at=timezone.now(), error="Abandonné: plus de heartbeat")
+    requeued = stale.filter(attempts__lt=max_attempts).exclude(worker="").update(status=HarvestJob.P, worker="")
+    return requeued, failed
+
+
+def _heartbeat(job, stop, interval):
+    try:
+        while not stop.wait(interval):
+            try:
+                job.beat()
+            except Exception:
+                # base indisponible un moment: on retente au prochain intervalle plutôt que de laisser
+                # le job paraître perdu (il serait relancé ailleurs pendant qu'il tourne encore)
+                logger.exception("Heartbeat du job %s non enregistré", job.pk)
+                connections.close_all()
+    finally:
+        connections.close_all()  # connexion propre à ce thread
+
+
+def run_job(job, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """Exécute un job réclamé; le heartbeat tourne dans un thread pendant le moissonnage."""
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(HarvestJob(pk=job.pk), stop, heartbeat_interval),
+                            name=f"harvest-heartbeat-{job.pk}", daemon=True)
+    beat.start()
+    try:
+        params = job.params or {}
+        return harvest_source(job.source, ckan_opts=params, dataverse_opts=params, oai_opts=params, job=job)
+    except Exception as e:
+        job.status = HarvestJob.F
+        job.error = str(e)[:2000]
+        job.ended_at = timezone.now()
+        job.save(update_fields=["status", "error", "ended_at"])
+        return job
+    finally:
+        stop.set()
+        beat.join()
@@ -0,0 +1,204 @@
+# harvest/services/jsonstream.py
+"""
+Lecture incrémentale d'un document JSON dont un tableau est très gros
+(ex: result.results[] de package_search CKAN).
+Les éléments du tableau ciblé sont rendus un par un au fur et à mesure du flux;
+le reste du document (count, success…) est reconstruit dans `doc`. La mémoire
+reste de l'ordre d'un élément + un morceau de flux, pas de la réponse entière.
+Chaque valeur est décodée par json (C); si elle déborde du tampon, sa fin est d'abord
+repérée par _Scanner (chaînes, échappements et profondeur suivis d'un morceau à l'autre).
+"""
+import codecs
+import json
+import re
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRUCT = re.compile(r'[\[\]{}"]')
+_STR_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r"[,\]} \t\n\r]")
+_decoder = json.JSONDecoder()
+COMPACT_AT = 1 << 16  # on jette la partie déjà lue du tampon au-delà de 64 Ko
+
+
+class _Scanner:
+    """
+    Repère la fin d'une valeur JSON lue en plusieurs morceaux, sans la décoder.
+    feed(text, i) -> position juste après la valeur dans `text`, ou None s'il faut la suite.
+    """
+    def __init__(self, first):
+        self.scalar = first not in '{["'  # nombre, true, false, null
+        self.depth = 0
+        self.in_str = False
+        self.skip = 0  # caractères à sauter au morceau suivant (échappement coupé: "\\|n")
+
+    def feed(self, text, i):
+        if self.scalar:
+            m = _SCALAR_END.search(text, i)
+            return m.start() if m else None
+        i += self.skip
+        self.skip = 0
+        while True:
+            if i >= len(text):
+                self.skip = i - len(text)
+                return None
+            if self.in_str:
+                m = _STR_END.search(text, i)
+                if m is None:
+                    return None
+                i = m.end()
+                if m.group() == "\\":
+                    i += 1
+                    continue
+                self.in_str = False
+                if self.depth == 0:
+                    return i
+            else:
+                m = _STRUCT.search(text, i)
+                if m is None:
+                    return None
+                i = m.end()
+                ch = m.group()
+                if ch == '"':
+                    self.in_str = True
+                elif ch in "[{":
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return i
+
+
+class StreamingArray:
+    """
+    parser = StreamingArray(resp.iter_content(65536), ("result", "results"))
+    for item in parser: ...      # éléments de doc["result"]["results"]
+    parser.doc                    # le reste du document, rempli au fil de la lecture
+    """
+    def __init__(self, chunks, path):
+        self.path = tuple(path)
+        self.doc = {}
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    # --- tampon ---
+    def _read(self):
+        """Morceau suivant, décodé; "" (ou la fin du décodage utf-8) en fin de flux."""
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                return text
+        self._eof = True
+        return self._utf8.decode(b"", final=True)
+
+    def _fill(self):
+        """Ajoute un morceau au tampon; False en fin de flux."""
+        if self._eof:
+            return False
+        if self._pos > COMPACT_AT:
+            self._buf, self._pos = self._buf[self._pos:], 0
+        self._buf += self._read()
+        return not self._eof
+
+    def _peek(self):
+        """Premier caractère non blanc (sans le consommer)."""
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("JSON tronqué")
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if ch not in chars:
+            raise ValueError(f"JSON invalide: {ch!r} inattendu (position {self._pos})")
+        self._pos += 1
+        return ch
+
+    def _value(self):
+        """
+        Décode la valeur suivante. Si elle dépasse le tampon, les morceaux suivants sont
+        parcourus par le scanner et mis de côté jusqu'à sa fin, puis réunis en un seul join:
+        au plus deux raw_decode par valeur, coût linéaire même pour une valeur de plusieurs Mo.
+        """
+        first = self._peek()
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+            # un nombre peut être tronqué (12|34, -1.|5): il doit être suivi d'un séparateur
+            if self._eof or (end < len(self._buf) and (first in '{["' or _SCALAR_END.match(self._buf, end))):
+                self._pos = end
+                return value
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+        scanner = _Scanner(first)
+        if scanner.feed(self._buf, self._pos) is None:
+            parts = [self._buf[self._pos:]]
+            while not self._eof:
+                text = self._read()
+                parts.append(text)
+                if scanner.feed(text, 0) is not None:
+                    break
+            self._buf, self._pos = "".join(parts), 0
+        # en fin de flux sans fin repérée: valeur finale ou JSON tronqué, raw_decode tranche
+        value, self._pos = _decoder.raw_decode(self._buf, self._pos)
+        return value
+
+    # --- parcours ---
+    def __iter__(self):
+        yield from self._walk(self.doc, None, self.path)
+        if self._peek_end():
+            return
+        raise ValueError("JSON invalide: données après le document")
+
+    def _peek_end(self):
+        try:
+            self._peek()
+        except ValueError:
+            return True
+        return False
+
+    def _walk(self, parent, key, path):
+        """Valeur courante: suit `path` dans les objets, rend les éléments du tableau au bout du chemin."""
+        ch = self._peek()
+        if not path:
+            if ch != "[":
+                self._store(parent, key, self._value())
+                return
+            self._store(parent, key, [])
+            self._pos += 1
+            if self._peek() == "]":
+                self._pos += 1
+                return
+            while True:
+                yield self._value()
+                if self._expect(",]") == "]":
+                    return
+        if ch != "{":
+            self._store(parent, key, self._value())
+            return
+        obj = self._store(parent, key, {})
+        self._pos += 1
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            name = self._value()
+            self._expect(":")
+            if name == path[0]:
+                yield from self._walk(obj, name, path[1:])
+            else:
+                obj[name] = self._value()
+            if self._expect(",}") == "}":
+                return
+
+    def _store(self, parent, key, value):
+        if parent is self.doc and key is None:
+            if isinstance(value, dict):
+                self.doc = value
+            return value
+        parent[key] = value
+        return value
@@ -0,0 +1,299 @@
+# harvest/services/oai_harvester.py
+"""
+Moissonneur OAI-PMH (verbe ListRecords): Dataverse (/oai) et CKAN avec ckanext-oaipmh.
+- une réponse contient des centaines d'enregistrements complets, au lieu d'un appel
+  search par page + un appel files par dataset (harvest_dataverse)
+- XML lu en flux (XMLPullParser, la version "push" d'iterparse): chaque <record> est
+  converti puis retiré de l'arbre, la mémoire ne dépend pas de la taille de la réponse
+- pages suivies par resumptionToken; après chaque page écrite, le jeton de la suivante est
+  enregistré dans job.checkpoint: un moissonnage en échec (ou relancé par la file) reprend
+  là où il s'est arrêté
+- from/until: fenêtre sur la datestamp; en incrémental, from = responseDate du début
+  du dernier moissonnage complet (high water mark)
+- oai_dc / oai_datacite -> package au format CKAN, écrit par _bulk_upsert_page
+  (empreinte: un enregistrement inchangé n'est pas réécrit)
+- <header status="deleted">: le dataset est supprimé
+- chaque page (écritures + jeton de reprise) est écrite dans une seule transaction
+- identifiant plus long que Dataset.ckan_id: enregistrement ignoré (compté dans job.error)
+"""
+import datetime
+import xml.etree.ElementTree as ET
+from contextlib import closing
+from urllib.parse import urlsplit
+from django.db import transaction
+from django.utils import timezone
+from ..models import Dataset, Source, HarvestJob
+from ..stats import apply_job
+from ..cache import bump_data_version
+from . import http
+from .ckan_harvester import TagCache, _bulk_upsert_page, _parse_dt, STREAM_CHUNK
+from .pipeline import prefetch, PREFETCH_DEPTH
+from .reconcile import delete_datasets
+
+OAI_PATH = "/oai"
+METADATA_PREFIXES = ("oai_dc", "oai_datacite")
+HEADERS = {
+    "User-Agent": http.USER_AGENT,
+    "Accept": "text/xml, application/xml",
+}
+_OAI = "{http://www.openarchives.org/OAI/2.0/}"
+CKAN_ID_MAX = Dataset._meta.get_field("ckan_id").max_length
+
+
+class OAIError(RuntimeError):
+    def __init__(self, code, message=""):
+        super().__init__(f"OAI-PMH {code}: {message}".strip())
+        self.code = code
+
+
+def is_oai(source):
+    return (source.api_path or "").strip().lower() == OAI_PATH
+
+
+def oai_endpoint(source):
+    """URL OAI-PMH: base_url + '/oai', ou le /oai du serveur d'une source Dataverse (.../api)."""
+    base = source.base_url.rstrip("/")
+    if not is_oai(source) and base.endswith("/api"):
+        base = base[:-len("/api")]
+    return base + OAI_PATH
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _link(value):
+    """Identifiant -> URL (doi:/hdl:/DOI nu résolus), None si ce n'en est pas une."""
+    value = value.strip()
+    lower = value.lower()
+    if lower.startswith(("http://", "https://")):
+        return value
+    if lower.startswith("doi:"):
+        return "https://doi.org/" + value[4:]
+    if lower.startswith("hdl:"):
+        return "https://hdl.handle.net/" + value[4:]
+    if value.startswith("10.") and "/" in value:
+        return "https://doi.org/" + value
+    return None
+
+
+def _package(identifier, datestamp, metadata):
+    """
+    <metadata> oai_dc ou oai_datacite -> package au format CKAN (voir _dataset_defaults).
+    Les deux formats partagent la plupart des noms locaux (title, subject, description,
+    publisher, rights, identifier…); les autres (creatorName, geoLocationPlace) sont lus en repli.
+    Ressources: liens dc:identifier / dc:relation autres que la page du dataset. Les fichiers
+    datacite (relatedIdentifier HasPart) sont ignorés: des DOI de pages d'accueil, qui
+    doubleraient les fichiers de harvest_dataverse.
+    """
+    values = {}
+    for el in metadata.iter():
+        text = (el.text or "").strip()
+        if text:
+            values.setdefault(_local(el.tag), []).append((text, el.attrib))
+
+    def first(*names):
+        for name in names:
+            if values.get(name):
+                return values[name][0][0]
+        return ""
+
+    links = [_link(text) for text, _ in values.get("identifier", [])]
+    url = next((link for link in links if link), "") or (_link(identifier) or "")
+    related = links + [_link(text) for text, _ in values.get("relation", [])]
+    resources = []
+    for link in dict.fromkeys(filter(None, related)):
+        if link != url:
+            name = urlsplit(link).path.rstrip("/").rsplit("/", 1)[-1] or link
+            resources.append({"id": link[:200], "name": name[:500], "url": link[:1000]})
+    return {
+        "id": identifier,
+        "name": identifier[:255],
+        "title": first("title")[:500],
+        "notes": "\n\n".join(text for text, _ in values.get("description", [])),
+        "organization": {"title": first("publisher", "creator", "creatorName")[:255]},
+        "license_id": first("rights")[:200],
+        "spatial": first("coverage", "geoLocationPlace"),
+        "metadata_modified": datestamp,
+        "url": url[:1000],
+        "tags": [{"name": text} for text, _ in values.get("subject", [])],
+        "resources": resources,
+    }
+
+
+def _list_records(url, params, timeout=60):
+    """
+    Une réponse ListRecords lue en flux -> {"records", "deleted", "token", "size", "response_date"}.
+    records: packages; deleted: identifiants supprimés; token: jeton de la page suivante (None = fin).
+    """
+    page = {"records": [], "deleted": [], "token": None, "size": None, "response_date": None}
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parent = None
+    with http.get(url, params=params, headers=HEADERS, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(STREAM_CHUNK):
+            parser.feed(chunk)
+            for event, el in parser.read_events():
+                if event == "start":
+                    if el.tag == _OAI + "ListRecords":
+                        parent = el
+                    continue
+                if el.tag == _OAI + "record":
+                    header = el.find(_OAI + "header")
+                    identifier = (header.findtext(_OAI + "identifier") or "").strip()
+                    if header.get("status") == "deleted":
+                        page["deleted"].append(identifier)
+                    else:
+                        metadata = el.find(_OAI + "metadata")
+                        page["records"].append(_package(
+                            identifier, (header.findtext(_OAI + "datestamp") or "").strip(),
+                            metadata if metadata is not None else ET.Element("metadata")))
+                    if parent is not None:
+                        parent.remove(el)  # libère l'enregistrement déjà converti
+                elif el.tag == _OAI + "resumptionToken":
+                    page["token"] = (el.text or "").strip() or None
+                    size = el.get("completeListSize", "")
+                    page["size"] = int(size) if size.isdigit() else None
+                elif el.tag == _OAI + "responseDate":
+                    page["response_date"] = (el.text or "").strip()
+                elif el.tag == _OAI + "error":
+                    code = el.get("code", "")
+                    if code != "noRecordsMatch":  # fenêtre vide: page vide, pas une erreur
+                        raise OAIError(code, (el.text or "").strip())
+        parser.close()
+    return page
+
+
+def _iter_pages(url, params, token=None, max_pages=None):
+    """Pages ListRecords (réseau seulement: peut tourner dans le thread de prefetch)."""
+    page = 0
+    while max_pages is None or page < max_pages:
+        result = _list_records(url, {"verb": "ListRecords", "resumptionToken": token} if token else params)
+        page += 1
+        yield result
+        token = result["token"]
+        if not token:
+            return
+
+
+def _granularity(url):
+    """Précision des dates acceptée par le dépôt (verbe Identify)."""
+    resp = http.get(url, params={"verb": "Identify"}, headers=HEADERS, timeout=30)
+    resp.raise_for_status()
+    granularity = ET.fromstring(resp.content).findtext(f".//{_OAI}granularity") or ""
+    return granularity.strip() or "YYYY-MM-DD"
+
+
+def _oai_dt(value, granularity):
+    """'YYYY-MM-DD' ou datetime -> date OAI, à la seconde si le dépôt l'accepte (UTC)."""
+    if isinstance(value, str):
+        value = _parse_dt(value)
+        if value is None:
+            raise ValueError("date attendue au format YYYY-MM-DD ou ISO 8601")
+    value = value.astimezone(datetime.timezone.utc)
+    if "hh" in granularity:
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return value.strftime("%Y-%m-%d")
+
+
+def _resumable_run(source, window, job=None):
+    """Job OAI à reprendre (voir HarvestJob.resumable) sur la même fenêtre, avec un jeton de reprise."""
+    last = HarvestJob.resumable(source, "oai", job)
+    if last and last.checkpoint.get("token") and last.checkpoint.get("window") == window:
+        return last
+    return None
+
+
+def harvest_oai(source: Source, metadata_prefix="oai_dc", set_spec=None, from_date=None, until_date=None,
+                incremental=False, max_pages=None, prefetch_depth=PREFETCH_DEPTH, endpoint=None, job=None):
+    """
+    Moissonne le dépôt OAI-PMH de `source` (lecture seule, voir oai_endpoint).
+    - metadata_prefix: oai_dc ou oai_datacite
+    - set_spec: limite à un set OAI (ex: un dataverse)
+    - from_date / until_date: 'YYYY-MM-DD' ou datetime, bornes de la datestamp
+    - incremental: from = high water mark du dernier job réussi de la source
+    - max_pages: nb max de réponses (None = jusqu'à épuisement des jetons)
+    - prefetch_depth: réponses récupérées d'avance pendant l'écriture de la page courante
+    - endpoint: URL OAI-PMH explicite (ex: CKAN + ckanext-oaipmh), sinon oai_endpoint(source)
+    Les ressources déjà connues ne sont jamais supprimées ici: oai_dc ne liste pas les
+    fichiers Dataverse (moissonnés par harvest_dataverse sur la même source).
+    - job: HarvestJob en file (harvest_worker) à exécuter au lieu d'en créer un
+    """
+    url = endpoint or oai_endpoint(source)
+    track_mark = incremental and not set_spec and not until_date
+    mark = source.last_high_water_mark("oai") if incremental else None
+    from_date = mark or from_date
+    window = {"prefix": metadata_prefix, "set": set_spec, "from": str(from_date) if from_date else None,
+              "until": str(until_date) if until_date else None}
+
+    checkpoint = {"mode": "oai", "window": window, "token": None, "done": 0, "response_date": None}
+    previous = _resumable_run(source, window, job)
+    if previous:
+        checkpoint.update(token=previous.checkpoint["token"], done=previous.checkpoint.get("done", 0),
+                          response_date=previous.checkpoint.get("response_date"), resumed_from=previous.pk)
+
+    job = HarvestJob.begin(source, job, previous is not None and previous == job, query=str(dict(window, max_pages=max_pages, incremental=incremental)),
+                           high_water_mark=None, checkpoint=checkpoint)
+    tag_cache = TagCache()
+    try:
+        params = {"verb": "ListRecords", "metadataPrefix": metadata_prefix}
+        if set_spec:
+            params["set"] = set_spec
+        if (from_date or until_date) and not checkpoint["token"]:
+            granularity = _granularity(url)
+            if from_date:
+                params["from"] = _oai_dt(from_date, granularity)
+            if until_date:
+                params["until"] = _oai_dt(until_date, granularity)
+
+        done, found, rejected, complete = checkpoint["done"], 0, 0, False
+        pages = _iter_pages(url, params, checkpoint["token"], max_pages)
+        with closing(prefetch(pages, prefetch_depth)) as pages:
+            for page in pages:
+                records = [pkg for pkg in page["records"] if len(pkg["id"]) <= CKAN_ID_MAX]
+                rejected += len(page["records"]) - len(records)
+                done += len(page["records"])
+                found = max(found, page["size"] or 0, done)
+                # page et jeton dans la même transaction: une reprise ne saute ni ne rejoue une
+                # page à moitié écrite; job n'est modifié en mémoire qu'après le commit
+                with transaction.atomic():
+                    created, updated, skipped = _bulk_upsert_page(source, records, tag_cache,
+                                                                  prune_resources=False)
+                    deleted = delete_datasets(source, page["deleted"]) if page["deleted"] else 0
+                    progress = {
+                        "created": job.created + created, "updated": job.updated + updated,
+                        "skipped": job.skipped + skipped, "deleted": job.deleted + deleted,
+                        "imported": done, "found": found, "heartbeat_at": timezone.now(),
+                        "checkpoint": dict(checkpoint, token=page["token"], done=done,
+                                           response_date=checkpoint["response_date"] or page["response_date"]),
+                    }
+                    HarvestJob.objects.filter(pk=job.pk).update(**progress)
+                for name, value in progress.items():
+                    setattr(job, name, value)
+                checkpoint = job.checkpoint
+                complete = not page["token"]
+
+        if rejected:
+            job.error = f"{rejected} enregistrements ignorés: identifiant de plus de {CKAN_ID_MAX} caractères"
+
+        if track_mark and complete:
+            # prochain from: début de ce moissonnage (les modifications pendant la lecture seront revues)
+            job.high_water_mark = _parse_dt(checkpoint["response_date"])
+        job.status = HarvestJob.S
+    except Exception as e:
+        job.status = HarvestJob.F
+        job.error = str(e)[:2000]
+        if isinstance(e, OAIError) and e.code == "badResumptionToken":
+            job.checkpoint = dict(checkpoint, token=None)  # jeton expiré: le prochain job repart du début
+    except BaseException as e:
+        # Ctrl-C, SystemExit (SIGTERM): échec enregistré, le prochain run reprend au dernier jeton
+        job.status = HarvestJob.F
+        job.error = f"Interrompu ({type(e).__name__})"
+        raise
+    finally:
+        job.ended_at = timezone.now()
+        job.save()
+
+    apply_job(job)  # instantané /stats/
+    bump_data_version()  # invalide les réponses API en cache (pages déjà écrites même si échec)
+    return job
@@ -0,0 +1,87 @@
+# harvest/services/orchestrator.py
+"""
+Moissonnage de plusieurs sources en parallèle: une source = un thread.
+Chaque portail est un hôte distinct, la durée totale devient celle de la
+source la plus lente au lieu de la somme.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connections
+from ..models import HarvestJob
+from .ckan_harvester import harvest_ckan
+from .dataverse_harvester import harvest_dataverse, FILES_CONCURRENCY
+from .oai_harvester import harvest_oai, is_oai
+
+CKAN_PATH = "/package_search"  # signature d'une source CKAN
+MAX_WORKERS = 4                # sources moissonnées simultanément
+
+
+def is_ckan(source):
+    return (source.api_path or "").strip().lower() == CKAN_PATH
+
+
+def harvest_source(source, ckan_opts=None, dataverse_opts=None, concurrency=FILES_CONCURRENCY, job=None,
+                   oai_opts=None):
+    """Lance le bon moissonneur pour `source` (CKAN, OAI-PMH ou Dataverse) et rend son HarvestJob."""
+    if is_ckan(source):
+        return harvest_ckan(source=source, job=job, **(ckan_opts or {}))
+    if is_oai(source):
+        return harvest_oai(source=source, job=job, **(oai_opts or {}))
+    opts = dict(dataverse_opts or {})
+    opts.setdefault("concurrency", concurrency)
+    return harvest_dataverse(source=source, job=job, **opts)
+
+
+def _run(source, ckan_opts, dataverse_opts, concurrency, oai_opts):
+    # thread de travail: connexion DB propre au thread, fermée à la fin
+    try:
+        return harvest_source(source, ckan_opts, dataverse_opts, concurrency, oai_opts=oai_opts)
+    finally:
+        connections.close_all()
+
+
+def harvest_sources(sources, workers=MAX_WORKERS, ckan_opts=None, dataverse_opts=None, oai_opts=None,
+                    caps=None, on_done=None):
+    """
+    Moissonne `sources` en parallèle (au plus `workers` à la fois).
+    - ckan_opts / dataverse_opts / oai_opts: kwargs passés à harvest_ckan / harvest_dataverse / harvest_oai
+    - caps: {nom_source: n} plafond d'appels simultanés vers une source Dataverse
+      (défaut FILES_CONCURRENCY; 1 = séquentiel). Une source CKAN fait au plus
+      une requête à la fois (+ prefetch).
+    - on_done: callback(source, job) appelé à la fin de chaque source
+    Rend la liste des HarvestJob (ordre de fin). Une erreur inattendue sur une
+    source est enregistrée comme job échoué sans interrompre les autres.
+    """
+    sources = list(sources)
+    caps = caps or {}
+    jobs = []
+    if not sources:
+        return jobs
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources))), thread_name_prefix="harvest") as pool:
+        futures = {
+            pool.submit(_run, src, ckan_opts, dataverse_opts, caps.get(src.name, FILES_CONCURRENCY), oai_opts): src
+            for src in sources
+        }
+        for fut in as_completed(futures):
+            src = futures[fut]
+            try:
+                job = fut.result()
+            except Exception as e:
+                job = HarvestJob.objects.create(source=src, query="harvest_all", status=HarvestJob.F,
+                                                error=str(e)[:2000])
+            jobs.append(job)
+            if on_done:
+                on_done(src, job)
+    return jobs
+
+
+def summarize(jobs):
+    """Totaux agrégés relus depuis les lignes HarvestJob."""
+    rows = list(HarvestJob.objects.filter(pk__in=[j.pk for j in jobs]).select_related("source"))
+    totals = {key: sum(getattr(j, key) for j in rows)
+              for key in ("found", "imported", "created", "updated", "skipped", "deleted")}
+    totals["jobs"] = len(rows)
+    totals["failed"] = sum(1 for j in rows if j.status == HarvestJob.F)
+    durations = [(j.ended_at - j.started_at).total_seconds() for j in rows if j.ended_at]
+    totals["slowest_seconds"] = max(durations, default=0.0)
+    totals["sum_seconds"] = sum(durations)
+    return totals
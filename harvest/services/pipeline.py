@@ -0,0 +1,61 @@
+# harvest/services/pipeline.py
+"""
+Pipeline producteur/consommateur pour les moissonneurs: un thread de fond
+récupère les pages suivantes (réseau) pendant que le thread appelant écrit
+la page courante (DB). La file est bornée: le producteur s'arrête quand il
+a `depth` pages d'avance.
+"""
+import queue
+import threading
+
+PREFETCH_DEPTH = 2  # pages récupérées d'avance
+_DONE = object()
+
+
+def _put(q, item, stop):
+    """put() bloquant qui abandonne si le consommateur s'est arrêté."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(iterable, depth=PREFETCH_DEPTH):
+    """
+    Itère `iterable` dans un thread de fond avec au plus `depth` éléments d'avance.
+    Une exception du producteur est relancée côté consommateur, au même rang.
+    depth <= 0: itération directe (séquentielle).
+    À utiliser avec contextlib.closing() pour arrêter le producteur si le consommateur échoue.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(q, (item, None), stop):
+                    return
+            _put(q, (_DONE, None), stop)
+        except BaseException as exc:  # relancée dans le thread consommateur
+            _put(q, (_DONE, exc), stop)
+
+    worker = threading.Thread(target=produce, name="harvest-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item, exc = q.get()
+            if item is _DONE:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        # pas de join(): le producteur peut être dans un appel réseau; il sort au prochain put()
+        stop.set()
@@ -0,0 +1,86 @@
+# harvest/services/reconcile.py
+"""
+Réconciliation des suppressions: ce qui a disparu du portail disparaît de la base.
+- delete_orphan_datasets(): après une synchro complète, supprime les Dataset de la source
+  dont le ckan_id n'est plus dans la liste des ids distants (flux d'ids minimal fourni
+  par le moissonneur). Différence calculée en mémoire (ensemble des ids distants,
+  clés locales lues par lots), suppression par lots (ressources/tags en cascade).
+- delete_stale_resources(): pour des datasets mis à jour, supprime les ressources
+  absentes du package reçu (seulement celles du moissonneur appelant, voir `managed`).
+- delete_datasets(): suppressions annoncées par le portail (OAI-PMH status="deleted").
+Garde-fou: si plus de MAX_DELETE_RATIO des datasets locaux devraient disparaître
+(liste distante tronquée, portail en panne…), rien n'est supprimé.
+"""
+from django.db import transaction
+from ..models import Dataset, Resource
+from ..search import update_search_index
+
+DELETE_CHUNK = 500        # lignes supprimées par requête
+READ_CHUNK = 5000         # clés locales lues par lot
+MAX_DELETE_RATIO = 0.5    # au-delà, la réconciliation est refusée (ReconcileAborted)
+
+
+class ReconcileAborted(RuntimeError):
+    pass
+
+
+def _chunks(items, size=DELETE_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _delete(pks):
+    for chunk in _chunks(pks):
+        with transaction.atomic():
+            Dataset.objects.filter(pk__in=chunk).delete()
+            update_search_index(chunk)  # retire les lignes FTS5 (SQLite)
+
+
+def delete_datasets(source, ckan_ids):
+    """Supprime les datasets de `source` dont le ckan_id est dans `ckan_ids`; rend leur nombre."""
+    pks = []
+    for chunk in _chunks(list(ckan_ids)):
+        pks.extend(Dataset.objects.filter(source=source, ckan_id__in=chunk).values_list("id", flat=True))
+    _delete(pks)
+    return len(pks)
+
+
+def delete_orphan_datasets(source, remote_ids, max_ratio=MAX_DELETE_RATIO, dry_run=False):
+    """
+    Supprime les datasets de `source` absents de `remote_ids` (itérable de ckan_id, complet).
+    Rend le nombre de datasets supprimés (ou à supprimer si dry_run).
+    """
+    remote = set(remote_ids)
+    orphans = []
+    local_total = 0
+    for pk, ckan_id in (Dataset.objects.filter(source=source).order_by()
+                        .values_list("id", "ckan_id").iterator(chunk_size=READ_CHUNK)):
+        local_total += 1
+        if ckan_id not in remote:
+            orphans.append(pk)
+    if local_total and len(orphans) > max_ratio * local_total:
+        raise ReconcileAborted(
+            f"{source.name}: {len(orphans)}/{local_total} datasets absents du portail "
+            f"(> {max_ratio:.0%}); suppression annulée par sécurité")
+    if not dry_run:
+        _delete(orphans)
+    return len(orphans)
+
+
+def delete_stale_resources(keep, managed=None):
+    """
+    `keep` = {dataset_id: {ckan_id des ressources reçues}}: supprime les autres ressources
+    de ces datasets (1 SELECT + DELETE par lots). Rend le nombre de ressources supprimées.
+    managed(ckan_id) -> bool: limite la suppression aux ressources de ce moissonneur, quand un
+    autre alimente le même dataset (fichiers Dataverse / liens OAI d'une même source).
+    """
+    if not keep:
+        return 0
+    stale = [
+        pk for pk, dataset_id, ckan_id in
+        Resource.objects.filter(dataset_id__in=list(keep)).values_list("id", "dataset_id", "ckan_id")
+        if ckan_id not in keep[dataset_id] and (managed is None or managed(ckan_id))
+    ]
+    for chunk in _chunks(stale):
+        Resource.objects.filter(pk__in=chunk).delete()
+    return len(stale)
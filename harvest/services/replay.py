@@ -0,0 +1,319 @@
+# harvest/services/replay.py
+"""
+Transports de remplacement pour http.get (voir http.set_transport):
+- Recorder: passe par le réseau et enregistre chaque réponse dans un répertoire de fixtures
+- Replayer: rejoue les fixtures sans réseau (URL + paramètres identiques requis)
+- SyntheticPortal: faux portail CKAN (package_search) + Dataverse (search, files) + OAI-PMH
+  générant à la volée un catalogue déterministe de n'importe quelle taille
+- SyntheticLinks: faux serveur de fichiers pour check_resources (httpx.MockTransport)
+Fixture = <dir>/<hôte>/<sha1 de l'URL canonique>.json: {url, params, status, content_type, body}.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlsplit
+from xml.sax.saxutils import escape
+
+import httpx
+import requests
+
+from . import http
+
+
+def _canonical(url, params=None):
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+    return f"{url}?{urlencode(items)}" if items else url
+
+
+def fixture_path(directory, url, params=None):
+    key = hashlib.sha1(_canonical(url, params).encode()).hexdigest()
+    return os.path.join(directory, urlsplit(url).netloc or "local", f"{key}.json")
+
+
+def make_response(url, status=200, body=b"", content_type="application/json", params=None):
+    """requests.Response en mémoire (json(), raise_for_status(), iter_content() fonctionnent)."""
+    resp = requests.Response()
+    resp.status_code = status
+    resp.reason = "OK" if status < 400 else "Error"
+    resp.url = _canonical(url, params)
+    resp.headers["Content-Type"] = content_type
+    resp.encoding = "utf-8"
+    resp._content = body if isinstance(body, bytes) else body.encode("utf-8")
+    resp._content_consumed = True
+    return resp
+
+
+class FixtureMissing(LookupError):
+    pass
+
+
+class Recorder:
+    """Transport réseau qui écrit chaque réponse reçue dans `directory`."""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, url, params=None, headers=None, timeout=None, **kwargs):
+        kwargs.pop("stream", None)  # le corps est lu en entier pour être enregistré
+        resp = http.get_session(url).get(url, params=params, headers=headers, timeout=timeout, **kwargs)
+        path = fixture_path(self.directory, url, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "params": params or {}, "status": resp.status_code,
+                       "content_type": resp.headers.get("Content-Type", ""),
+                       "body": resp.content.decode("utf-8", errors="replace")}, f, ensure_ascii=False)
+        return resp
+
+
+class Replayer:
+    """Transport hors ligne: rend la fixture enregistrée pour (url, params), FixtureMissing sinon."""
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            raise FixtureMissing(f"Répertoire de fixtures introuvable: {directory}")
+        self.directory = directory
+
+    def get(self, url, params=None, headers=None, timeout=None, **kwargs):
+        path = fixture_path(self.directory, url, params)
+        try:
+            with open(path, encoding="utf-8") as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            raise FixtureMissing(f"Pas de fixture pour {_canonical(url, params)} ({path})") from None
+        return make_response(url, fixture["status"], fixture["body"], fixture.get("content_type") or "", params)
+
+
+class SyntheticPortal:
+    """
+    Portail factice déterministe de `packages` jeux de données (`resources` ressources chacun).
+    Répond à .../package_search (rows/start, sort id asc + fq id:{x TO *], metadata_modified),
+    .../search (Dataverse: start/per_page, fq dateSort), .../files (persistentId) et .../oai
+    (Identify, ListRecords oai_dc/oai_datacite par `oai_page`, from, resumptionToken).
+    `deleted`: indices annoncés supprimés par OAI-PMH (header status="deleted").
+    `latency`: secondes d'attente simulées par requête.
+    """
+    FORMATS = ["CSV", "JSON", "PDF", "XLSX", "SHP", "GEOJSON", "ZIP", "XML"]
+    ORGS = [f"Organisation {i}" for i in range(40)]
+    LICENSES = ["CC-BY-4.0", "OGL-Canada-2.0", "CC0-1.0", "ODC-BY"]
+    _KEYSET = re.compile(r'id:\{"([^"]+)" TO \*\]')
+    _SINCE = re.compile(r"(?:metadata_modified|dateSort):\[(\S+) TO \*\]")
+
+    def __init__(self, packages=1000, resources=5, tags=500, seed=0, latency=0.0, oai_page=100, deleted=()):
+        self.packages = packages
+        self.oai_page = oai_page
+        self.deleted = set(deleted)
+        self.resources = resources
+        self.tags = [f"tag-{i}" for i in range(tags)]
+        self.seed = seed
+        self.latency = latency
+        self.epoch = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def get(self, url, params=None, headers=None, timeout=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        params = params or {}
+        path = urlsplit(url).path
+        if path.endswith("/package_search"):
+            data = self._package_search(params)
+        elif path.endswith("/files"):
+            data = {"status": "OK", "data": self._files(params.get("persistentId", ""))}
+        elif path.endswith("/search"):
+            data = {"status": "OK", "data": self._dataverse_search(params)}
+        elif path.endswith("/oai"):
+            return make_response(url, 200, self._oai(params).encode(), "text/xml; charset=utf-8", params)
+        else:
+            return make_response(url, 404, b'{"error": "not found"}', params=params)
+        return make_response(url, 200, json.dumps(data).encode(), params=params)
+
+    # --- catalogue ---
+    def _modified(self, i):
+        return self.epoch + datetime.timedelta(minutes=i)
+
+    def _first_index(self, fq):
+        """Premier indice satisfaisant les bornes 'id >' / 'date >=' du fq (ids et dates croissent avec i)."""
+        first = 0
+        keyset = self._KEYSET.search(fq or "")
+        if keyset:
+            first = max(first, int(keyset.group(1).rsplit("-", 1)[-1]) + 1)
+        since = self._SINCE.search(fq or "")
+        if since:
+            when = datetime.datetime.fromisoformat(since.group(1).replace("Z", "+00:00"))
+            first = max(first, -(-int((when - self.epoch).total_seconds()) // 60))
+        return min(max(first, 0), self.packages)
+
+    def _package(self, i):
+        rnd = random.Random(self.seed * 1_000_003 + i)
+        modified = self._modified(i).strftime("%Y-%m-%dT%H:%M:%S.%f")
+        return {
+            "id": f"pkg-{i:08d}",
+            "name": f"jeu-de-donnees-{i}",
+            "title": f"Jeu de données synthétique {i}",
+            "notes": " ".join(rnd.choice(self.tags) for _ in range(rnd.randint(20, 200))),
+            "organization": {"title": rnd.choice(self.ORGS)},
+            "license_id": rnd.choice(self.LICENSES),
+            "metadata_modified": modified,
+            "url": f"https://example.org/dataset/{i}",
+            "tags": [{"name": name} for name in rnd.sample(self.tags, min(len(self.tags), rnd.randint(2, 8)))],
+            "resources": [
+                {"id": f"res-{i:08d}-{j}", "name": f"Ressource {j}", "format": rnd.choice(self.FORMATS),
+                 "url": f"https://example.org/dataset/{i}/resource/{j}", "last_modified": modified,
+                 "size": rnd.randint(1_000, 50_000_000)}
+                for j in range(self.resources)
+            ],
+        }
+
+    def _package_search(self, params):
+        rows = int(params.get("rows", 10))
+        first = self._first_index(params.get("fq"))
+        start = first + int(params.get("start", 0))
+        remaining = self.packages - first
+        results = [self._package(i) for i in range(start, min(self.packages, start + rows))]
+        return {"help": "synthetic", "success": True,
+                "result": {"count": remaining, "sort": params.get("sort", ""), "results": results}}
+
+    def _dataverse_search(self, params):
+        per_page = int(params.get("per_page", 10))
+        first = self._first_index(params.get("fq"))
+        start = first + int(params.get("start", 0))
+        items = [
+            {"type": "dataset", "global_id": f"doi:10.5072/SYN/{i:08d}", "name": f"Jeu de données synthétique {i}",
+             "url": f"https://example.org/dataset.xhtml?persistentId=doi:10.5072/SYN/{i:08d}",
+             "publisher": self.ORGS[i % len(self.ORGS)],
+             "published_at": self._modified(i).strftime("%Y-%m-%dT%H:%M:%SZ"),
+             "updatedAt": self._modified(i).strftime("%Y-%m-%dT%H:%M:%SZ")}
+            for i in range(start, min(self.packages, start + per_page))
+        ]
+        return {"total_count": self.packages - first, "start": start, "items": items}
+
+    # --- OAI-PMH ---
+    def _oai(self, params):
+        now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        head = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><responseDate>{now}</responseDate>')
+        verb = params.get("verb")
+        if verb == "Identify":
+            return head + ("<Identify><repositoryName>Synthétique</repositoryName>"
+                           "<granularity>YYYY-MM-DDThh:mm:ssZ</granularity></Identify></OAI-PMH>")
+        if verb != "ListRecords":
+            return head + '<error code="badVerb">verbe non géré</error></OAI-PMH>'
+        token = params.get("resumptionToken")
+        if token:
+            prefix, _, start = token.partition(":")
+            if not start.isdigit():
+                return head + '<error code="badResumptionToken">jeton invalide</error></OAI-PMH>'
+        else:
+            prefix = params.get("metadataPrefix", "oai_dc")
+            since = params.get("from")
+            start = self._first_index(f"dateSort:[{since} TO *]" if since else None)
+        start = int(start)
+        stop = min(self.packages, start + self.oai_page)
+        if start >= stop:
+            return head + '<error code="noRecordsMatch">aucun enregistrement</error></OAI-PMH>'
+        records = "".join(self._oai_record(i, prefix) for i in range(start, stop))
+        remaining = self.packages - stop
+        next_token = f"{prefix}:{stop}" if remaining else ""
+        return (head + f"<ListRecords>{records}<resumptionToken completeListSize=\"{self.packages}\" "
+                f"cursor=\"{start}\">{next_token}</resumptionToken></ListRecords></OAI-PMH>")
+
+    def _oai_record(self, i, prefix):
+        pid = f"doi:10.5072/SYN/{i:08d}"
+        stamp = self._modified(i).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if i in self.deleted:
+            return (f'<record><header status="deleted"><identifier>{pid}</identifier>'
+                    f"<datestamp>{stamp}</datestamp></header></record>")
+        pkg = self._package(i)
+        if prefix == "oai_datacite":
+            metadata = (
+                '<resource xmlns="http://datacite.org/schema/kernel-4">'
+                f'<identifier identifierType="DOI">{pid[4:]}</identifier>'
+                f"<creators><creator><creatorName>{escape(pkg['organization']['title'])}</creatorName></creator></creators>"
+                f"<titles><title>{escape(pkg['title'])}</title></titles>"
+                f"<publisher>{escape(pkg['organization']['title'])}</publisher>"
+                "<subjects>" + "".join(f"<subject>{escape(t['name'])}</subject>" for t in pkg["tags"]) + "</subjects>"
+                f'<descriptions><description descriptionType="Abstract">{escape(pkg["notes"])}</description></descriptions>'
+                f"<rightsList><rights>{escape(pkg['license_id'])}</rights></rightsList>"
+                "<relatedIdentifiers>" + "".join(
+                    f'<relatedIdentifier relatedIdentifierType="DOI" relationType="HasPart">{pid[4:]}/F{j}</relatedIdentifier>'
+                    for j in range(self.resources)) + "</relatedIdentifiers></resource>")
+        else:
+            metadata = (
+                '<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" '
+                'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                f"<dc:title>{escape(pkg['title'])}</dc:title>"
+                f"<dc:creator>{escape(pkg['organization']['title'])}</dc:creator>"
+                + "".join(f"<dc:subject>{escape(t['name'])}</dc:subject>" for t in pkg["tags"])
+                + f"<dc:description>{escape(pkg['notes'])}</dc:description>"
+                f"<dc:publisher>{escape(pkg['organization']['title'])}</dc:publisher>"
+                f"<dc:identifier>https://doi.org/{pid[4:]}</dc:identifier>"
+                f"<dc:rights>{escape(pkg['license_id'])}</dc:rights>"
+                + "".join(f"<dc:relation>{escape(res['url'])}</dc:relation>" for res in pkg["resources"])
+                + "</oai_dc:dc>")
+        return (f"<record><header><identifier>{escape(pid)}</identifier><datestamp>{stamp}</datestamp>"
+                f"<setSpec>syn</setSpec></header><metadata>{metadata}</metadata></record>")
+
+    def _files(self, pid):
+        i = int(pid.rsplit("/", 1)[-1] or 0)
+        rnd = random.Random(self.seed * 1_000_003 + i)
+        return [
+            {"label": f"fichier-{j}.csv",
+             "dataFile": {"id": i * 1000 + j, "filesize": rnd.randint(1_000, 50_000_000),
+                          "contentType": "text/csv", "persistentId": f"{pid}/F{j}"}}
+            for j in range(self.resources)
+        ]
+
+
+class SyntheticLinks:
+    """
+    Serveur de fichiers factice pour linkcheck: httpx.MockTransport(SyntheticLinks()).
+    Réponse déterministe par URL: 1 sur `broken_every` en 404, 1 sur `head_refused_every`
+    refuse HEAD (405, puis GET partiel en 206), les autres 200 avec Content-Length/Type.
+    """
+    TYPES = ["text/csv", "application/json", "application/pdf", "application/zip", "application/xml"]
+
+    def __init__(self, broken_every=10, head_refused_every=7, latency=0.0):
+        self.broken_every = broken_every
+        self.head_refused_every = head_refused_every
+        self.latency = latency
+
+    async def __call__(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        h = int(hashlib.sha1(str(request.url).encode()).hexdigest()[:8], 16)
+        if h % self.broken_every == 0:
+            return httpx.Response(404)
+        if request.method == "HEAD" and h % self.head_refused_every == 0:
+            return httpx.Response(405)
+        size = 1_000 + h % 50_000_000
+        content_type = self.TYPES[h % len(self.TYPES)]
+        if request.method == "GET" and "range" in request.headers:
+            return httpx.Response(206, content=b"\0", headers={
+                "Content-Type": content_type, "Content-Range": f"bytes 0-0/{size}"})
+        return httpx.Response(200, headers={"Content-Type": content_type, "Content-Length": str(size)})
+
+
+@contextmanager
+def use_transport(transport):
+    """Installe `transport` le temps du bloc (None = ne change rien)."""
+    if transport is None:
+        yield None
+        return
+    previous = http.set_transport(transport)
+    try:
+        yield transport
+    finally:
+        http.set_transport(previous)
+
+
+def transport_from_options(record=None, replay=None):
+    """Options --record DIR / --replay DIR des commandes de moissonnage -> transport (ou None)."""
+    if record and replay:
+        raise ValueError("--record et --replay sont exclusifs")
+    if record:
+        return Recorder(record)
+    if replay:
+        return Replayer(replay)
+    return None
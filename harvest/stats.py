@@ -0,0 +1,102 @@
+# harvest/stats.py
+"""
+Statistiques de la page /stats/, lues depuis un instantané (StatsSnapshot)
+au lieu de COUNT(*)/GROUP BY à chaque affichage.
+- refresh_stats(): recalcul complet (commande refresh_stats, ou instantané plus vieux que le TTL)
+- apply_job(job): ajustement à la fin de chaque moissonnage, réussi ou non (pages validées)
+- get_stats(): instantané courant, recalculé s'il est absent ou périmé
+"""
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Dataset, Resource, Tag, HarvestJob, StatsSnapshot
+
+SNAPSHOT_ID = 1
+TOP_N = 10
+MONTHS = 24
+
+
+def _ttl():
+    return getattr(settings, "HARVEST_STATS_TTL", 3600)  # secondes
+
+
+def _rows(qs, key):
+    return [{"name": row[key] or "Inconnue", "count": row["count"]} for row in qs]
+
+
+def compute_stats():
+    """Toutes les requêtes d'agrégat, en un seul passage."""
+    since = timezone.now() - datetime.timedelta(days=31 * MONTHS)
+    last_harvest = HarvestJob.objects.aggregate(Max("ended_at"))["ended_at__max"]
+    return {
+        "total_datasets": Dataset.objects.count(),
+        "total_resources": Resource.objects.count(),
+        "total_tags": Tag.objects.count(),
+        "last_harvest": last_harvest.isoformat() if last_harvest else None,
+        "by_source": _rows(Dataset.objects.values("source__name").annotate(count=Count("id")).order_by("-count"),
+                           "source__name"),
+        "by_format": _rows(Resource.objects.exclude(format="").values("format")
+                           .annotate(count=Count("id")).order_by("-count")[:TOP_N], "format"),
+        "by_license": _rows(Dataset.objects.exclude(license="").values("license")
+                            .annotate(count=Count("id")).order_by("-count")[:TOP_N], "license"),
+        "by_month": [
+            {"name": row["month"].strftime("%Y-%m"), "count": row["count"]}
+            for row in Dataset.objects.filter(last_modified__gte=since)
+            .annotate(month=TruncMonth("last_modified")).values("month")
+            .annotate(count=Count("id")).order_by("month")
+        ],
+        "top_tags": _rows(Dataset.tags.through.objects.values("tag__name")
+                          .annotate(count=Count("dataset_id")).order_by("-count")[:TOP_N], "tag__name"),
+    }
+
+
+def refresh_stats():
+    now = timezone.now()
+    snap, _ = StatsSnapshot.objects.update_or_create(
+        pk=SNAPSHOT_ID, defaults={"data": compute_stats(), "computed_at": now, "updated_at": now})
+    return snap
+
+
+def get_stats(ttl=None):
+    """Instantané courant (recalcul complet s'il n'existe pas ou date de plus de `ttl` secondes)."""
+    ttl = _ttl() if ttl is None else ttl
+    snap = StatsSnapshot.objects.filter(pk=SNAPSHOT_ID).first()
+    if snap is None or snap.computed_at < timezone.now() - datetime.timedelta(seconds=ttl):
+        snap = refresh_stats()
+    return snap
+
+
+def apply_job(job):
+    """
+    Ajuste l'instantané avec les compteurs d'un job terminé, même en échec (ses pages sont
+    validées): total et répartition par source (+created -deleted, sans COUNT), date du dernier
+    moissonnage; si le job a écrit quelque chose, totaux de ressources et de tags recomptés
+    (un dataset mis à jour peut en gagner ou en perdre). Les autres répartitions attendent
+    le prochain recalcul complet.
+    """
+    delta = job.created - job.deleted
+    changed = job.created or job.updated or job.deleted
+    with transaction.atomic():
+        snap = StatsSnapshot.objects.select_for_update().filter(pk=SNAPSHOT_ID).first()
+        if snap is None:
+            return None  # sera calculé au premier affichage
+        data = snap.data
+        data["total_datasets"] = max(0, data.get("total_datasets", 0) + delta)
+        rows = data.setdefault("by_source", [])
+        row = next((r for r in rows if r["name"] == job.source.name), None)
+        if row is None:
+            rows.append({"name": job.source.name, "count": max(0, delta)})
+        else:
+            row["count"] = max(0, row["count"] + delta)
+        rows.sort(key=lambda r: -r["count"])
+        if changed:
+            data["total_resources"] = Resource.objects.count()
+            data["total_tags"] = Tag.objects.count()
+        if job.ended_at:
+            data["last_harvest"] = max(filter(None, [data.get("last_harvest"), job.ended_at.isoformat()]))
+        snap.updated_at = timezone.now()
+        snap.save(update_fields=["data", "updated_at"])
+    return snap
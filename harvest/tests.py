@@ -1,3 +1,963 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import closing
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from . import analytics
+from .cache import bump_data_version
+from .filters import parse_when
+from .models import Dataset, HarvestJob, Resource, Source, Tag
+from .renderers import FastJSONRenderer
+from .search import search_datasets, update_search_index
+from .serializers import DatasetSerializer, dataset_values, serialize_dataset_rows
+from .services import ckan_harvester, http, jobs, oai_harvester, orchestrator
+from .services.ckan_harvester import TagCache, _fingerprint, harvest_ckan
+from .services.dataverse_harvester import harvest_dataverse
+from .services.jsonstream import StreamingArray
+from .services.linkcheck import check_resources
+from .services.oai_harvester import harvest_oai
+from .services.orchestrator import harvest_sources, summarize
+from .services.pipeline import prefetch
+from .services.reconcile import ReconcileAborted, delete_orphan_datasets
+from .services.replay import Replayer, SyntheticLinks, SyntheticPortal, fixture_path, use_transport
+from .stats import get_stats, refresh_stats
+
+CKAN_URL = "https://portail.test/api/3/action"
+DATAVERSE_URL = "https://dataverse.test/api"
+
+# pas de manifest staticfiles en test (API navigable)
+TEST_STORAGES = {"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}}
+
+
+def failing_on(call, target, exc=RuntimeError("panne simulée")):
+    """Remplace `target` (écriture d'une page) par une version qui lève `exc` au `call`-ième appel."""
+    calls = {"n": 0}
+
+    def wrapper(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == call:
+            raise exc
+        return target(*args, **kwargs)
+    return wrapper
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+
+    def harvest(self, transport, **opts):
+        with use_transport(transport):
+            return harvest_ckan(self.source, **opts)
+
+    def record(self, portal, directory):
+        """Transport qui écrit chaque réponse de `portal` en fixture (comme Recorder, sans réseau)."""
+        class Recording:
+            def get(self, url, params=None, **kwargs):
+                resp = portal.get(url, params, **kwargs)
+                path = fixture_path(directory, url, params)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump({"url": url, "params": params or {}, "status": resp.status_code,
+                               "content_type": resp.headers["Content-Type"], "body": resp.text}, f)
+                return resp
+        return Recording()
+
+    def test_replayed_fixtures_give_same_harvest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.harvest(self.record(SyntheticPortal(packages=8, resources=1), directory), rows=5, max_pages=2)
+            Dataset.objects.all().delete()
+            job = self.harvest(Replayer(directory), rows=5, max_pages=2)
+        self.assertEqual((job.status, job.created), (HarvestJob.S, 8))
+
+    def test_missing_fixture_fails_the_job(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.harvest(self.record(SyntheticPortal(packages=8, resources=1), directory), rows=5, max_pages=1)
+            job = self.harvest(Replayer(directory), rows=5, max_pages=2)
+        self.assertEqual(job.status, HarvestJob.F)
+        self.assertIn("Pas de fixture", job.error)
+        self.assertEqual(Dataset.objects.count(), 5)  # la première page rejouée est écrite
+
+
+class CkanHarvestTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+
+    def harvest(self, portal, **opts):
+        with use_transport(portal):
+            return harvest_ckan(self.source, **opts)
+
+    def test_bulk_upsert_creates_then_updates_in_place(self):
+        portal = SyntheticPortal(packages=25, resources=2)
+        job = self.harvest(portal, rows=10, max_pages=3)
+        self.assertEqual(job.status, HarvestJob.S)
+        self.assertEqual((job.found, job.imported, job.created, job.updated), (25, 25, 25, 0))
+        self.assertEqual(Resource.objects.count(), 50)
+        ds = Dataset.objects.get(ckan_id="pkg-00000007")
+        self.assertEqual((ds.name, ds.title), ("jeu-de-donnees-7", "Jeu de données synthétique 7"))
+        self.assertEqual(ds.resources.count(), 2)
+
+        Dataset.objects.update(fingerprint="", title="modifié localement")
+        job = self.harvest(portal, rows=10, max_pages=3)
+        self.assertEqual((job.created, job.updated), (0, 25))
+        self.assertEqual((Dataset.objects.count(), Resource.objects.count()), (25, 50))
+        self.assertFalse(Dataset.objects.filter(title="modifié localement").exists())
+
+    def test_unchanged_packages_skipped_by_fingerprint(self):
+        portal = SyntheticPortal(packages=25, resources=2)
+        self.harvest(portal, rows=10, max_pages=3)
+        self.assertFalse(Dataset.objects.filter(fingerprint="").exists())
+        Dataset.objects.filter(ckan_id="pkg-00000003").update(fingerprint="")
+        job = self.harvest(portal, rows=10, max_pages=3)
+        self.assertEqual((job.created, job.updated, job.skipped, job.imported), (0, 1, 24, 25))
+
+    def test_fingerprint_ignores_volatile_fields_and_order(self):
+        pkg = SyntheticPortal(resources=3)._package(1)
+        same = dict(pkg, tracking_summary={"total": 12}, tags=pkg["tags"][::-1], resources=pkg["resources"][::-1])
+        self.assertEqual(_fingerprint(same), _fingerprint(pkg))
+        changed = dict(pkg, resources=[dict(pkg["resources"][0], size=1)] + pkg["resources"][1:])
+        self.assertNotEqual(_fingerprint(changed), _fingerprint(pkg))
+
+    def interrupted_sync(self, portal, exc):
+        with mock.patch.object(ckan_harvester, "_bulk_upsert_page",
+                               failing_on(2, ckan_harvester._bulk_upsert_page, exc)):
+            return self.harvest(portal, rows=10, full_sync=True, prefetch_depth=0)
+
+    def test_full_sync_resumes_failed_job(self):
+        portal = SyntheticPortal(packages=30, resources=1)
+        failed = self.interrupted_sync(portal, RuntimeError("panne simulée"))
+        self.assertEqual(failed.status, HarvestJob.F)
+        self.assertEqual(failed.checkpoint["after_id"], "pkg-00000009")
+
+        job = self.harvest(portal, rows=10, full_sync=True, prefetch_depth=0)
+        self.assertEqual(job.status, HarvestJob.S)
+        self.assertEqual(job.checkpoint["resumed_from"], failed.pk)
+        self.assertEqual((job.found, job.created, job.imported), (30, 20, 30))
+        self.assertEqual(Dataset.objects.count(), 30)
+
+    def test_full_sync_resumes_after_ctrl_c(self):
+        portal = SyntheticPortal(packages=30, resources=1)
+        with self.assertRaises(KeyboardInterrupt):
+            self.interrupted_sync(portal, KeyboardInterrupt())
+        interrupted = HarvestJob.objects.get()
+        self.assertEqual(interrupted.status, HarvestJob.F)
+        self.assertIsNotNone(interrupted.ended_at)
+        self.assertEqual(interrupted.error, "Interrompu (KeyboardInterrupt)")
+
+        job = self.harvest(portal, rows=10, full_sync=True, prefetch_depth=0)
+        self.assertEqual((job.checkpoint["resumed_from"], job.created), (interrupted.pk, 20))
+
+    def test_killed_sync_resumed_once_heartbeat_is_stale(self):
+        portal = SyntheticPortal(packages=30, resources=1)
+        self.interrupted_sync(portal, RuntimeError("panne simulée"))
+        # processus tué (OOM, SIGKILL): le job reste 'Running' avec son dernier heartbeat
+        killed = HarvestJob.objects.get()
+        HarvestJob.objects.filter(pk=killed.pk).update(status=HarvestJob.R, ended_at=None,
+                                                       heartbeat_at=timezone.now())
+        self.assertIsNone(ckan_harvester._resumable_sync(self.source, None))
+
+        HarvestJob.objects.filter(pk=killed.pk).update(
+            heartbeat_at=timezone.now() - HarvestJob.STALE_AFTER - datetime.timedelta(seconds=1))
+        job = self.harvest(portal, rows=10, full_sync=True, prefetch_depth=0)
+        self.assertEqual((job.status, job.checkpoint["resumed_from"], job.created), (HarvestJob.S, killed.pk, 20))
+        self.assertEqual(HarvestJob.objects.get(pk=killed.pk).status, HarvestJob.F)
+
+    def test_running_success_or_old_job_is_not_resumed(self):
+        checkpoint = {"mode": "all", "fq": None, "after_id": "pkg-00000009", "done": 10}
+        other = HarvestJob.objects.create(source=self.source, query="", status=HarvestJob.R,
+                                          heartbeat_at=timezone.now(), checkpoint=checkpoint)
+        self.assertIsNone(ckan_harvester._resumable_sync(self.source, None))
+        other.status, other.ended_at = HarvestJob.S, timezone.now()
+        other.save()
+        self.assertIsNone(ckan_harvester._resumable_sync(self.source, None))
+        other.status, other.ended_at = HarvestJob.F, timezone.now() - datetime.timedelta(days=2)
+        other.save()
+        self.assertIsNone(ckan_harvester._resumable_sync(self.source, None))
+        other.ended_at = timezone.now()
+        other.save()
+        self.assertEqual(ckan_harvester._resumable_sync(self.source, None), other)
+
+    def test_streamed_pages_match_plain_pages(self):
+        job = self.harvest(SyntheticPortal(packages=12, resources=3), rows=5, max_pages=3, stream_batch=4)
+        self.assertEqual((job.status, job.found, job.created), (HarvestJob.S, 12, 12))
+        self.assertEqual(Resource.objects.count(), 36)
+
+    def test_withdrawn_resources_are_pruned_on_update(self):
+        self.harvest(SyntheticPortal(packages=5, resources=3), rows=10, max_pages=1)
+        job = self.harvest(SyntheticPortal(packages=5, resources=1), rows=10, max_pages=1)
+        self.assertEqual(job.updated, 5)
+        self.assertEqual(set(Resource.objects.values_list("ckan_id", flat=True)),
+                         {f"res-{i:08d}-0" for i in range(5)})
+
+
+class TagCacheTests(TestCase):
+    def test_missing_names_created_once_then_served_from_cache(self):
+        Tag.objects.create(name="eau")
+        cache = TagCache(maxsize=3)
+        with self.assertNumQueries(2):  # INSERT des absents + relecture
+            ids = cache.resolve(["eau", "sol", "", "sol"])
+        self.assertEqual(ids, dict(Tag.objects.values_list("name", "id")))
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.resolve(["sol"]), {"sol": ids["sol"]})
+        cache.resolve(["a", "b", "c"])  # LRU: "eau" et "sol" sortent
+        with self.assertNumQueries(2):
+            cache.resolve(["eau"])
+
+    def test_harvest_links_page_tags(self):
+        portal = SyntheticPortal(packages=10, resources=1, tags=15)
+        with use_transport(portal):
+            harvest_ckan(Source.objects.create(name="Portail", base_url=CKAN_URL), rows=10, max_pages=1)
+        ds = Dataset.objects.get(ckan_id="pkg-00000004")
+        self.assertEqual(set(ds.tags.values_list("name", flat=True)),
+                         {t["name"] for t in portal._package(4)["tags"]})
+        self.assertLessEqual(Tag.objects.count(), 15)
+
+
+class InFlight:
+    """Transport qui compte les requêtes simultanées vers `portal` (latence simulée)."""
+    def __init__(self, portal, latency=0.02):
+        self.portal, self.latency = portal, latency
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def get(self, url, params=None, **kwargs):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        try:
+            time.sleep(self.latency)
+            return self.portal.get(url, params, **kwargs)
+        finally:
+            with self.lock:
+                self.current -= 1
+
+
+class DataverseHarvestTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Dataverse", base_url=DATAVERSE_URL, api_path="/search")
+
+    def test_file_listings_fetched_concurrently_within_bound(self):
+        transport = InFlight(SyntheticPortal(packages=12, resources=2))
+        with use_transport(transport):
+            job = harvest_dataverse(self.source, per_page=12, max_pages=1, concurrency=4)
+        self.assertEqual((job.status, job.imported, job.created), (HarvestJob.S, 12, 12))
+        self.assertEqual(transport.peak, 4)
+        # chaque dataset reçoit ses propres fichiers malgré l'ordre d'arrivée des réponses
+        for ds in Dataset.objects.all():
+            self.assertEqual(sorted(ds.resources.values_list("url", flat=True)),
+                             [f"{ds.ckan_id}/F0", f"{ds.ckan_id}/F1"])
+
+    def test_sequential_when_concurrency_is_one(self):
+        transport = InFlight(SyntheticPortal(packages=5, resources=1), latency=0)
+        with use_transport(transport):
+            job = harvest_dataverse(self.source, per_page=5, max_pages=1, concurrency=1)
+        self.assertEqual((job.status, transport.peak), (HarvestJob.S, 1))
+        self.assertEqual(Resource.objects.count(), 5)
+
+
+class HttpClientTests(TestCase):
+    def setUp(self):
+        http.metrics.reset()
+        self.addCleanup(http.close_sessions)
+
+    def test_one_pooled_session_per_host(self):
+        session = http.get_session("https://a.test/api/3/action/package_search")
+        self.assertIs(http.get_session("https://a.test/autre"), session)
+        self.assertIsNot(http.get_session("https://b.test/"), session)
+        self.assertEqual(session.headers["User-Agent"], http.USER_AGENT)
+        self.assertIn("gzip", session.headers["Accept-Encoding"])
+        retry = session.get_adapter("https://a.test/").max_retries
+        self.assertEqual((retry.total, tuple(retry.status_forcelist)), (http.RETRY_TOTAL, http.RETRY_STATUSES))
+
+    def test_metrics_per_host(self):
+        with use_transport(SyntheticPortal(packages=3)):
+            http.get_json(CKAN_URL + "/package_search", params={"rows": 1})
+            self.assertEqual(http.get("https://portail.test/inconnu").status_code, 404)
+        m = http.metrics.snapshot()["portail.test"]
+        self.assertEqual((m["requests"], m["errors"]), (2, 1))
+        self.assertTrue(http.metrics.summary()[0].startswith("portail.test: 2 req"))
+
+
+class IncrementalHarvestTests(TestCase):
+    EPOCH = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)  # SyntheticPortal: package i modifié à EPOCH + i min
+
+    def test_ckan_mark_limits_next_run(self):
+        source = Source.objects.create(name="Portail", base_url=CKAN_URL)
+        with use_transport(SyntheticPortal(packages=10, resources=1)):
+            first = harvest_ckan(source, rows=10, max_pages=5, incremental=True)
+        self.assertEqual(first.high_water_mark, self.EPOCH + datetime.timedelta(minutes=9))
+        with use_transport(SyntheticPortal(packages=14, resources=1)):
+            job = harvest_ckan(source, rows=10, max_pages=5, incremental=True)
+        # bornes incluses: le dernier package déjà vu est relu (inchangé)
+        self.assertEqual((job.found, job.created, job.skipped), (5, 4, 1))
+        self.assertEqual(job.high_water_mark, self.EPOCH + datetime.timedelta(minutes=13))
+
+    def test_dataverse_mark_from_published_at(self):
+        source = Source.objects.create(name="Dataverse", base_url=DATAVERSE_URL, api_path="/search")
+        with use_transport(SyntheticPortal(packages=6, resources=1)):
+            first = harvest_dataverse(source, per_page=10, max_pages=1, incremental=True)
+        self.assertEqual(first.high_water_mark, self.EPOCH + datetime.timedelta(minutes=5))
+        with use_transport(SyntheticPortal(packages=8, resources=1)):
+            job = harvest_dataverse(source, per_page=10, max_pages=1, incremental=True)
+        self.assertEqual((job.found, job.created, job.updated), (3, 2, 1))
+
+    def test_dataverse_partial_run_ignores_mark(self):
+        source = Source.objects.create(name="Dataverse", base_url=DATAVERSE_URL, api_path="/search")
+        portal = SyntheticPortal(packages=6, resources=1)
+        with use_transport(portal):
+            harvest_dataverse(source, per_page=10, max_pages=1, incremental=True)
+            job = harvest_dataverse(source, q="synthétique", per_page=10, max_pages=1, incremental=True)
+        self.assertEqual((job.status, job.found, job.high_water_mark), (HarvestJob.S, 6, None))
+        self.assertEqual(source.last_high_water_mark("dataverse"), self.EPOCH + datetime.timedelta(minutes=5))
+
+
+class PrefetchTests(TestCase):
+    def test_order_kept_and_producer_bounded(self):
+        produced = []
+
+        def pages():
+            for i in range(10):
+                produced.append(i)
+                yield i
+
+        with closing(prefetch(pages(), depth=2)) as it:
+            self.assertEqual(next(it), 0)
+            time.sleep(0.1)
+            self.assertLessEqual(len(produced), 4)  # 1 consommé + 2 en file + 1 en attente de place
+            self.assertEqual(list(it), list(range(1, 10)))
+
+    def test_producer_error_raised_at_same_rank(self):
+        def pages():
+            yield 1
+            yield 2
+            raise ValueError("page 3 illisible")
+
+        seen = []
+        with self.assertRaisesMessage(ValueError, "page 3 illisible"):
+            for page in prefetch(pages(), depth=2):
+                seen.append(page)
+        self.assertEqual(seen, [1, 2])
+
+    def test_pipelined_harvest_matches_sequential(self):
+        source = Source.objects.create(name="Portail", base_url=CKAN_URL)
+        with use_transport(InFlight(SyntheticPortal(packages=40, resources=1), latency=0.01)):
+            job = harvest_ckan(source, rows=10, max_pages=4, prefetch_depth=2)
+        self.assertEqual((job.status, job.created), (HarvestJob.S, 40))
+        self.assertEqual(list(Dataset.objects.order_by("ckan_id").values_list("ckan_id", flat=True)),
+                         [f"pkg-{i:08d}" for i in range(40)])
+
+
+class OrchestratorTests(TestCase):
+    def test_sources_harvested_in_parallel(self):
+        sources = [Source.objects.create(name=f"Portail {i}", base_url=f"https://p{i}.test/api/3/action")
+                   for i in range(4)]
+        jobs = {src.pk: HarvestJob.objects.create(source=src, query="", status=HarvestJob.S, created=i,
+                                                  ended_at=timezone.now())
+                for i, src in enumerate(sources)}
+        gate = threading.Barrier(3, timeout=5)  # 3 moissons doivent être en cours en même temps
+
+        def harvest(source, *args, **kwargs):
+            # pas d'écriture SQLite depuis les threads (base de test en mémoire partagée)
+            if source.name == "Portail 3":
+                raise RuntimeError("portail injoignable")
+            gate.wait()
+            return jobs[source.pk]
+
+        done = []
+        with mock.patch.object(orchestrator, "harvest_source", harvest):
+            result = harvest_sources(sources, workers=3, on_done=lambda src, job: done.append(src.name))
+        self.assertEqual(sorted(done), [src.name for src in sources])
+        failed = next(job for job in result if job.source_id == sources[3].pk)
+        self.assertEqual((failed.status, failed.error), (HarvestJob.F, "portail injoignable"))
+        totals = summarize(result)
+        self.assertEqual((totals["jobs"], totals["failed"], totals["created"]), (4, 1, 3))
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+        self.long_ago = timezone.now() - datetime.timedelta(hours=1)
+
+    def test_claim_once(self):
+        queued = jobs.enqueue(self.source, rows=5, max_pages=1)
+        job = jobs.claim_next("w1")
+        self.assertEqual((job.pk, job.status, job.worker, job.attempts), (queued.pk, HarvestJob.R, "w1", 1))
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertIsNone(jobs.claim_next("w2"))
+
+    def test_recover_stale_requeues_then_fails(self):
+        jobs.enqueue(self.source)
+        job = jobs.claim_next("w1")
+        self.assertEqual(jobs.recover_stale(), (0, 0))
+        HarvestJob.objects.filter(pk=job.pk).update(heartbeat_at=self.long_ago)
+        self.assertEqual(jobs.recover_stale(), (1, 0))
+        self.assertEqual(HarvestJob.objects.get(pk=job.pk).status, HarvestJob.P)
+
+        HarvestJob.objects.filter(pk=job.pk).update(status=HarvestJob.R, attempts=jobs.MAX_ATTEMPTS,
+                                                    heartbeat_at=self.long_ago)
+        self.assertEqual(jobs.recover_stale(), (0, 1))
+        self.assertEqual(HarvestJob.objects.get(pk=job.pk).status, HarvestJob.F)
+
+    def test_recover_stale_without_heartbeat_or_worker(self):
+        # job d'une commande harvest_* tuée, créé avant que begin n'enregistre de heartbeat
+        legacy = HarvestJob.objects.create(source=self.source, query="", status=HarvestJob.R)
+        HarvestJob.objects.filter(pk=legacy.pk).update(started_at=self.long_ago)
+        # job d'une commande tuée après quelques pages: heartbeat périmé, pas de worker
+        killed = HarvestJob.begin(self.source, query="")
+        HarvestJob.objects.filter(pk=killed.pk).update(heartbeat_at=self.long_ago)
+        self.assertEqual(jobs.recover_stale(), (0, 2))
+        self.assertFalse(HarvestJob.objects.filter(status__in=[HarvestJob.R, HarvestJob.P]).exists())
+
+    def test_heartbeat_survives_database_errors(self):
+        job = HarvestJob.begin(self.source, query="")
+        beats = []
+
+        def beat(self):
+            beats.append(self.pk)
+            if len(beats) == 1:
+                raise OperationalError("base verrouillée")
+
+        stop = threading.Event()
+        with mock.patch.object(HarvestJob, "beat", beat), self.assertLogs("harvest.services.jobs", "ERROR"):
+            thread = threading.Thread(target=jobs._heartbeat, args=(job, stop, 0.01))
+            thread.start()
+            deadline = time.monotonic() + 5
+            while len(beats) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            stop.set()
+            thread.join()
+        self.assertGreaterEqual(len(beats), 3)
+
+    def test_requeued_job_restarts_counters(self):
+        jobs.enqueue(self.source, rows=5, max_pages=1)
+        job = jobs.claim_next("w1")
+        HarvestJob.objects.filter(pk=job.pk).update(created=99, updated=7, error="ancien")
+        job.refresh_from_db()
+        with use_transport(SyntheticPortal(packages=5)):
+            job = jobs.run_job(job, heartbeat_interval=3600)
+        self.assertEqual((job.status, job.created, job.updated, job.error), (HarvestJob.S, 5, 0, ""))
+
+
+@override_settings(ALLOWED_HOSTS=["*"], STORAGES=TEST_STORAGES)
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()  # cache locmem partagé entre les tests
+        self.source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+        with use_transport(SyntheticPortal(packages=12, resources=2)):
+            harvest_ckan(self.source, rows=10, max_pages=2)
+        self.client.force_login(User.objects.create_user("lecteur", password="x"))
+
+    def test_cursor_pagination(self):
+        first = self.client.get("/api/datasets/?page_size=5").json()
+        self.assertEqual(len(first["results"]), 5)
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(second["results"][0]["id"], first["results"][-1]["id"] + 1)
+        last = self.client.get(self.client.get(second["next"]).json()["previous"]).json()
+        self.assertEqual(last["results"], second["results"])
+        self.assertEqual(len(self.client.get("/api/datasets/?page_size=10000").json()["results"]), 12)
+
+    def test_search_keeps_relevance_order(self):
+        body = self.client.get("/api/datasets/?search=synthetique&page_size=5").json()
+        self.assertEqual((body["count"], len(body["results"])), (12, 5))  # pages numérotées, pas de curseur
+        self.assertEqual(self.client.get("/api/datasets/?search=introuvable").json()["count"], 0)
+
+    def test_facets(self):
+        facets = self.client.get("/api/datasets/facets/").json()
+        self.assertEqual(set(facets), {"source", "org", "license", "format", "tag"})
+        self.assertEqual(facets["source"], [{"value": "Portail", "count": 12}])
+        top = facets["license"][0]
+        narrowed = self.client.get(f"/api/datasets/facets/?license={top['value']}").json()
+        self.assertEqual(narrowed["source"], [{"value": "Portail", "count": top["count"]}])
+        self.assertEqual(len(self.client.get("/api/datasets/facets/?limit=1").json()["tag"]), 1)
+
+    def test_unpaginated_actions_in_browsable_api(self):
+        self.assertEqual(self.client.get("/api/datasets/facets/?format=api").status_code, 200)
+        self.assertEqual(self.client.get("/api/datasets/?format=api").status_code, 200)
+
+    def test_date_filters_are_timezone_aware(self):
+        # SyntheticPortal: package i modifié le 2020-01-01 à 00:i
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", RuntimeWarning)  # pas de "received a naive datetime"
+            before = self.client.get("/api/datasets/?modified_before=2020-01-01T00:05:00").json()
+            after = self.client.get("/api/datasets/?modified_after=2020-01-01").json()
+        self.assertEqual(len(before["results"]), 5)
+        self.assertEqual(len(after["results"]), 12)
+        self.assertEqual(self.client.get("/api/datasets/?modified_after=hier").status_code, 400)
+
+    def test_harvest_invalidates_cached_list(self):
+        url = "/api/datasets/?page_size=500"
+        first = self.client.get(url)
+        self.assertEqual(len(first.json()["results"]), 12)
+        etag, modified = first["ETag"], first["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+        with self.assertNumQueries(2):  # session et utilisateur: la liste vient du cache
+            self.assertEqual(self.client.get(url).json(), first.json())
+
+        with use_transport(SyntheticPortal(packages=15, resources=2)):
+            harvest_ckan(self.source, rows=10, max_pages=2)
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(len(after.json()["results"]), 15)
+
+    def test_detail_cached_per_version(self):
+        pk = Dataset.objects.get(ckan_id="pkg-00000000").pk
+        self.assertEqual(self.client.get(f"/api/datasets/{pk}/").json()["title"], "Jeu de données synthétique 0")
+        Dataset.objects.filter(pk=pk).update(title="renommé")
+        self.assertEqual(self.client.get(f"/api/datasets/{pk}/").json()["title"], "Jeu de données synthétique 0")
+        # nouvelle version des données = fin d'un job plus récent
+        HarvestJob.objects.create(source=self.source, query="", status=HarvestJob.F,
+                                  ended_at=timezone.now() + datetime.timedelta(seconds=1))
+        bump_data_version()
+        self.assertEqual(self.client.get(f"/api/datasets/{pk}/").json()["title"], "renommé")
+
+    def test_graphql_errors_are_not_cached(self):
+        query = json.dumps({"query": "{ datasets(first: 1000) { edges { node { title } } } }"})
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            response = self.client.post("/graphql/", query, content_type="application/json")
+        self.assertIn("errors", response.json())
+        self.assertFalse([c for c in cache_set.call_args_list if "graphql" in c.args[0]])
+
+    def test_export(self):
+        response = self.client.get("/api/datasets/export/?format=ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 12)
+        record = json.loads(lines[0])
+        self.assertEqual((record["ckan_id"], record["source"], len(record["resources"])), ("pkg-00000000", "Portail", 2))
+
+        response = self.client.get("/api/datasets/export/?format=csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[0]["resource_count"], "2")
+
+        filtered = self.client.get("/api/datasets/export/?format=ndjson&modified_before=2020-01-01T00:03:00Z")
+        self.assertEqual(len(b"".join(filtered.streaming_content).splitlines()), 3)
+
+    @override_settings(SERVER_MODE="asgi")
+    async def test_export_asgi(self):
+        await self.async_client.aforce_login(await User.objects.aget(username="lecteur"))
+        response = await self.async_client.get("/api/datasets/export/?format=ndjson")
+        self.assertTrue(response.is_async)
+        streamed = b"".join([chunk async for chunk in response.streaming_content])
+        with self.settings(SERVER_MODE="wsgi"):
+            response = await sync_to_async(self.client.get)("/api/datasets/export/?format=ndjson")
+        self.assertFalse(response.is_async)
+        self.assertEqual(streamed, await sync_to_async(b"".join)(response.streaming_content))
+
+    def test_values_serializer_matches_drf(self):
+        Dataset.objects.filter(pk=Dataset.objects.first().pk).update(title="Qualité\u2028de l'eau \x01")
+        qs = Dataset.objects.order_by("id")
+        drf = DatasetSerializer(qs.select_related("source").prefetch_related("tags", "resources"), many=True).data
+        fast = serialize_dataset_rows(list(dataset_values(qs)))
+        self.assertEqual(fast, drf)
+        self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(drf))
+        self.assertIn(b"\\u2028", FastJSONRenderer().render(fast))
+
+        wanted = {"id", "tags", "last_modified"}
+        rows = serialize_dataset_rows(list(dataset_values(qs, wanted)), wanted)
+        self.assertEqual(rows[0], {k: drf[0][k] for k in ("id", "last_modified", "tags")})
+
+    def test_fields_projection(self):
+        rows = self.client.get("/api/datasets/?fields=id,title,tags&page_size=2").json()["results"]
+        self.assertEqual([list(row) for row in rows], [["id", "title", "tags"]] * 2)
+        detail = self.client.get(f"/api/datasets/{rows[0]['id']}/?fields=ckan_id").json()
+        self.assertEqual(detail, {"ckan_id": "pkg-00000000"})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name="Portail", base_url=CKAN_URL)
+        eau = Tag.objects.create(name="hydrologie")
+        self.titre = Dataset.objects.create(source=source, ckan_id="a", name="a", title="Qualité de l'eau potable")
+        self.notes = Dataset.objects.create(source=source, ckan_id="b", name="b", title="Réseau routier",
+                                            notes="Ponts au-dessus de l'eau")
+        self.tag = Dataset.objects.create(source=source, ckan_id="c", name="c", title="Bassins versants")
+        self.tag.tags.add(eau)
+        Dataset.objects.create(source=source, ckan_id="d", name="d", title="Cadastre")
+        update_search_index([self.titre.pk, self.notes.pk, self.tag.pk])
+
+    def search(self, text):
+        return list(search_datasets(Dataset.objects.all(), text).values_list("ckan_id", flat=True))
+
+    def test_ranked_title_before_notes(self):
+        self.assertEqual(self.search("eau"), ["a", "b"])
+
+    def test_accents_prefixes_and_tags(self):
+        self.assertEqual(self.search("qualite"), ["a"])
+        self.assertEqual(self.search("hydro"), ["c"])
+        self.assertEqual(self.search("eau potable"), ["a"])
+        self.assertEqual(self.search("\"); --"), [])
+
+    def test_index_follows_updates(self):
+        Dataset.objects.filter(pk=self.notes.pk).update(notes="")
+        update_search_index([self.notes.pk])
+        self.assertEqual(self.search("eau"), ["a"])
+
+
+class FilterTests(TestCase):
+    def test_parse_when(self):
+        utc = datetime.timezone.utc
+        self.assertEqual(parse_when("2020-01-31"), datetime.datetime(2020, 1, 31, tzinfo=utc))
+        self.assertEqual(parse_when("2020-01-31T10:00:00"), datetime.datetime(2020, 1, 31, 10, tzinfo=utc))
+        self.assertEqual(parse_when("2020-01-31T10:00:00-05:00"), datetime.datetime(2020, 1, 31, 15, tzinfo=utc))
+        for value in ("31/01/2020", "2020-02-30"):
+            with self.assertRaises(ValueError):
+                parse_when(value)
+
+
+@override_settings(ALLOWED_HOSTS=["*"])
+class GraphQLTests(TestCase):
+    PAGE = """query($after: String, $search: String) {
+        datasets(first: 4, after: $after, search: $search) {
+            edges { cursor node { ckanId tags { name } resources { format } } }
+            pageInfo { hasNextPage endCursor }
+        }
+    }"""
+
+    def setUp(self):
+        cache.clear()
+        source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+        with use_transport(SyntheticPortal(packages=10, resources=2)):
+            harvest_ckan(source, rows=10, max_pages=1)
+        self.client.force_login(User.objects.create_user("lecteur", password="x"))
+
+    def query(self, query, **variables):
+        return self.client.post("/graphql/", json.dumps({"query": query, "variables": variables}),
+                                content_type="application/json").json()
+
+    def test_pages_follow_the_cursor(self):
+        seen, after = [], None
+        while True:
+            page = self.query(self.PAGE, after=after)["data"]["datasets"]
+            seen += [edge["node"]["ckanId"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(seen, [f"pkg-{i:08d}" for i in range(10)])
+
+    def test_search_pages_by_offset(self):
+        first = self.query(self.PAGE, search="synthetique")["data"]["datasets"]
+        second = self.query(self.PAGE, search="synthetique", after=first["pageInfo"]["endCursor"])
+        self.assertEqual(len(second["data"]["datasets"]["edges"]), 4)
+
+    def test_cursor_of_another_kind_is_refused(self):
+        id_cursor = self.query(self.PAGE)["data"]["datasets"]["pageInfo"]["endCursor"]
+        offset_cursor = self.query(self.PAGE, search="synthetique")["data"]["datasets"]["pageInfo"]["endCursor"]
+        for body in (self.query(self.PAGE, search="synthetique", after=id_cursor),
+                     self.query(self.PAGE, after=offset_cursor),
+                     self.query(self.PAGE, after="pas-un-curseur")):
+            self.assertTrue(body["errors"][0]["message"].startswith("Curseur invalide"))
+
+    def test_nested_lists_batched(self):
+        with self.assertNumQueries(5):  # session, utilisateur, page, tags, ressources
+            body = self.query(self.PAGE)
+        self.assertEqual(len(body["data"]["datasets"]["edges"][0]["node"]["resources"]), 2)
+
+    def test_limits(self):
+        body = self.query("{ datasets(first: 1000) { edges { node { title } } } }")
+        self.assertIn("first doit être entre 0 et", body["errors"][0]["message"])
+        fields = "edges { node { resources { id name format url size lastModified linkStatus linkCheckedAt } } }"
+        nested = f"{{ a: datasets(first: 100) {{ {fields} }} b: datasets(first: 100) {{ {fields} }} }}"
+        self.assertIn("Requête trop coûteuse", self.query(nested)["errors"][0]["message"])
+
+
+class StatsSnapshotTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+        refresh_stats()
+
+    def harvest(self, portal, **opts):
+        with use_transport(portal):
+            return harvest_ckan(self.source, rows=10, **opts)
+
+    def assertSnapshotMatchesDatabase(self):
+        data = get_stats().data
+        self.assertEqual((data["total_datasets"], data["total_resources"], data["total_tags"]),
+                         (Dataset.objects.count(), Resource.objects.count(), Tag.objects.count()))
+        self.assertEqual(data["by_source"], [{"name": "Portail", "count": Dataset.objects.count()}])
+
+    def test_successful_job_adjusts_snapshot(self):
+        self.harvest(SyntheticPortal(packages=15, resources=2), max_pages=2)
+        self.assertSnapshotMatchesDatabase()
+        self.harvest(SyntheticPortal(packages=15, resources=3), max_pages=2)  # mises à jour seules
+        self.assertSnapshotMatchesDatabase()
+
+    def test_failed_job_still_counted(self):
+        with mock.patch.object(ckan_harvester, "_bulk_upsert_page",
+                               failing_on(2, ckan_harvester._bulk_upsert_page)):
+            job = self.harvest(SyntheticPortal(packages=30, resources=1), max_pages=3, prefetch_depth=0)
+        self.assertEqual((job.status, job.created), (HarvestJob.F, 10))
+        self.assertSnapshotMatchesDatabase()
+        self.assertEqual(get_stats().data["last_harvest"], job.ended_at.isoformat())
+
+    def test_stale_snapshot_recomputed(self):
+        Dataset.objects.create(source=self.source, ckan_id="hors-moisson", name="x")
+        self.assertEqual(get_stats().data["total_datasets"], 0)
+        self.assertEqual(get_stats(ttl=0).data["total_datasets"], 1)
+
+
+class ExportCommandTests(TestCase):
+    def test_chunked_export_to_file(self):
+        with use_transport(SyntheticPortal(packages=7, resources=1)):
+            harvest_ckan(Source.objects.create(name="Portail", base_url=CKAN_URL), rows=10, max_pages=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalogue.ndjson")
+            out = io.StringIO()
+            call_command("export_catalogue", "--chunk-size", "2", "--modified-after", "2020-01-01T00:02:00",
+                         "-o", path, stdout=out)
+            with open(path, encoding="utf-8") as f:
+                ids = [json.loads(line)["ckan_id"] for line in f]
+        self.assertEqual(ids, [f"pkg-{i:08d}" for i in range(2, 7)])
+        self.assertIn("5 datasets exportés (ndjson)", out.getvalue())
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name="Portail", base_url=CKAN_URL)
+        a = Dataset.objects.create(source=source, ckan_id="a", name="a", org="Ville",
+                                   last_modified=datetime.datetime(2024, 3, 5, tzinfo=datetime.timezone.utc))
+        b = Dataset.objects.create(source=source, ckan_id="b", name="b", org="Ville")
+        Resource.objects.bulk_create([
+            Resource(dataset=a, ckan_id="1", format="CSV", size=100),
+            Resource(dataset=a, ckan_id="2", format="JSON", size=50),
+            Resource(dataset=a, ckan_id="3", format="CSV"),
+            Resource(dataset=b, ckan_id="4", format="CSV", size=10),
+        ])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "analytics.sqlite3")
+        analytics.build_snapshot(self.path)
+
+    def test_cube_totals_match_database(self):
+        self.assertEqual(analytics.aggregate("dataset_cube", "datasets", by=["month"], order_by="month", path=self.path),
+                         [{"month": "", "datasets": 1}, {"month": "2024-03", "datasets": 1}])
+        rows = analytics.aggregate("resource_cube", ["resources", "datasets", "bytes", "sized"], by=["format"],
+                                   path=self.path)
+        self.assertEqual(rows, [{"format": "CSV", "resources": 3, "datasets": 2, "bytes": 110, "sized": 2},
+                                {"format": "JSON", "resources": 1, "datasets": 1, "bytes": 50, "sized": 1}])
+        self.assertIsNotNone(analytics.built_at(self.path))
+
+    def test_distinct_measure_needs_its_dimension(self):
+        with self.assertRaisesMessage(ValueError, "datasets ne s'additionne pas"):
+            analytics.aggregate("resource_cube", ["datasets"], by=["org"], path=self.path)
+        csv_only = analytics.aggregate("resource_cube", ["datasets"], by=["org"], where={"format": "CSV"},
+                                       path=self.path)
+        self.assertEqual(csv_only, [{"org": "Ville", "datasets": 2}])
+
+    def test_unknown_columns_refused(self):
+        with self.assertRaises(ValueError):
+            analytics.aggregate("dataset_cube", ["datasets"], by=["id; DROP TABLE meta"], path=self.path)
+        self.assertEqual(analytics.aggregate("dataset_cube", ["datasets"], path=os.devnull + ".absent"), [])
+
+
+class JsonStreamTests(TestCase):
+    DOC = {"success": True, "result": {"count": 3, "results": [
+        {"title": "a \"guillemet\" \\ et ]}, échappé\n", "size": -12345.678e-3},
+        [1, 2.5, None, True, {"x": "]"}],
+        "chaîne ☃",
+    ], "facets": {}}, "help": "fin"}
+
+    def parse(self, raw, size):
+        chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+        parser = StreamingArray(chunks, ("result", "results"))
+        return list(parser), parser.doc
+
+    def test_every_chunk_boundary(self):
+        raw = json.dumps(self.DOC, ensure_ascii=False).encode()
+        for size in (1, 2, 3, 7, 64, len(raw)):
+            items, doc = self.parse(raw, size)
+            self.assertEqual(items, self.DOC["result"]["results"], size)
+            self.assertEqual((doc["result"]["count"], doc["help"]), (3, "fin"))
+
+    def test_random_chunking(self):
+        rnd = random.Random(7)
+        doc = {"result": {"results": [{"n": rnd.uniform(-1e6, 1e6), "s": "é\"\\x" * rnd.randint(0, 50)}
+                                      for _ in range(200)]}}
+        raw = json.dumps(doc, ensure_ascii=False).encode()
+        cuts = sorted(rnd.sample(range(1, len(raw)), 400))
+        chunks = [raw[i:j] for i, j in zip([0] + cuts, cuts + [len(raw)])]
+        self.assertEqual(list(StreamingArray(chunks, ("result", "results"))), doc["result"]["results"])
+
+    def test_number_split_at_buffer_end(self):
+        items, _ = self.parse(b'{"result": {"results": [12345, -1.5e-7, 3]}}', 1)
+        self.assertEqual(items, [12345, -1.5e-7, 3])
+
+    def test_truncated_document(self):
+        for raw in (b'{"result": {"results": [1, 2', b'{"result": {"results": [{"a": "b', b'{"result": {"results": [-1.'):
+            with self.assertRaises(ValueError):
+                self.parse(raw, 3)
+
+
+@override_settings(ALLOWED_HOSTS=["*"])
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with use_transport(SyntheticPortal(packages=7, resources=2)):
+            harvest_ckan(Source.objects.create(name="Portail", base_url=CKAN_URL), rows=10, max_pages=1)
+        self.user = User.objects.create_user("lecteur", password="x")
+
+    async def test_same_json_as_drf_views(self):
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(self.client.force_login)(self.user)
+        page = (await self.async_client.get("/api/async/datasets/?page_size=3")).json()
+        drf = (await sync_to_async(self.client.get)("/api/datasets/?page_size=3")).json()
+        self.assertEqual(page["results"], drf["results"])
+        rest = (await self.async_client.get(page["next"])).json()
+        self.assertEqual([row["ckan_id"] for row in rest["results"]], ["pkg-00000003", "pkg-00000004", "pkg-00000005"])
+
+        pk = page["results"][0]["id"]
+        detail = (await self.async_client.get(f"/api/async/datasets/{pk}/?fields=id,tags")).json()
+        self.assertEqual(list(detail), ["id", "tags"])
+        self.assertEqual((await self.async_client.get("/api/async/datasets/999999/")).status_code, 404)
+
+    async def test_search_and_filters(self):
+        await self.async_client.aforce_login(self.user)
+        body = (await self.async_client.get("/api/async/datasets/?search=synthetique&page_size=5")).json()
+        self.assertEqual(len(body["results"]), 5)
+        self.assertIn("page=2", body["next"])
+        self.assertEqual((await self.async_client.get("/api/async/datasets/?modified_after=hier")).status_code, 400)
+
+    async def test_authentication_required(self):
+        response = await self.async_client.get("/api/async/datasets/")
+        self.assertEqual((response.status_code, response["WWW-Authenticate"]), (401, "Token"))
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        response = await self.async_client.get("/api/async/datasets/", headers={"Authorization": f"Token {token.key}"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Portail", base_url=CKAN_URL, api_path="/package_search")
+        with use_transport(SyntheticPortal(packages=20, resources=1)):
+            harvest_ckan(self.source, rows=10, full_sync=True)
+
+    def test_full_sync_deletes_withdrawn_datasets(self):
+        with use_transport(SyntheticPortal(packages=15, resources=1)):
+            job = harvest_ckan(self.source, rows=10, full_sync=True)
+        self.assertEqual((job.status, job.deleted), (HarvestJob.S, 5))
+        self.assertEqual(Dataset.objects.count(), 15)
+
+    def test_ratio_guard_keeps_everything(self):
+        with use_transport(SyntheticPortal(packages=5, resources=1)):
+            job = harvest_ckan(self.source, rows=10, full_sync=True)
+        self.assertEqual((job.status, job.deleted), (HarvestJob.S, 0))
+        self.assertIn("suppression annulée", job.error)
+        self.assertEqual(Dataset.objects.count(), 20)
+        with self.assertRaises(ReconcileAborted):
+            delete_orphan_datasets(self.source, ["pkg-00000000"])
+        self.assertEqual(delete_orphan_datasets(self.source, ["pkg-00000000"], max_ratio=1, dry_run=True), 19)
+
+
+class LinkCheckTests(TestCase):
+    def test_check_and_enrich(self):
+        source = Source.objects.create(name="Portail", base_url=CKAN_URL)
+        dataset = Dataset.objects.create(source=source, ckan_id="d", name="d")
+        Resource.objects.bulk_create(
+            [Resource(dataset=dataset, ckan_id=str(i), url=f"https://h{i % 3}.test/f{i}") for i in range(40)]
+            + [Resource(dataset=dataset, ckan_id="sans-url", url="")])
+        stats = async_to_sync(check_resources)(transport=httpx.MockTransport(SyntheticLinks()),
+                                               concurrency=8, per_host=2)
+        self.assertEqual(stats["checked"], 41)
+        self.assertEqual(stats["ok"] + stats["broken"], 40)
+        self.assertEqual(stats["errors"], 1)
+        self.assertFalse(Resource.objects.filter(link_checked_at__isnull=True).exists())
+        self.assertEqual(Resource.objects.filter(link_status=200, size__isnull=True).count(), 0)
+
+
+class OaiHarvestTests(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Dataverse", base_url=DATAVERSE_URL, api_path="/search")
+
+    def test_resume_after_failure_and_deleted_records(self):
+        portal = SyntheticPortal(packages=30, resources=2, oai_page=10, deleted={25})
+        with use_transport(portal):
+            with mock.patch.object(oai_harvester, "_bulk_upsert_page",
+                                   failing_on(2, oai_harvester._bulk_upsert_page)):
+                failed = harvest_oai(self.source, prefetch_depth=0)
+            self.assertEqual(failed.status, HarvestJob.F)
+            failed.refresh_from_db()
+            # la page en échec est annulée avec son jeton: la reprise repart après la 1re page
+            self.assertEqual((failed.checkpoint["token"], failed.checkpoint["done"]), ("oai_dc:10", 10))
+            self.assertEqual(Dataset.objects.count(), 10)
+
+            Dataset.objects.create(source=self.source, ckan_id="doi:10.5072/SYN/00000025", name="retiré")
+            job = harvest_oai(self.source, prefetch_depth=0)
+        self.assertEqual(job.status, HarvestJob.S)
+        self.assertEqual(job.checkpoint["resumed_from"], failed.pk)
+        self.assertEqual((job.created, job.deleted), (19, 1))
+        self.assertEqual(Dataset.objects.count(), 29)
+
+    def test_resume_after_ctrl_c(self):
+        with use_transport(SyntheticPortal(packages=30, oai_page=10)):
+            with self.assertRaises(KeyboardInterrupt), \
+                    mock.patch.object(oai_harvester, "_bulk_upsert_page",
+                                      failing_on(2, oai_harvester._bulk_upsert_page, KeyboardInterrupt())):
+                harvest_oai(self.source, prefetch_depth=0)
+            interrupted = HarvestJob.objects.get()
+            self.assertEqual((interrupted.status, interrupted.error), (HarvestJob.F, "Interrompu (KeyboardInterrupt)"))
+            self.assertIsNotNone(interrupted.ended_at)
+            self.assertEqual(interrupted.checkpoint["token"], "oai_dc:10")
+
+            job = harvest_oai(self.source, prefetch_depth=0)
+        self.assertEqual((job.status, job.checkpoint["resumed_from"], job.created), (HarvestJob.S, interrupted.pk, 20))
+
+    def test_bad_resumption_token_restarts_from_scratch(self):
+        HarvestJob.objects.create(
+            source=self.source, query="", status=HarvestJob.F, ended_at=timezone.now(),
+            checkpoint={"mode": "oai", "token": "oai_dc:expiré", "done": 10, "response_date": None,
+                        "window": {"prefix": "oai_dc", "set": None, "from": None, "until": None}})
+        with use_transport(SyntheticPortal(packages=15, oai_page=10)):
+            job = harvest_oai(self.source)
+            self.assertEqual(job.status, HarvestJob.F)
+            self.assertIn("badResumptionToken", job.error)
+            self.assertIsNone(job.checkpoint["token"])
+            job = harvest_oai(self.source)
+        self.assertEqual((job.status, job.created), (HarvestJob.S, 15))
+        self.assertNotIn("resumed_from", job.checkpoint)
+
+    def test_overlong_identifier_is_skipped(self):
+        package = oai_harvester._package
+
+        def long_id(identifier, datestamp, metadata):
+            pkg = package(identifier, datestamp, metadata)
+            return dict(pkg, id="x" * 300) if identifier.endswith("4") else pkg
+
+        with use_transport(SyntheticPortal(packages=10, oai_page=10)), \
+                mock.patch.object(oai_harvester, "_package", long_id):
+            job = harvest_oai(self.source)
+        self.assertEqual((job.status, job.created), (HarvestJob.S, 9))
+        self.assertIn("1 enregistrements ignorés", job.error)
+
+    def test_dataverse_keeps_oai_links_and_marks_stay_separate(self):
+        with use_transport(SyntheticPortal(packages=5, resources=2, oai_page=10)):
+            harvest_dataverse(self.source, per_page=10, max_pages=1, incremental=True)
+            harvest_oai(self.source, incremental=True)
+            links = Resource.objects.filter(url__startswith="https://").count()
+            self.assertEqual(links, 10)
+            job = harvest_dataverse(self.source, per_page=10, max_pages=1)
+        self.assertEqual(job.status, HarvestJob.S)
+        self.assertEqual(Resource.objects.filter(url__startswith="https://").count(), links)
+        self.assertFalse(Dataset.objects.exclude(fingerprint="").exists())
+        self.assertEqual(self.source.last_high_water_mark("dataverse"),
+                         datetime.datetime(2020, 1, 1, 0, 4, tzinfo=datetime.timezone.utc))
+        self.assertNotEqual(self.source.last_high_water_mark("oai"), self.source.last_high_water_mark("dataverse"))
@@ -1,12 +1,77 @@
 from django.shortcuts import render
 
 # Create your views here.
-from rest_framework import viewsets, filters
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from .cache import CachedReadMixin
+from .export import CONTENT_TYPES, CSVRenderer, NDJSONRenderer, astream, stream
+from .filters import DatasetFacetFilter, DatasetSearchFilter, facet_counts, FACET_LIMIT
 from .models import Dataset
-from .serializers import DatasetSerializer
+from .pagination import DatasetCursorPagination, DatasetSearchPagination
+from .serializers import DatasetSerializer, dataset_values, requested_fields, serialize_dataset_rows
 
-class DatasetViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Dataset.objects.select_related("source").prefetch_related("tags","resources").all()
+class DatasetViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Dataset.objects.all()
     serializer_class = DatasetSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ["title", "org", "tags__name"]
+    pagination_class = DatasetCursorPagination
+    filter_backends = [DatasetFacetFilter, DatasetSearchFilter]
+
+    @property
+    def paginator(self):
+        # la pagination par curseur impose l'ordre par id: ?search= garde l'ordre de pertinence
+        # actions sans pagination (facets, export: pagination_class=None) -> None
+        if not hasattr(self, "_paginator"):
+            if self.pagination_class is None:
+                self._paginator = None
+            else:
+                searching = self.request is not None and self.request.query_params.get("search")
+                self._paginator = DatasetSearchPagination() if searching else self.pagination_class()
+        return self._paginator
+
+    # lecture rapide: .values() + serialize_dataset_rows, même JSON que DatasetSerializer
+    def list(self, request, *args, **kwargs):
+        return self._cached(self._list, request)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(self._retrieve, request, *args, **kwargs)
+
+    def _list(self, request):
+        wanted = requested_fields(request)
+        page = self.paginate_queryset(dataset_values(self.filter_queryset(Dataset.objects.all()), wanted))
+        return self.get_paginated_response(serialize_dataset_rows(page, wanted))
+
+    def _retrieve(self, request, pk=None):
+        wanted = requested_fields(request)
+        row = get_object_or_404(dataset_values(Dataset.objects.all(), wanted), pk=pk)
+        return Response(serialize_dataset_rows([row], wanted)[0])
+
+    @action(detail=False, pagination_class=None)
+    def facets(self, request):
+        """Top-N par facette (source, org, license, format, tag) pour les filtres/recherche courants; ?limit=10."""
+        return self._cached(self._facets, request)
+
+    def _facets(self, request):
+        try:
+            limit = min(max(int(request.query_params.get("limit", FACET_LIMIT)), 1), 100)
+        except ValueError:
+            limit = FACET_LIMIT
+        qs = self.filter_queryset(Dataset.objects.all())
+        return Response(facet_counts(qs, limit))
+
+    @action(detail=False, pagination_class=None, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Catalogue complet en flux (?format=ndjson|csv), avec les mêmes filtres/recherche que la liste."""
+        fmt = request.accepted_renderer.format
+        qs = self.filter_queryset(Dataset.objects.all())
+        if not request.query_params.get("search"):
+            qs = qs.order_by("id")
+        # workers uvicorn (SERVER_MODE=asgi): itérateur async, sinon Django consommerait
+        # tout le flux avant de l'envoyer
+        lines = astream(qs, fmt) if settings.SERVER_MODE == "asgi" else stream(qs, fmt)
+        response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = f'attachment; filename="datasets.{fmt}"'
+        return response
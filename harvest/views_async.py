@@ -0,0 +1,116 @@
+# harvest/views_async.py
+"""
+Vues de lecture async: /api/async/datasets/ et /api/async/datasets/<id>/.
+En mode ASGI (gunicorn.conf.py), une requête lente n'occupe pas de thread:
+le worker continue de servir les autres pendant les accès DB (aiterator/aget).
+Mêmes filtres (?search=, facettes), ?fields=, lecture rapide (.values() +
+serialize_dataset_rows, même JSON que DatasetSerializer) et cache que l'API DRF;
+pagination par ?after=<id> (keyset), ou ?page= avec ?search= (ordre de pertinence).
+Authentification: session ou en-tête "Authorization: Token <clé>".
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.authtoken.models import Token
+from .cache import amake_key, timeout
+from .filters import filter_datasets, filter_params
+from .models import Dataset
+from .pagination import DatasetCursorPagination
+from .search import search_datasets
+from .serializers import dataset_values, requested_fields, serialize_dataset_rows
+
+PAGE_SIZE = DatasetCursorPagination.page_size
+MAX_PAGE_SIZE = DatasetCursorPagination.max_page_size
+
+
+async def _user(request):
+    scheme, _, key = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "token" and key.strip():
+        token = await Token.objects.select_related("user").filter(key=key.strip()).afirst()
+        return token.user if token and token.user.is_active else None
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+def _unauthorized():
+    response = JsonResponse({"detail": "Informations d'authentification non fournies."}, status=401)
+    response["WWW-Authenticate"] = "Token"
+    return response
+
+
+def _int(value, default, low, high):
+    try:
+        return min(max(int(value), low), high)
+    except (TypeError, ValueError):
+        return default
+
+
+def _url(request, **changes):
+    params = request.GET.copy()
+    for name, value in changes.items():
+        params[name] = value
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+async def _serialize(qs, wanted):
+    """Lignes de dataset_values(); tags/ressources lus par serialize_dataset_rows (thread sync)."""
+    rows = [row async for row in qs.aiterator(chunk_size=MAX_PAGE_SIZE + 1)]
+    return rows, await sync_to_async(serialize_dataset_rows)(rows, wanted)
+
+
+async def _cached(request, build):
+    """Payload JSON en cache (clé = chemin + paramètres + version des données)."""
+    key = await amake_key("async", request.path, sorted(request.GET.lists()))
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = await build()
+        await cache.aset(key, payload, timeout())
+    return JsonResponse(payload)
+
+
+async def dataset_list(request):
+    if await _user(request) is None:
+        return _unauthorized()
+    try:
+        filters = filter_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    async def build():
+        size = _int(request.GET.get("page_size"), PAGE_SIZE, 1, MAX_PAGE_SIZE)
+        wanted = requested_fields(request)
+        qs = filter_datasets(Dataset.objects.all(), **filters)
+        text = request.GET.get("search", "").strip()
+        if text:
+            page = _int(request.GET.get("page"), 1, 1, 10**6)
+            qs = dataset_values(search_datasets(qs, text), wanted)
+            rows, data = await _serialize(qs[(page - 1) * size:page * size + 1], wanted)
+            return {
+                "next": _url(request, page=page + 1) if len(rows) > size else None,
+                "previous": _url(request, page=page - 1) if page > 1 else None,
+                "results": data[:size],
+            }
+        after = _int(request.GET.get("after"), 0, 0, 2**63 - 1)
+        qs = dataset_values(qs.filter(id__gt=after).order_by("id"), wanted)
+        rows, data = await _serialize(qs[:size + 1], wanted)
+        return {
+            "next": _url(request, after=rows[size - 1]["id"]) if len(rows) > size else None,
+            "results": data[:size],
+        }
+
+    return await _cached(request, build)
+
+
+async def dataset_detail(request, pk):
+    if await _user(request) is None:
+        return _unauthorized()
+
+    async def build():
+        wanted = requested_fields(request)
+        row = await dataset_values(Dataset.objects.all(), wanted).aget(pk=pk)
+        return (await sync_to_async(serialize_dataset_rows)([row], wanted))[0]
+
+    try:
+        return await _cached(request, build)
+    except Dataset.DoesNotExist:
+        return JsonResponse({"detail": "Pas trouvé."}, status=404)
@@ -1,39 +1,57 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Max
-from .models import Dataset, Resource, Tag, HarvestJob
+from django.utils.dateparse import parse_datetime
+from . import analytics
+from .stats import get_stats
 
-@login_required
-def stats_view(request):
-    total_datasets = Dataset.objects.count()
-    total_resources = Resource.objects.count()
-    total_tags = Tag.objects.count()
-    last_harvest = HarvestJob.objects.aggregate(Max("ended_at"))["ended_at__max"]
-
-    # Répartition par source (affichage avec barres par source OK)
-    by_source = (
-        Dataset.objects.values("source__name")
-        .annotate(count=Count("id"))
-        .order_by("-count")
-    )
-    max_source = max([x["count"] for x in by_source], default=1)
-    by_source_rows = []
-    for item in by_source:
-        name = item["source__name"] or "Inconnue"
-        count = item["count"]
-        pct_of_max = round((count / max_source) * 100) if max_source else 0
-        by_source_rows.append({
-            "name": name,
-            "count": count,
+def _bar_rows(items):
+    # barres proportionnelles au max de la série
+    max_count = max([x["count"] for x in items], default=1)
+    rows = []
+    for item in items:
+        pct_of_max = round((item["count"] / max_count) * 100) if max_count else 0
+        rows.append({
+            "name": item["name"],
+            "count": item["count"],
             "pct": pct_of_max,
             "style": f"width: {pct_of_max}%"
         })
+    return rows
+
+def _formats_by_org(top=10, formats=5):
+    # org x format depuis l'instantané analytique: les `top` orgs ayant le plus de ressources
+    orgs = {}
+    for row in analytics.aggregate("resource_cube", ["resources"], by=["org", "format"]):
+        org = orgs.setdefault(row["org"] or "Inconnue", {"name": row["org"] or "Inconnue", "count": 0, "formats": []})
+        org["count"] += row["resources"]
+        if row["format"] and len(org["formats"]) < formats:
+            org["formats"].append({"name": row["format"], "count": row["resources"]})
+    return sorted(orgs.values(), key=lambda o: -o["count"])[:top]
+
+@login_required
+def stats_view(request):
+    # lecture O(1) de l'instantané (recalculé par les moissonnages / après HARVEST_STATS_TTL)
+    snap = get_stats()
+    data = snap.data
+    last_harvest = data.get("last_harvest")
 
     context = {
-        "total_datasets": total_datasets,
-        "total_resources": total_resources,
-        "total_tags": total_tags,
-        "last_harvest": last_harvest,
-        "by_source_rows": by_source_rows,
+        "total_datasets": data.get("total_datasets", 0),
+        "total_resources": data.get("total_resources", 0),
+        "total_tags": data.get("total_tags", 0),
+        "last_harvest": parse_datetime(last_harvest) if last_harvest else None,
+        "by_source_rows": _bar_rows(data.get("by_source", [])),
+        "by_format_rows": _bar_rows(data.get("by_format", [])),
+        "by_license_rows": _bar_rows(data.get("by_license", [])),
+        "by_month_rows": _bar_rows(data.get("by_month", [])),
+        "top_tags": data.get("top_tags", []),
+        "computed_at": snap.computed_at,
+        # instantané analytique (build_analytics_snapshot): rien si pas encore construit
+        "analytics_built_at": parse_datetime(analytics.built_at() or ""),
+        "bytes_by_source_rows": _bar_rows([
+            {"name": r["source"], "count": r["bytes"]}
+            for r in analytics.aggregate("resource_cube", ["bytes"], by=["source"])
+        ]),
+        "formats_by_org": _formats_by_org(),
     }
     return render(request, "harvest/stats.html", context)
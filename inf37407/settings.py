@@ -51,6 +51,10 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "harvest.renderers.FastJSONRenderer",  # orjson, même sortie que JSONRenderer
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 SWAGGER_SETTINGS = {
     "USE_SESSION_AUTH": False,  # on n’utilise pas le login de session
@@ -93,16 +97,47 @@ TEMPLATES = [{
 WSGI_APPLICATION = 'inf37407.wsgi.application'
 
 
+# Mode de service (gunicorn.conf.py): wsgi (workers gthread, défaut) | asgi (workers uvicorn)
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 # DB: Render Postgres si DATABASE_URL est présent, sinon SQLite local
+# connexions persistantes (10 min) en WSGI; en ASGI (optionnel) chaque requête a son propre
+# thread sync: une connexion persistante n'y serait jamais réutilisée, donc pas de persistance
 DATABASES = {
     "default": dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600,
+        conn_max_age=0 if SERVER_MODE == "asgi" else 600,
         ssl_require=False
     )
 }
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # SQLite local: harvest_all écrit depuis plusieurs threads -> attendre le verrou au lieu d'échouer
+    DATABASES["default"].setdefault("OPTIONS", {}).update({"timeout": 20, "transaction_mode": "IMMEDIATE"})
+
+
+# Cache des API de lecture (invalidé à chaque moissonnage, voir harvest/cache.py)
+# DJANGO_CACHE: locmem (défaut) | redis (REDIS_URL) | file (DJANGO_CACHE_DIR) | dummy
+_cache_backend = os.getenv("DJANGO_CACHE", "locmem").lower()
+if _cache_backend == "redis":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache",
+                          "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379/0")}}
+elif _cache_backend == "file":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                          "LOCATION": os.getenv("DJANGO_CACHE_DIR", str(BASE_DIR / ".cache"))}}
+elif _cache_backend == "dummy":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                          "LOCATION": "harvest", "OPTIONS": {"MAX_ENTRIES": 5000}}}
+HARVEST_CACHE_TIMEOUT = int(os.getenv("HARVEST_CACHE_TIMEOUT", "600"))
+
+# Statistiques /stats/: âge max (secondes) de l'instantané avant recalcul complet
+HARVEST_STATS_TTL = int(os.getenv("HARVEST_STATS_TTL", "3600"))
+
+# Instantané analytique (commande build_analytics_snapshot, voir harvest/analytics.py)
+HARVEST_ANALYTICS_PATH = os.getenv("HARVEST_ANALYTICS_PATH", str(BASE_DIR / "analytics.sqlite3"))
 
 
 # Password validation
@@ -21,12 +21,14 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from harvest.views import DatasetViewSet
+from harvest import views_async
 from harvest.views_stats import stats_view
 from harvest.views_home import home_view
 # GraphQL
-from graphene_django.views import GraphQLView
+from harvest.cache import CachedGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 from harvest.schema import schema
+from harvest.graphql_validation import VALIDATION_RULES
 from django.contrib.auth.decorators import login_required
 
 
@@ -47,6 +49,8 @@ urlpatterns = [
     path("", home_view, name="home"),
     path("stats/", stats_view, name="stats"),
     path("admin/", admin.site.urls),
+    path("api/async/datasets/", views_async.dataset_list, name="async-dataset-list"),
+    path("api/async/datasets/<int:pk>/", views_async.dataset_detail, name="async-dataset-detail"),
     path("api/", include(router.urls)),
     path("swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
     path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
@@ -54,7 +58,7 @@ urlpatterns = [
     "graphql/",
     login_required(
         csrf_exempt(
-            GraphQLView.as_view(schema=schema, graphiql=True)
+            CachedGraphQLView.as_view(schema=schema, graphiql=True, validation_rules=VALIDATION_RULES)
         )
     ),
 ),